@@ -1,25 +1,55 @@
 ﻿# -*- coding: utf-8 -*-
 import os
+import logging
 from urllib.parse import quote
 import json
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, has_request_context, jsonify, request
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from web3 import Web3
+from web3.exceptions import TransactionNotFound
 from dotenv import load_dotenv
 import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import click
 import time
+import re
 import requests
 from datetime import datetime, timezone
-from sqlalchemy import func, cast, Numeric
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import func, cast, inspect, select, text, update
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.types import TypeDecorator, String
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import urllib.parse
+from snapshot_cache import SnapshotCache
+from event_stream import EventBroker, format_sse
+from price_service import DEFAULT_SOURCES as PRICE_SOURCES, PriceService
+from contract_state import ContractStateReader
+from log_decoder import EventDecoder
+from upstream import UpstreamRegistry, Backoff, budget_middleware, is_rate_limited
+from poll_scheduler import PollScheduler
+import db_config
+from leader import LeaderLock
+from dedup_window import RecentVoteWindow
+from leaderboard import Leaderboard
+from vote_flow import VoteFlow
+from odds import OddsTable, payout_wei
+from settlement import settle, settle_entry, verify
+from log_config import configure_logging
+from metrics import MetricsRegistry
 
 # --- 1. 初始化与配置 ---
 
 # 加载环境变量
 load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
 steamdt_api_key = os.getenv("STEAMDT_API_KEY")
 ETHERSCAN_API_KEY = os.getenv("ETHERSCAN_API_KEY")
+# 根据官方文档: https://docs.etherscan.io/api-reference/endpoint/getlogs
+ETHERSCAN_API_URL = os.getenv("ETHERSCAN_API_URL", "https://api.etherscan.io/v2/api")
 RPC_URL = os.getenv("RPC_URL")
 CONTRACT_ADDRESS = os.getenv("CONTRACT_ADDRESS")
 
@@ -33,33 +63,211 @@ CORS(app, resources={
     }
 })
 
-# 配置 SQLite 数据库
-db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'fan_consensus.db')
+# 配置 SQLite 数据库 (DATABASE_PATH 可指向其他文件, 如基准测试的临时库)
+db_path = os.getenv("DATABASE_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'fan_consensus.db')
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_config.engine_options()
 db = SQLAlchemy(app)
 
-# Web3 配置
+# 读写分离: db.session 只用于写 (单写者, BEGIN IMMEDIATE), 请求路径和快照构建用只读的 ReadSession
+with app.app_context():
+    db_config.configure_write_engine(db.engine)
+read_engine = db_config.create_read_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+ReadSession = sessionmaker(bind=read_engine)
+
+# /metrics: 每个 worker 定期把样本写到 instance/metrics/<pid>.json, 抓取时合并全部 worker
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics'))
+METRICS_DUMP_INTERVAL = int(os.getenv("METRICS_DUMP_INTERVAL", "15"))
+metrics = MetricsRegistry(METRICS_DIR)
+http_request_seconds = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("endpoint", "method", "status")
+)
+http_request_db_queries = metrics.histogram(
+    "http_request_db_queries", "Database statements executed per HTTP request", ("endpoint",),
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100),
+)
+db_queries_total = metrics.counter("db_queries_total", "Database statements executed", ("engine",))
+upstream_call_seconds = metrics.histogram("upstream_call_duration_seconds", "Upstream call latency", ("upstream",))
+upstream_errors_total = metrics.counter("upstream_errors_total", "Upstream call errors", ("upstream", "kind"))
+upstream_throttle_seconds = metrics.counter(
+    "upstream_throttle_wait_seconds_total", "Time spent waiting for upstream call budget", ("upstream",)
+)
+snapshot_requests_total = metrics.counter(
+    "snapshot_requests_total", "Snapshot endpoint requests by cache result", ("snapshot", "result")
+)
+snapshot_rebuilds_total = metrics.counter("snapshot_rebuilds_total", "Snapshots rebuilt with changed content", ("snapshot",))
+vote_dedup_lookups_total = metrics.counter(
+    "vote_dedup_lookups_total", "Vote dedup checks by where they were answered", ("source",)
+)
+votes_ingested_total = metrics.counter("votes_ingested_total", "Votes written to the database", ("source",))
+chain_head_gauge = metrics.gauge("chain_head_block", "Latest chain head seen by the log indexer", merge="max")
+indexed_block_gauge = metrics.gauge("log_indexer_block", "Last confirmed block indexed", merge="max")
+indexer_lag_gauge = metrics.gauge("log_indexer_lag_blocks", "Chain head minus the last indexed block", merge="max")
+
+def record_upstream_call(name, seconds, waited):
+    upstream_call_seconds.observe(seconds, upstream=name)
+    if waited:
+        upstream_throttle_seconds.inc(waited, upstream=name)
+
+def record_upstream_error(name, rate_limited):
+    upstream_errors_total.inc(upstream=name, kind="rate_limited" if rate_limited else "error")
+
+def count_db_queries(engine_name):
+    """SQLAlchemy before_cursor_execute 监听器: 计入全局计数和当前请求的查询数"""
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        db_queries_total.inc(engine=engine_name)
+        if has_request_context():
+            g.db_queries = g.get("db_queries", 0) + 1
+    return before_cursor_execute
+
+with app.app_context():
+    sa_event.listen(db.engine, "before_cursor_execute", count_db_queries("write"))
+sa_event.listen(read_engine, "before_cursor_execute", count_db_queries("read"))
+
+# 上游调用预算: 每个上游一个令牌桶 (每秒调用数), 调用次数/错误/限流计入 /api/upstreams 和 /metrics
+upstreams = UpstreamRegistry(on_call=record_upstream_call, on_error=record_upstream_error)
+rpc_budget = upstreams.get("rpc", float(os.getenv("RPC_RATE_LIMIT", "10")))
+etherscan_budget = upstreams.get("etherscan", float(os.getenv("ETHERSCAN_RATE_LIMIT", "4")))  # 免费档上限 5 次/秒
+ETHERSCAN_MAX_RETRIES = 4  # 出错/被限流时的重试次数 (指数退避)
+SETTLEMENT_RETRY_INTERVAL = 60  # 回填或结算失败后, 至少间隔这么久 (秒) 才重试结算
+
+# Web3 配置 (每个 JSON-RPC 调用都经过 rpc 预算)
 web3 = Web3(Web3.HTTPProvider(RPC_URL))
+web3.middleware_onion.add(budget_middleware(rpc_budget), "upstream_budget")
 with open(os.path.join(os.path.dirname(__file__), 'abi.json'), 'r') as f:
     CONTRACT_ABI = json.load(f)
 contract = web3.eth.contract(address=Web3.to_checksum_address(CONTRACT_ADDRESS), abi=CONTRACT_ABI)
+# 最新的 FINALITY_DEPTH 个区块可能被重组: 其中的投票只进入待确认缓冲, 合约状态也读取已确认的区块
+FINALITY_DEPTH = int(os.getenv("FINALITY_DEPTH", "12"))
+contract_reader = ContractStateReader(web3, contract, FINALITY_DEPTH)
+last_contract_state = None  # 上次成功写入数据库的合约状态
 
+# 日志索引器关注的合约事件, 导入时从 abi.json 编译一次 topic0 -> 解码器映射
+INDEXED_EVENTS = ("NewVote", "GameStatusChanged", "WinnerSelected", "Refunded", "PrizeWithdrawn")
+event_decoder = EventDecoder(CONTRACT_ABI, INDEXED_EVENTS)
+NEW_VOTE_EVENT_TOPIC = event_decoder.topic_by_event["NewVote"]
 
-VOTE_METHOD_ID = "0x0121b93f" 
-NEW_VOTE_EVENT_TOPIC = "0x7a5b3252a1a5b2812a8323a1a6b0853509e4f5a3e14ea839f408b0c498a442a9" 
+# 日志索引器配置
+LOG_INDEXER_CHECKPOINT = "log_indexer"
+LOG_INDEXER_START_BLOCK = os.getenv("LOG_INDEXER_START_BLOCK")  # 首次启动时的起始区块, 默认从链头开始
+LOG_BLOCK_RANGE = int(os.getenv("LOG_BLOCK_RANGE", "2000"))  # 每次 eth_getLogs 查询的最大区块跨度
+LOG_POLL_INTERVAL = float(os.getenv("LOG_POLL_INTERVAL", "5"))  # 追上链头后、没有新投票时的轮询间隔 (秒)
+LOG_POLL_ACTIVE_INTERVAL = float(os.getenv("LOG_POLL_ACTIVE_INTERVAL", "2"))  # 投票活跃时的最短轮询间隔 (秒)
+LOG_POLL_IDLE_INTERVAL = float(os.getenv("LOG_POLL_IDLE_INTERVAL", "300"))  # 游戏结束后的轮询间隔 (秒)
+LOG_POLL_MAX_BACKOFF = float(os.getenv("LOG_POLL_MAX_BACKOFF", "300"))  # 出错时退避的上限 (秒)
+log_poll_scheduler = PollScheduler(LOG_POLL_ACTIVE_INTERVAL, LOG_POLL_INTERVAL, LOG_POLL_IDLE_INTERVAL, LOG_POLL_MAX_BACKOFF)
+DEDUP_WINDOW_BLOCKS = int(os.getenv("DEDUP_WINDOW_BLOCKS", "128"))  # 检查点之前保留在去重窗口里的区块数
+recent_votes = RecentVoteWindow(DEDUP_WINDOW_BLOCKS)
+# 由 UserVote 派生的内存索引, 按 UserVote.id 水位增量同步 (leader 在入库提交后, follower 在 stats 快照变化后)
+VOTE_INDEX_CHUNK_SIZE = 5000  # 读取投票时每批的行数, 每批之后让出一次 (gevent 下切换到其他 greenlet)
+VOTE_INDEX_YIELD_SECONDS = 0.001  # gevent 的 sleep(0) 只切换到已就绪的 greenlet, 不处理 I/O 和定时器
+REBUILD_WRITE_BATCH_SIZE = 2000  # 重算汇总/结算时每个写事务的行数, 事务之间让出
+# 支持者排行榜: 按累计投入的有序索引
+leaderboard = Leaderboard()
+LEADERBOARD_PAGE_SIZE = 50
+LEADERBOARD_MAX_PAGE_SIZE = 500
+# 投票流量: 各战队按分钟/小时/天分桶的投票数和投入
+vote_flow = VoteFlow(minute_buckets=int(os.getenv("VOTE_FLOW_MINUTE_BUCKETS", "1440")))
+VOTE_FLOW_POINTS = 200  # 默认最多返回的桶数
+VOTE_FLOW_MAX_POINTS = 2000
+GWEI_PER_ETH = 10 ** 9
+# /api/odds: (游戏状态, 赔率表), 在 odds 快照重建时更新
+current_odds = None
+ODDS_MAX_AMOUNTS = 100
+WEI_PER_ETH = 10 ** 18
+
+# /api/record_vote 异步入库配置
+VOTE_REFRESH_INTERVAL = float(os.getenv("VOTE_REFRESH_INTERVAL", "2"))  # 合并后的统计刷新最小间隔 (秒)
+VOTE_RECEIPT_RETRY = 3  # 交易尚未上链时的重试间隔 (秒)
+VOTE_RECEIPT_TIMEOUT = 600  # 提交后超过该时间仍未上链则放弃 (秒)
+VOTE_POLL_INTERVAL = 1  # leader 轮询待校验交易的间隔 (秒)
+VOTE_QUEUE_MAX_SIZE = 10000  # 待校验交易的上限, 超过后 /api/record_vote 返回 503
+TX_HASH_PATTERN = re.compile(r"0x[0-9a-f]{64}")
+ADDRESS_PATTERN = re.compile(r"0x[0-9a-f]{40}")
+
+# POST /api/voting_history 批量查询配置
+HISTORY_BATCH_MAX_ADDRESSES = int(os.getenv("HISTORY_BATCH_MAX_ADDRESSES", "10000"))  # 单次请求的地址上限
+HISTORY_BATCH_CHUNK_SIZE = 500  # 每条 IN 查询的地址数, 也是流式输出的批大小
+
+# 历史回填配置
+BACKFILL_CHECKPOINT = "etherscan_backfill"
+ETHERSCAN_PAGE_SIZE = int(os.getenv("ETHERSCAN_PAGE_SIZE", "1000"))  # Etherscan logs API 每页条数
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "500"))  # 每条多行 INSERT 的行数
+
+# 跨 worker 的同步 leader: 只有持有文件锁的进程运行同步, 其余 worker 只读
+sync_leader = LeaderLock(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'sync.lock'))
+LEADER_RETRY_INTERVAL = 5  # follower 尝试接管的间隔 (秒)
+LEADER_HEARTBEAT_INTERVAL = 5  # leader 写入心跳的间隔 (秒)
+SNAPSHOT_POLL_INTERVAL = 1  # follower 轮询快照版本号的间隔 (秒)
+SHARED_SNAPSHOTS = ("stats", "status", "teams")  # 由 leader 的同步触发、需要通知其他 worker 的快照
+known_snapshot_versions = {}
 
 # 全局状态变量
 threads_started = False
-bg_thread_semaphore = threading.Semaphore(1)
+MAX_BACKGROUND_THREADS = 9  # 选举/快照轮询 + 启动同步 + 日志索引器 + 投票校验 + 心跳 + 价格刷新 + 武器价格 + 指标写出 + 预留
+
+# 启动阶段状态, 由 /ready 报告
+startup_state = {"phase": "not_started", "ready": False, "started_at": time.time(), "ready_at": None}
+bg_thread_semaphore = threading.Semaphore(MAX_BACKGROUND_THREADS)
 bg_running_count = 0
 bg_count_lock = threading.Lock()
+contract_state_lock = threading.Lock()  # 串行化合约状态的比较和写入, 保证只前进不后退
+settlement_lock = threading.Lock()  # 索引器、投票校验和启动同步都可能触发结算, 同一时间只运行一次
+settlement_retry_at = 0.0  # 上次回填或结算失败后, 下一次允许重试的 time.monotonic()
 
 # 游戏状态枚举映射 (新增 Refunding)
 GAME_STATUS_MAP = {0: "Open", 1: "Stopped", 2: "Finished", 3: "Refunding"}
+GAME_TERMINAL_STATUSES = (2, 3)  # 合约不会再有新投票
+
+# 只读接口的预序列化快照 (/api/teams, /api/status, /api/stats)
+snapshots = SnapshotCache()
+
+# /api/stream 推送通道: 快照一旦变化就推送给所有连接
+STREAM_HEARTBEAT_INTERVAL = int(os.getenv("STREAM_HEARTBEAT_INTERVAL", "15"))
+event_broker = EventBroker()
+snapshots.add_listener(lambda name, snapshot: event_broker.publish(name, snapshot.body, snapshot.etag))
+snapshots.add_listener(lambda name, snapshot: snapshot_rebuilds_total.inc(snapshot=name))
+metrics.gauge("sse_subscribers", "Open /api/stream connections", collect=lambda: event_broker.subscriber_count)
+
+# ETH/USD 价格: 后台定时刷新, 请求路径只读内存中的最后一次成功报价
+ETH_PRICE_REFRESH_INTERVAL = int(os.getenv("ETH_PRICE_REFRESH_INTERVAL", "60"))
+ETH_PRICE_RATE_LIMIT = float(os.getenv("ETH_PRICE_RATE_LIMIT", "1"))  # 每个行情接口每秒最多请求数
+price_service = PriceService(
+    history_size=int(os.getenv("ETH_PRICE_HISTORY_SIZE", "60")),
+    budgets={name: upstreams.get(f"price:{name}", ETH_PRICE_RATE_LIMIT) for name, _ in PRICE_SOURCES},
+)
+metrics.gauge(
+    "eth_price_age_seconds", "Age of the cached ETH/USD quote (oldest across workers)", merge="max",
+    collect=lambda: price_service.current().age if price_service.current().fetched_at else None,
+)
 
 # --- 2. 数据库模型 (Models) ---
 
+# 数据库结构版本 (PRAGMA user_version), 旧库由 migrate_db.py 升级
+SCHEMA_VERSION = 3
+
+class WeiAmount(TypeDecorator):
+    """以定宽、左补零的十进制字符串存储 wei 金额, Python 侧为 int
+
+    SQLite 的 INTEGER 只有 64 位 (约 9.2 ETH), 定宽字符串既保证精确, 又让
+    SQL 中的比较和排序与数值顺序一致.
+    """
+    impl = String(32)
+    cache_ok = True
+    WIDTH = 32
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        value = int(value)
+        if value < 0 or value >= 10 ** self.WIDTH:
+            raise ValueError(f"wei amount out of range: {value}")
+        return str(value).zfill(self.WIDTH)
+
+    def process_result_value(self, value, dialect):
+        return int(value) if value not in (None, "") else None
+
 class Weapon(db.Model):
     """缓存CS2武器价格"""
     hash_name = db.Column(db.String(255), primary_key=True)
@@ -70,40 +278,106 @@ class GameState(db.Model):
     """存储游戏的全局状态"""
     id = db.Column(db.Integer, primary_key=True)
     status = db.Column(db.Integer, default=0)
-    total_prize_pool = db.Column(db.String(50), default="0")
+    total_prize_pool = db.Column(WeiAmount, default=0)
     winning_team_id = db.Column(db.Integer, nullable=True)
 
 class Team(db.Model):
     """存储战队信息"""
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100))
-    total_vote_amount = db.Column(db.String(50), default="0")
+    total_vote_amount = db.Column(WeiAmount, default=0)
     supporter_count = db.Column(db.Integer, default=0)
 
 class UserVote(db.Model):
-    """记录每个用户的投票 - 包含所有Etherscan API字段"""
+    """每笔投票 - 只保留查询需要的字段, 全部取自 ABI 解码的 NewVote 事件"""
     id = db.Column(db.Integer, primary_key=True)
-    user_address = db.Column(db.String(42))
-    team_id = db.Column(db.Integer)
-    amount_wei = db.Column(db.String(50))
-    block_number = db.Column(db.String(50))
+    user_address = db.Column(db.String(42), index=True)
+    team_id = db.Column(db.Integer, index=True)
+    amount_wei = db.Column(WeiAmount)
+    block_number = db.Column(db.Integer, index=True)
     timestamp = db.Column(db.DateTime)
     hash = db.Column(db.String(66), unique=True)
-    # ... 其他Etherscan字段
-    nonce = db.Column(db.String(50))
-    block_hash = db.Column(db.String(66))
-    transaction_index = db.Column(db.String(50))
-    gas = db.Column(db.String(50))
-    gas_price = db.Column(db.String(50))
-    is_error = db.Column(db.String(10))
-    tx_receipt_status = db.Column(db.String(10))
-    input_data = db.Column(db.Text)
-    contract_address = db.Column(db.String(42))
-    cumulative_gas_used = db.Column(db.String(50))
-    gas_used = db.Column(db.String(50))
-    confirmations = db.Column(db.String(50))
-    method_id = db.Column(db.String(10))
-    function_name = db.Column(db.String(255))
+
+class UnconfirmedVote(db.Model):
+    """尚未达到确认深度的投票 (待确认缓冲) - 按所在区块的哈希记录, 重组时撤回, 确认后转入 UserVote"""
+    hash = db.Column(db.String(66), primary_key=True)
+    block_number = db.Column(db.Integer, nullable=False, index=True)
+    block_hash = db.Column(db.String(66), nullable=False)
+    user_address = db.Column(db.String(42), nullable=False)
+    team_id = db.Column(db.Integer, nullable=False)
+    amount_wei = db.Column(WeiAmount, nullable=False)
+    timestamp = db.Column(db.DateTime)
+
+class UserPortfolio(db.Model):
+    """按地址预计算的投票汇总 - /api/voting_history 直接读取这一行"""
+    user_address = db.Column(db.String(42), primary_key=True)
+    total_votes = db.Column(db.Integer, nullable=False, default=0)
+    win_count = db.Column(db.Integer, nullable=False, default=0)
+    invested_wei = db.Column(WeiAmount, nullable=False, default=0)
+    returned_wei = db.Column(WeiAmount, nullable=False, default=0)
+    votes_json = db.Column(db.Text, nullable=False, default="[]")  # 每笔投票的明细 (含 payout), 预序列化
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Settlement(db.Model):
+    """比赛结束时一次性计算的每个 (地址, 战队) 的应得金额, 与合约 withdraw(teamId) 一致"""
+    user_address = db.Column(db.String(42), primary_key=True)
+    team_id = db.Column(db.Integer, primary_key=True)
+    outcome = db.Column(db.String(10), nullable=False)  # Won / Lost / Refunded
+    staked_wei = db.Column(WeiAmount, nullable=False)
+    payout_wei = db.Column(WeiAmount, nullable=False)
+    settled_at = db.Column(db.DateTime, nullable=False)
+
+class SettlementSummary(db.Model):
+    """结算的汇总和与 totalRewardPool 的核对结果 (只有一行)"""
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.Integer, nullable=False)  # 结算时的游戏状态 (2 Finished / 3 Refunding)
+    winning_team_id = db.Column(db.Integer, nullable=True)
+    total_reward_pool = db.Column(WeiAmount, nullable=False)  # 结算时的奖池
+    expected_wei = db.Column(WeiAmount, nullable=False)
+    paid_wei = db.Column(WeiAmount, nullable=False)
+    payout_stake_wei = db.Column(WeiAmount, nullable=False)  # 有收益的行 (获胜或退款) 的投入合计
+    payout_entries = db.Column(db.Integer, nullable=False)
+    entry_count = db.Column(db.Integer, nullable=False)
+    checksum_ok = db.Column(db.Boolean, nullable=False)
+    settled_at = db.Column(db.DateTime, nullable=False)
+    # 结算和持仓都已包含的最大投票 id; 0 表示结算后的持仓重算还没有完成
+    last_vote_id = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+class StatsCounter(db.Model):
+    """/api/stats 的全局运行计数器 (total_votes / unique_participants)"""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class TeamVoteTotal(db.Model):
+    """按战队累计的投票数与金额 - 与投票写入在同一事务中维护"""
+    team_id = db.Column(db.Integer, primary_key=True)
+    vote_count = db.Column(db.Integer, nullable=False, default=0)
+    amount_wei = db.Column(WeiAmount, nullable=False, default=0)
+
+class SyncCheckpoint(db.Model):
+    """持久化的同步进度 - 记录每个同步任务已处理到的区块"""
+    name = db.Column(db.String(50), primary_key=True)
+    block_number = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class PendingVote(db.Model):
+    """/api/record_vote 提交、等待 leader 按回执校验的交易 (任何 worker 都可以写入)"""
+    hash = db.Column(db.String(66), primary_key=True)
+    submitted_at = db.Column(db.Float, nullable=False)
+    next_attempt_at = db.Column(db.Float, nullable=False, index=True)
+
+class SnapshotVersion(db.Model):
+    """快照版本号 - leader 重建快照后递增, 其他 worker 轮询到变化后重建本地快照"""
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class SyncLeader(db.Model):
+    """当前同步 leader 的状态和心跳, 供其他 worker 的 /ready 读取"""
+    id = db.Column(db.Integer, primary_key=True)
+    pid = db.Column(db.Integer, nullable=False)
+    phase = db.Column(db.String(50), nullable=False)
+    ready = db.Column(db.Boolean, nullable=False, default=False)
+    heartbeat_at = db.Column(db.Float, nullable=False)
 
 # --- 3. 核心后端逻辑 ---
 
@@ -122,230 +396,1324 @@ def get_logo_url(team_name):
     }
     return logo_mapping.get(team_name, "/teams/default.svg")
 
-def update_team_stats():
-    """从智能合约同步战队统计数据"""
+def update_team_stats(state):
+    """把合约状态中的战队数据同步到数据库, 成功返回 True"""
     with app.app_context():
         try:
-            teams_data = contract.functions.getTeams().call()
-            for team_data in teams_data:
-                team_id, name, total_vote, supporters = team_data
+            changed = False
+            for team_id, name, total_vote, supporters in state.teams:
                 team = db.session.get(Team, team_id)
                 if team:
-                    team.total_vote_amount = str(total_vote)
-                    team.supporter_count = int(supporters)
+                    if team.total_vote_amount != total_vote or team.supporter_count != supporters:
+                        team.total_vote_amount = total_vote
+                        team.supporter_count = supporters
+                        changed = True
                 else:
                     team = Team(
-                        id=int(team_id),
+                        id=team_id,
                         name=name,
-                        total_vote_amount=str(total_vote),
-                        supporter_count=int(supporters)
+                        total_vote_amount=total_vote,
+                        supporter_count=supporters
                     )
                     db.session.add(team)
-            db.session.commit()
-            print("✅ Team stats updated from contract.")
+                    changed = True
+            if changed:
+                db.session.commit()
+                snapshots.rebuild("teams")
+                logger.info("Team stats updated from contract.")
+            return True
         except Exception as e:
-            print(f"❌ Error updating team stats: {e}")
+            logger.error(f"Error updating team stats: {e}")
             db.session.rollback()
+            return False
 
-def update_game_status():
-    """从智能合约同步游戏状态"""
+def update_game_status(state):
+    """把合约状态中的游戏状态同步到数据库, 成功返回 True"""
     with app.app_context():
         try:
-            contract_status = contract.functions.status().call()
-            contract_pool = contract.functions.totalRewardPool().call()
+            contract_status = state.status
+            contract_pool = state.total_reward_pool
             
             game_state = GameState.query.first()
+            changed = False
+            game_ended = False
             if not game_state:
                 game_state = GameState(id=1)
                 db.session.add(game_state)
+                changed = True
             
             if game_state.status != contract_status:
-                print(f"🔄 Game status changed from {GAME_STATUS_MAP.get(game_state.status, 'Unknown')} to {GAME_STATUS_MAP.get(contract_status, 'Unknown')}")
+                changed = True
+                logger.info(f"Game status changed from {GAME_STATUS_MAP.get(game_state.status, 'Unknown')} to {GAME_STATUS_MAP.get(contract_status, 'Unknown')}")
                 game_state.status = contract_status
                 
                 if contract_status == 2: # Finished
-                     winning_id = contract.functions.winningTeamId().call()
-                     game_state.winning_team_id = winning_id
-                     print(f"🏆 Winner Selected: Team {winning_id}")
+                     game_state.winning_team_id = state.winning_team_id
+                     logger.info(f"Winner Selected: Team {state.winning_team_id}")
                 
-                if contract_status in [1, 2, 3]: # Stopped, Finished, or Refunding
-                    print("🎯 Game ended or entered refunding! Saving all user votes...")
-                    save_all_user_votes_to_database()
+                game_ended = contract_status in [1, 2, 3] # Stopped, Finished, or Refunding
 
-            game_state.total_prize_pool = str(contract_pool)
-            db.session.commit()
+            if game_state.total_prize_pool != contract_pool:
+                game_state.total_prize_pool = contract_pool
+                changed = True
+            if changed:
+                db.session.commit()
+                snapshots.rebuild("status", "stats")
         except Exception as e:
-            print(f"❌ Error updating game status: {e}")
+            logger.error(f"Error updating game status: {e}")
             db.session.rollback()
+            return False
+
+        # 先提交状态释放写锁, 再做回填 (网络 I/O, 自己的事务); Finished / Refunding 的回填
+        # 和结算由 settle_if_needed 根据数据库状态决定, 失败后下次同步会重试
+        if game_ended and contract_status not in GAME_TERMINAL_STATUSES:
+            logger.info("Game stopped! Saving all user votes...")
+            save_all_user_votes_to_database()
+        return True
+
+def sync_contract_state(block_number=None):
+    """一次批量读取合约状态 (固定在同一区块) 并同步战队和游戏状态
+
+    比上次同步的区块更旧的状态直接丢弃 (索引器和投票校验线程可能并发同步),
+    状态只会前进; 内容相同时跳过写入, 但仍检查是否需要 (重新) 结算.
+    """
+    global last_contract_state
+    try:
+        state = contract_reader.read(block_number)
+    except Exception as e:
+        logger.error(f"Error reading contract state: {e}")
+        return None
+    with contract_state_lock:
+        if last_contract_state and state.block_number < last_contract_state.block_number:
+            return last_contract_state
+        if state.same_as(last_contract_state):
+            last_contract_state = state
+        else:
+            teams_synced = update_team_stats(state)
+            game_synced = update_game_status(state)
+            if teams_synced and game_synced:
+                last_contract_state = state
+    settle_if_needed()
+    return state
+
+def settlement_pending():
+    """游戏已结束, 而结算缺失、属于另一个状态或没有覆盖到最新的投票时返回 True"""
+    with ReadSession() as session:
+        game_state = session.query(GameState).first()
+        if not game_state or game_state.status not in GAME_TERMINAL_STATUSES:
+            return False
+        summary = session.get(SettlementSummary, 1)
+        if summary is None or summary.status != game_state.status:
+            return True
+        return summary.last_vote_id < (session.scalar(select(func.max(UserVote.id))) or 0)
+
+def settle_if_needed():
+    """按数据库状态决定是否回填并结算: 上次结算或重算失败、中途退出时下一次同步会重试
+
+    回填没有完成时不结算 (结算会漏掉投票), 回填或结算失败后 SETTLEMENT_RETRY_INTERVAL
+    秒内不再重试. 已有结算在运行时直接返回.
+    """
+    global settlement_retry_at
+    if time.monotonic() < settlement_retry_at or not settlement_lock.acquire(blocking=False):
+        return False
+    try:
+        if not settlement_pending():
+            return False
+        logger.info("Game finished or refunding without a complete settlement, backfilling and settling...")
+        if save_all_user_votes_to_database() is None:
+            settlement_retry_at = time.monotonic() + SETTLEMENT_RETRY_INTERVAL
+            logger.warning(f"Backfill incomplete, retrying settlement in {SETTLEMENT_RETRY_INTERVAL}s")
+            return False
+        with app.app_context():
+            settle_and_rebuild_portfolios()
+        return True
+    except Exception as e:
+        settlement_retry_at = time.monotonic() + SETTLEMENT_RETRY_INTERVAL
+        logger.error(f"Error settling game: {e}")
+        return False
+    finally:
+        settlement_lock.release()
+
+
+def settlement_terms(game_state, session=None):
+    """结算使用的 (奖池, 合约中的获胜战队累计)
+
+    已结算时沿用结算时记录的奖池, 合约中的奖池在提现后会变化. session 默认为 db.session.
+    """
+    session = session or db.session
+    summary = session.get(SettlementSummary, 1)
+    if summary and summary.status == game_state.status:
+        pool_wei = summary.total_reward_pool
+    else:
+        pool_wei = game_state.total_prize_pool or 0
+    winner_total_wei = 0
+    if game_state.status == 2 and game_state.winning_team_id is not None:
+        winner = session.get(Team, game_state.winning_team_id)
+        winner_total_wei = winner.total_vote_amount or 0 if winner else 0
+    return pool_wei, winner_total_wei
+
+def compute_vote_outcome(team_id, amount_wei, game_state, pool_wei, winner_total_wei):
+    """根据游戏状态计算单笔投票的结果和应得金额 (wei, 整数精确)"""
+    if game_state and game_state.status == 2: # Finished
+        if team_id != game_state.winning_team_id:
+            return "Lost", 0
+        return "Won", payout_wei(amount_wei, pool_wei, winner_total_wei)
+    if game_state and game_state.status == 3: # Refunding
+        return "Refunded", amount_wei # 全额退款
+    return "Pending", 0
+
+def portfolio_vote_entry(team_id, team_name, amount_wei, status, payout_wei, timestamp):
+    """/api/voting_history 中单笔投票的展示格式"""
+    return {
+        "team_id": team_id,
+        "team_name": team_name or f"Team {team_id}",
+        "amount_eth": float(web3.from_wei(amount_wei, 'ether')),
+        "status": status,
+        "payout_eth": float(web3.from_wei(payout_wei, 'ether')),
+        # 与从 SQLite 读回的 naive UTC 时间保持同一格式
+        "timestamp": timestamp.replace(tzinfo=None).isoformat() if timestamp else None
+    }
+
+def record_ingested_votes(votes):
+    """新投票写入后的统一入口: 在同一事务中更新计数器和用户汇总 (调用方负责提交)
+
+    votes 为包含 hash / user_address / team_id / amount_wei / timestamp 的字典列表.
+    """
+    if not votes:
+        return
+    apply_votes_to_counters(votes)
+    apply_votes_to_portfolios(votes)
+    db.session.info["vote_indexes_stale"] = True
+
+def increment_counter(model, key_column, key, **increments):
+    """原子地累加计数器行 (INSERT ... ON CONFLICT DO UPDATE), 多进程并发写入也不会丢失"""
+    stmt = sqlite_insert(model).values({key_column.name: key, **increments})
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[key_column],
+        set_={name: getattr(model, name) + stmt.excluded[name] for name in increments},
+    )
+    db.session.execute(stmt)
+
+def apply_votes_to_counters(votes):
+    """增量维护 StatsCounter / TeamVoteTotal"""
+    new_hashes = [v["hash"] for v in votes]
+    addresses = {v["user_address"] for v in votes}
+    # 本批之前已经投过票的地址 (user_address 有索引)
+    known_addresses = {
+        a for (a,) in db.session.query(UserVote.user_address).filter(
+            UserVote.user_address.in_(addresses), UserVote.hash.notin_(new_hashes)
+        ).distinct()
+    }
+    increment_counter(StatsCounter, StatsCounter.name, "total_votes", value=len(votes))
+    increment_counter(StatsCounter, StatsCounter.name, "unique_participants", value=len(addresses - known_addresses))
+
+    per_team = {}
+    for vote in votes:
+        count, amount = per_team.get(int(vote["team_id"]), (0, 0))
+        per_team[int(vote["team_id"])] = (count + 1, amount + int(vote["amount_wei"]))
+    for team_id, (count, amount) in per_team.items():
+        increment_counter(TeamVoteTotal, TeamVoteTotal.team_id, team_id, vote_count=count)
+        # WeiAmount 是定宽字符串, 不能在 SQL 中相加; 此时事务已持有写锁, 读改写是串行的
+        current = db.session.execute(
+            select(TeamVoteTotal.amount_wei).where(TeamVoteTotal.team_id == team_id)
+        ).scalar() or 0
+        db.session.execute(
+            update(TeamVoteTotal).where(TeamVoteTotal.team_id == team_id).values(amount_wei=current + amount)
+        )
+
+def compute_stats_counters():
+    """从 UserVote 全量计算计数器的正确值"""
+    totals = {}
+    for team_id, amount_wei in db.session.query(UserVote.team_id, UserVote.amount_wei).yield_per(5000):
+        count, amount = totals.get(team_id, (0, 0))
+        totals[team_id] = (count + 1, amount + (amount_wei or 0))
+    return {
+        "total_votes": UserVote.query.count(),
+        "unique_participants": db.session.query(UserVote.user_address).distinct().count(),
+        "teams": totals,
+    }
+
+def rebuild_stats_counters(expected=None):
+    """用全量计算结果覆盖计数器 (调用方负责提交)"""
+    expected = expected or compute_stats_counters()
+    db.session.query(StatsCounter).delete()
+    db.session.query(TeamVoteTotal).delete()
+    db.session.add_all([
+        StatsCounter(name="total_votes", value=expected["total_votes"]),
+        StatsCounter(name="unique_participants", value=expected["unique_participants"]),
+    ])
+    db.session.add_all([
+        TeamVoteTotal(team_id=team_id, vote_count=count, amount_wei=amount)
+        for team_id, (count, amount) in expected["teams"].items()
+    ])
+
+def verify_stats_counters():
+    """比较计数器与全量计算结果, 返回偏差列表 [(名称, 计数器值, 正确值)]"""
+    expected = compute_stats_counters()
+    counters = {c.name: c.value for c in StatsCounter.query.all()}
+    drift = [
+        (name, counters.get(name, 0), expected[name])
+        for name in ("total_votes", "unique_participants")
+        if counters.get(name, 0) != expected[name]
+    ]
+    stored = {t.team_id: (t.vote_count, t.amount_wei) for t in TeamVoteTotal.query.all()}
+    for team_id in sorted(set(stored) | set(expected["teams"])):
+        if stored.get(team_id, (0, 0)) != expected["teams"].get(team_id, (0, 0)):
+            drift.append((f"team {team_id}", stored.get(team_id), expected["teams"].get(team_id)))
+    return expected, drift
+
+def apply_votes_to_portfolios(votes):
+    """把新写入的投票增量合并进 UserPortfolio (调用方负责提交)
+
+    votes 为包含 user_address / team_id / amount_wei / timestamp 的字典列表.
+    """
+    if not votes:
+        return
+    game_state = GameState.query.first()
+    settled = game_state is not None and game_state.status in (2, 3)
+    returned = {}
+    if settled:
+        # 结算后奖池和合约累计不再变化, 补录的投票只影响它自己的收益, 不需要整体重算
+        pool_wei, winner_total_wei = settlement_terms(game_state)
+        returned = apply_votes_to_settlement(votes, game_state, pool_wei, winner_total_wei)
+
+    team_names = {t.id: t.name for t in Team.query.all()}
+    addresses = {v["user_address"] for v in votes}
+    portfolios = {
+        p.user_address: p
+        for p in UserPortfolio.query.filter(UserPortfolio.user_address.in_(addresses))
+    }
+    entries = {}
+    for vote in votes:
+        address = vote["user_address"]
+        portfolio = portfolios.get(address)
+        if portfolio is None:
+            portfolio = portfolios[address] = UserPortfolio(
+                user_address=address, total_votes=0, win_count=0,
+                invested_wei=0, returned_wei=0, votes_json="[]"
+            )
+            db.session.add(portfolio)
+        if address not in entries:
+            entries[address] = json.loads(portfolio.votes_json)
 
+        amount_wei = int(vote["amount_wei"])
+        team_id = int(vote["team_id"])
+        status, payout = "Pending", 0
+        if settled:
+            status, payout = compute_vote_outcome(team_id, amount_wei, game_state, pool_wei, winner_total_wei)
+        entries[address].append(portfolio_vote_entry(
+            team_id, team_names.get(team_id), amount_wei, status, payout, vote.get("timestamp")
+        ))
+        portfolio.total_votes += 1
+        portfolio.win_count += status == "Won"
+        portfolio.invested_wei += amount_wei
+        if address not in returned:
+            portfolio.returned_wei += payout
+
+    for address, vote_entries in entries.items():
+        portfolios[address].votes_json = json.dumps(vote_entries, ensure_ascii=False)
+        if address in returned:
+            portfolios[address].returned_wei += returned[address]
+
+def apply_votes_to_settlement(votes, game_state, pool_wei, winner_total_wei):
+    """把结算后才补录的投票并入 Settlement 并重新核对 (调用方负责提交)
+
+    返回 {地址: 应得金额的增量}; 还没有结算时返回空字典, 由结算一并计算.
+    """
+    summary = db.session.get(SettlementSummary, 1)
+    if summary is None or summary.status != game_state.status:
+        return {}
+    added = {}
+    for vote in votes:
+        key = (vote["user_address"], int(vote["team_id"]))
+        added[key] = added.get(key, 0) + int(vote["amount_wei"])
+    existing = {
+        (row.user_address, row.team_id): row
+        for row in Settlement.query.filter(Settlement.user_address.in_({address for address, _ in added}))
+    }
+    returned = {}
+    for (address, team_id), amount_wei in added.items():
+        row = existing.get((address, team_id))
+        old_payout = row.payout_wei if row else 0
+        entry = settle_entry(
+            game_state.status, address, team_id, (row.staked_wei if row else 0) + amount_wei,
+            pool_wei, summary.winning_team_id, winner_total_wei,
+        )
+        if row is None:
+            row = Settlement(user_address=address, team_id=team_id, settled_at=datetime.now(timezone.utc))
+            db.session.add(row)
+            summary.entry_count += 1
+            summary.payout_entries += entry.outcome != "Lost"
+        row.outcome, row.staked_wei, row.payout_wei = entry.outcome, entry.staked_wei, entry.payout_wei
+        if entry.outcome != "Lost":
+            summary.payout_stake_wei += amount_wei
+        summary.paid_wei += entry.payout_wei - old_payout
+        returned[address] = returned.get(address, 0) + entry.payout_wei - old_payout
+    summary.checksum_ok = verify(
+        game_state.status, summary.expected_wei, summary.paid_wei,
+        summary.payout_stake_wei, summary.payout_entries, winner_total_wei,
+    )
+    # 本批投票刚在同一事务中插入, id 连续且最大; 之前的投票都已覆盖时推进水位
+    last_vote_id = db.session.scalar(select(func.max(UserVote.id))) or 0
+    if summary.last_vote_id and summary.last_vote_id >= last_vote_id - len(votes):
+        summary.last_vote_id = last_vote_id
+    log_settlement(summary, f"Updated settlement with {len(votes)} late vote(s)")
+    return returned
+
+def portfolio_rows(session, game_state, votes, updated_at, addresses=None, pause=True):
+    """由按 id 排序的 (地址, 战队, 投入, 时间) 行计算 UserPortfolio 行
+
+    战队和结算行从 session 读取; 已结算时总收益取自 Settlement, addresses 不为 None
+    时只读取这些地址的结算行. 在写事务里调用时传 pause=False, 不让出 gevent hub.
+    """
+    pace = yield_periodically if pause else (lambda rows, every=None: rows)
+    teams = {t.id: t for t in session.query(Team)}
+    pool_wei, winner_total_wei = settlement_terms(game_state, session) if game_state else (0, 0)
+
+    portfolios = {}
+    for address, team_id, amount_wei, timestamp in votes:
+        status, payout_wei = compute_vote_outcome(team_id, amount_wei, game_state, pool_wei, winner_total_wei)
+        portfolio = portfolios.get(address)
+        if portfolio is None:
+            portfolio = portfolios[address] = {
+                "user_address": address, "total_votes": 0, "win_count": 0,
+                "invested_wei": 0, "returned_wei": 0, "votes": []
+            }
+        team = teams.get(team_id)
+        portfolio["votes"].append(portfolio_vote_entry(
+            team_id, team.name if team else None, amount_wei, status, payout_wei, timestamp
+        ))
+        portfolio["total_votes"] += 1
+        portfolio["win_count"] += status == "Won"
+        portfolio["invested_wei"] += amount_wei
+        portfolio["returned_wei"] += payout_wei
+
+    if game_state and game_state.status in (2, 3):
+        # 结算后的总收益以 Settlement 为准 (与合约一样按 (地址, 战队) 的累计取整)
+        returned = {}
+        settlements = session.query(Settlement.user_address, Settlement.payout_wei)
+        if addresses is not None:
+            settlements = settlements.filter(Settlement.user_address.in_(addresses))
+        for address, amount_wei in pace(settlements.yield_per(VOTE_INDEX_CHUNK_SIZE)):
+            returned[address] = returned.get(address, 0) + amount_wei
+        for address, portfolio in portfolios.items():
+            portfolio["returned_wei"] = returned.get(address, portfolio["returned_wei"])
+
+    return [{
+        "user_address": p["user_address"],
+        "total_votes": p["total_votes"],
+        "win_count": p["win_count"],
+        "invested_wei": p["invested_wei"],
+        "returned_wei": p["returned_wei"],
+        "votes_json": json.dumps(p["votes"], ensure_ascii=False),
+        "updated_at": updated_at,
+    } for p in pace(portfolios.values(), every=1000)]
+
+def portfolio_votes(session):
+    return session.query(
+        UserVote.user_address, UserVote.team_id, UserVote.amount_wei, UserVote.timestamp
+    ).order_by(UserVote.id)
+
+def rebuild_user_portfolios():
+    """一次遍历 UserVote 重算所有地址的汇总与每笔收益, 返回已覆盖的最大投票 id
+
+    先提交调用方未提交的修改; 遍历和计算都在只读会话里进行 (期间让出 gevent hub,
+    不持有写锁), 结果按批 upsert, 每批一个短的写事务. 分批写入期间其他线程提交的
+    投票可能被较早算好的一批覆盖, 最后一个写事务里按这些投票的地址重新计算一次.
+    """
+    db.session.commit()
+    rebuilt_at = datetime.now(timezone.utc)
+    with ReadSession() as session:
+        game_state = session.query(GameState).first()
+        last_vote_id = session.scalar(select(func.max(UserVote.id))) or 0
+        votes = portfolio_votes(session).filter(UserVote.id <= last_vote_id)
+        rows = portfolio_rows(session, game_state, yield_periodically(votes.yield_per(VOTE_INDEX_CHUNK_SIZE)), rebuilt_at)
+    upsert_in_batches(UserPortfolio.__table__, rows, ["user_address"])
+
+    # 最后一个写事务, 不再让出: 删除这次没有写到的地址 (例如地址改为小写之前的旧行)
+    db.session.query(UserPortfolio).filter(UserPortfolio.updated_at < rebuilt_at).delete()
+    covered_vote_id = db.session.scalar(select(func.max(UserVote.id))) or 0
+    late = {
+        address for (address,) in
+        db.session.query(UserVote.user_address).filter(UserVote.id > last_vote_id).distinct()
+    }
+    if late:
+        votes = portfolio_votes(db.session).filter(UserVote.user_address.in_(late))
+        db.session.execute(
+            upsert_statement(UserPortfolio.__table__, ["user_address"]),
+            portfolio_rows(db.session, GameState.query.first(), votes, datetime.now(timezone.utc), late, pause=False),
+        )
+    db.session.commit()
+    logger.info(f"Rebuilt {len(rows)} user portfolio(s)")
+    return covered_vote_id
+
+def upsert_statement(table, index_elements):
+    """INSERT ... ON CONFLICT DO UPDATE, 冲突时覆盖全部非主键列"""
+    stmt = sqlite_insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={c.name: stmt.excluded[c.name] for c in table.columns if c.name not in index_elements},
+    )
+
+def upsert_in_batches(table, rows, index_elements):
+    """按主键 upsert rows, 每 REBUILD_WRITE_BATCH_SIZE 行一个事务, 事务之间让出 gevent hub
+
+    调用前不能有打开的写事务; 每批提交后才让出, 让出时不持有写锁, 读者看到的每个
+    地址要么是旧行要么是新行.
+    用 Core 的 executemany 写入, 避开 ORM 批量插入的逐行开销.
+    """
+    stmt = upsert_statement(table, index_elements)
+    for i in range(0, len(rows), REBUILD_WRITE_BATCH_SIZE):
+        db.session.execute(stmt, rows[i:i + REBUILD_WRITE_BATCH_SIZE])
+        db.session.commit()
+        time.sleep(VOTE_INDEX_YIELD_SECONDS)
+
+def settle_game():
+    """计算全部 (地址, 战队) 的应得金额并分批写入 Settlement, 最后写入汇总并提交
+
+    各 (地址, 战队) 的累计投入取自排行榜 (先并入水位之后已提交的投票), 不再遍历
+    UserVote. 先提交调用方未提交的修改, 游戏状态从只读会话读取, 计算期间不持有写锁.
+    """
+    db.session.commit()
+    with ReadSession() as session:
+        game_state = session.query(GameState).first()
+        if not game_state or game_state.status not in (2, 3):
+            return None
+        status = game_state.status
+        pool_wei, winner_total_wei = settlement_terms(game_state, session)
+    started = time.monotonic()
+    sync_vote_indexes()
+    winning_team_id = game_state.winning_team_id if status == 2 else None
+    last_vote_id, stakes = leaderboard.stakes()
+    stakes = yield_periodically((address, team_id, staked) for (address, team_id), staked in stakes.items())
+    result = settle(stakes, status, pool_wei, winning_team_id, winner_total_wei)
+    settled_at = datetime.now(timezone.utc)
+    rows = [dict(row._asdict(), settled_at=settled_at) for row in yield_periodically(result.rows)]
+    upsert_in_batches(Settlement.__table__, rows, ["user_address", "team_id"])
+    # 最后一个写事务, 不再让出: 删除这次没有写到的行; 分批写入期间提交的投票按 UserVote
+    # 重算受影响的 (地址, 战队) 并修正合计
+    db.session.query(Settlement).filter(Settlement.settled_at < settled_at).delete()
+    paid, payout_stake, payout_entries, entry_count = (
+        result.paid_wei, result.payout_stake_wei, result.payout_entries, len(rows)
+    )
+    late = set(db.session.query(UserVote.user_address, UserVote.team_id).filter(UserVote.id > last_vote_id).distinct())
+    if late:
+        staked = {}
+        for address, team_id, amount_wei in db.session.query(
+            UserVote.user_address, UserVote.team_id, UserVote.amount_wei
+        ).filter(UserVote.user_address.in_({address for address, _ in late})):
+            if (address, team_id) in late:
+                staked[(address, team_id)] = staked.get((address, team_id), 0) + amount_wei
+        previous = {(row.user_address, row.team_id): row for row in result.rows if (row.user_address, row.team_id) in late}
+        repaired = []
+        for (address, team_id), amount_wei in staked.items():
+            entry = settle_entry(status, address, team_id, amount_wei, pool_wei, winning_team_id, winner_total_wei)
+            old = previous.get((address, team_id))
+            if old is None:
+                entry_count += 1
+            elif old.outcome != "Lost":
+                paid -= old.payout_wei
+                payout_stake -= old.staked_wei
+                payout_entries -= 1
+            if entry.outcome != "Lost":
+                paid += entry.payout_wei
+                payout_stake += entry.staked_wei
+                payout_entries += 1
+            repaired.append(dict(entry._asdict(), settled_at=settled_at))
+        db.session.execute(upsert_statement(Settlement.__table__, ["user_address", "team_id"]), repaired)
+
+    summary = db.session.get(SettlementSummary, 1)
+    if summary is None:
+        summary = SettlementSummary(id=1)
+        db.session.add(summary)
+    summary.status = status
+    summary.winning_team_id = winning_team_id
+    summary.total_reward_pool = pool_wei
+    summary.expected_wei = result.expected_wei
+    summary.paid_wei = paid
+    summary.payout_stake_wei = payout_stake
+    summary.payout_entries = payout_entries
+    summary.entry_count = entry_count
+    summary.checksum_ok = verify(
+        status, result.expected_wei, paid, payout_stake, payout_entries, winner_total_wei
+    )
+    summary.settled_at = settled_at
+    summary.last_vote_id = 0  # 持仓按新结果重算完成后才记录水位
+    db.session.commit()
+    log_settlement(summary, f"Settled {entry_count} entries in {time.monotonic() - started:.2f}s")
+    return summary
+
+def settle_and_rebuild_portfolios():
+    """结算并按结算结果重算所有地址的汇总 (两步都分批提交, 期间让出 gevent hub)
+
+    两步都完成后才把重算覆盖到的投票 id 记为结算水位, 中途失败时 settle_if_needed 会重试.
+    """
+    if settle_game() is None:
+        return None
+    covered_vote_id = rebuild_user_portfolios()
+    summary = db.session.get(SettlementSummary, 1)
+    summary.last_vote_id = covered_vote_id
+    db.session.commit()
+    return summary
+
+def log_settlement(summary, message):
+    """记录结算结果, 核对失败时记为错误"""
+    extra = {
+        "event": "settlement", "status": summary.status, "entries": summary.entry_count,
+        "paid_wei": str(summary.paid_wei), "expected_wei": str(summary.expected_wei),
+    }
+    if summary.checksum_ok:
+        logger.info(f"{message}, paying {summary.paid_wei} of {summary.expected_wei} wei", extra=extra)
+    else:
+        logger.error(
+            f"{message}: checksum mismatch, paying {summary.paid_wei} of {summary.expected_wei} wei", extra=extra
+        )
+
+def init_database(upgrading=False):
+    """创建缺失的表; 新数据库直接标记为当前结构版本
+
+    旧结构的库 (例如 block_number 还是字符串列) 拒绝启动, 需要先运行
+    python migrate_db.py upgrade; upgrading 为 True 时由升级工具调用, 不做检查.
+    """
+    is_new = not inspect(db.engine).has_table(UserVote.__tablename__)
+    db.create_all()
+    with db.engine.begin() as conn:
+        if is_new:
+            conn.execute(text(f"PRAGMA user_version = {SCHEMA_VERSION}"))
+            return
+        version = conn.execute(text("PRAGMA user_version")).scalar()
+    if version < SCHEMA_VERSION and not upgrading:
+        raise RuntimeError(
+            f"Database schema v{version} is older than v{SCHEMA_VERSION}, run: python migrate_db.py upgrade"
+        )
+
+def ensure_user_portfolios():
+    """已有投票但还没有汇总表/计数器数据 (旧数据库升级) 时重建一次"""
+    if UserVote.query.first() is None:
+        return
+    if UserPortfolio.query.first() is None:
+        rebuild_user_portfolios()
+    if StatsCounter.query.first() is None:
+        rebuild_stats_counters()
+    db.session.commit()
+    settle_if_needed()
+
+def get_sync_checkpoint(name):
+    """读取已提交的同步检查点, 不存在时返回 None"""
+    with ReadSession() as session:
+        checkpoint = session.get(SyncCheckpoint, name)
+        return checkpoint.block_number if checkpoint else None
+
+def set_sync_checkpoint(name, block_number):
+    """写入同步检查点 (由调用方在同一事务中提交)"""
+    checkpoint = db.session.get(SyncCheckpoint, name)
+    if checkpoint:
+        checkpoint.block_number = block_number
+    else:
+        db.session.add(SyncCheckpoint(name=name, block_number=block_number))
+
+def fetch_contract_logs(from_block, to_block):
+    """通过 eth_getLogs 拉取区块区间内所有关注的合约事件"""
+    return web3.eth.get_logs({
+        "address": contract.address,
+        "fromBlock": from_block,
+        "toBlock": to_block,
+        "topics": [event_decoder.topics],
+    })
+
+def vote_row_from_event(event, timestamp):
+    """把解码后的 NewVote 事件转换为 UserVote 的插入行"""
+    return {
+        'user_address': event.args['user'],  # eth_abi 解码出的地址已是小写
+        'team_id': event.args['teamId'],
+        'amount_wei': event.args['amount'],
+        'block_number': event.block_number,
+        'timestamp': datetime.fromtimestamp(timestamp, tz=timezone.utc),
+        'hash': event.transaction_hash,
+    }
+
+def event_timestamp(event, block_timestamps):
+    """事件的区块时间; eth_getLogs / 回执里的日志不带区块时间, 每个区块只查一次"""
+    if event.timestamp is not None:
+        return event.timestamp
+    if event.block_number not in block_timestamps:
+        block_timestamps[event.block_number] = web3.eth.get_block(event.block_number)["timestamp"]
+    return block_timestamps[event.block_number]
+
+def store_vote_events(vote_events):
+    """把 NewVote 事件批量写入 UserVote (按交易哈希去重, 由调用方提交), 返回新增条数"""
+    events = {e.transaction_hash: e for e in vote_events if e.transaction_hash not in recent_votes}
+    if not events:
+        return 0
+    # 去重窗口覆盖的区块不必查库, 只有更早的区块 (历史回填、迟到的提交) 才查;
+    # 去重查询走只读会话, 查区块时间 (网络 I/O) 时不持有写锁; 并发插入由 ON CONFLICT 兜底
+    uncovered = [h for h, e in events.items() if not recent_votes.covers(e.block_number)]
+    vote_dedup_lookups_total.inc(len(vote_events) - len(uncovered), source="window")
+    vote_dedup_lookups_total.inc(len(uncovered), source="db")
+    existing = set()
+    if uncovered:
+        with ReadSession() as session:
+            existing = {h for (h,) in session.query(UserVote.hash).filter(UserVote.hash.in_(uncovered))}
+
+    block_timestamps = {}
+    rows = [vote_row_from_event(event, event_timestamp(event, block_timestamps))
+            for tx_hash, event in events.items() if tx_hash not in existing]
+    if not rows:
+        return 0
+
+    inserted_rows = bulk_insert_votes(rows)
+    record_ingested_votes(inserted_rows)
+    db.session.info.setdefault("inserted_votes", []).extend(
+        (row['block_number'], row['hash']) for row in inserted_rows
+    )
+    return len(inserted_rows)
+
+@sa_event.listens_for(db.session, "after_commit")
+def remember_committed_votes(session):
+    """事务提交后才把新投票放进去重窗口, 回滚的投票不会被误判为已入库"""
+    for block_number, tx_hash in session.info.pop("inserted_votes", ()):
+        recent_votes.add(block_number, tx_hash)
+
+@sa_event.listens_for(db.session, "after_commit")
+def sync_vote_indexes_after_commit(session):
+    """新投票提交后并入排行榜和投票流量 (只读取水位之后新增的行); 尚未加载时由启动同步一次性加载"""
+    if session.info.pop("vote_indexes_stale", False) and leaderboard.loaded and vote_flow.loaded:
+        try:
+            sync_vote_indexes()
+        except Exception as e:
+            logger.warning(f"Error syncing vote indexes: {e}")
+
+@sa_event.listens_for(db.session, "after_rollback")
+def forget_rolled_back_votes(session):
+    session.info.pop("inserted_votes", None)
+    session.info.pop("vote_indexes_stale", None)
+
+def fetch_votes_after(vote_id, *columns):
+    """按 id 升序读取 id 大于 vote_id 的投票: (id, *columns)
+
+    每 VOTE_INDEX_CHUNK_SIZE 行让出一次 (yield_periodically), 第一次加载全部投票时
+    SSE 心跳和 /health 不会被阻塞到加载结束.
+    """
+    with ReadSession() as session:
+        query = session.query(UserVote.id, *columns).filter(UserVote.id > vote_id).order_by(UserVote.id)
+        yield from yield_periodically(query.yield_per(VOTE_INDEX_CHUNK_SIZE))
+
+def yield_periodically(rows, every=VOTE_INDEX_CHUNK_SIZE):
+    """逐行产出, 每 every 行短暂 sleep 一次, 让 gevent hub 处理 I/O 和定时器
+
+    只用于读取: 持有写事务时让出, 其他 greenlet 的写入会在 SQLite 的 busy 等待里阻塞整个 hub.
+    """
+    for i, row in enumerate(rows, 1):
+        yield row
+        if i % every == 0:
+            time.sleep(VOTE_INDEX_YIELD_SECONDS)
+
+def fetch_leaderboard_votes(vote_id):
+    return fetch_votes_after(vote_id, UserVote.user_address, UserVote.team_id, UserVote.amount_wei)
+
+def fetch_vote_flow_votes(vote_id):
+    # 时间戳在 SQLite 中换算为 Unix 秒 (存的是 naive UTC 时间), 省去逐行构造 datetime
+    return fetch_votes_after(
+        vote_id, UserVote.team_id, UserVote.amount_wei, cast(func.strftime('%s', UserVote.timestamp), db.Integer)
+    )
+
+def sync_vote_indexes():
+    """把新投票并入排行榜和投票流量; 第一次调用时各自一次遍历全部投票"""
+    for name, index, fetch in (("leaderboard", leaderboard, fetch_leaderboard_votes),
+                               ("vote flow", vote_flow, fetch_vote_flow_votes)):
+        loading = not index.loaded
+        started = time.monotonic()
+        count = index.sync(fetch)
+        if loading:
+            elapsed = time.monotonic() - started
+            logger.info(
+                f"Loaded {name} from {count} vote(s) in {elapsed:.2f}s",
+                extra={"event": "vote_index_loaded", "index": name, "votes": count, "seconds": round(elapsed, 3)},
+            )
+
+def unconfirmed_vote_rows(vote_events):
+    """待写入待确认缓冲的行, 跳过已缓冲且所在区块哈希没有变化的交易"""
+    events = {e.transaction_hash: e for e in vote_events}
+    if not events:
+        return []
+    with ReadSession() as session:
+        buffered = dict(session.query(UnconfirmedVote.hash, UnconfirmedVote.block_hash).filter(
+            UnconfirmedVote.hash.in_(list(events))
+        ))
+    block_timestamps = {}
+    return [
+        dict(vote_row_from_event(event, event_timestamp(event, block_timestamps)), block_hash=event.block_hash)
+        for tx_hash, event in events.items() if buffered.get(tx_hash) != event.block_hash
+    ]
+
+def upsert_unconfirmed_votes(rows):
+    """写入待确认缓冲 (由调用方提交); 交易被重新打包到其他区块时更新所在区块"""
+    for i in range(0, len(rows), BACKFILL_BATCH_SIZE):
+        stmt = sqlite_insert(UnconfirmedVote).values(rows[i:i + BACKFILL_BATCH_SIZE])
+        db.session.execute(stmt.on_conflict_do_update(index_elements=['hash'], set_={
+            'block_number': stmt.excluded.block_number,
+            'block_hash': stmt.excluded.block_hash,
+            'timestamp': stmt.excluded.timestamp,
+        }))
+
+def refresh_unconfirmed_votes(from_block, to_block):
+    """重新读取未确认区间的 NewVote 日志并与待确认缓冲对账
+
+    缓冲中的投票如果不再出现, 或者所在区块的哈希变了 (链重组), 就被撤回;
+    待确认的统计直接由缓冲汇总, 撤回即回滚. 返回缓冲中新增/撤回的投票数.
+    """
+    if from_block > to_block:
+        return 0
+    events = [e for e in event_decoder.decode_many(fetch_contract_logs(from_block, to_block)) if e.event == "NewVote"]
+    current = {e.transaction_hash: e.block_hash for e in events}
+    with ReadSession() as session:
+        buffered = session.query(UnconfirmedVote.hash, UnconfirmedVote.block_hash).filter(
+            UnconfirmedVote.block_number.between(from_block, to_block)
+        ).all()
+    stale = [tx_hash for tx_hash, block_hash in buffered if current.get(tx_hash) != block_hash]
+    rows = unconfirmed_vote_rows(events)
+    if not stale and not rows:
+        return 0
+
+    with app.app_context():
+        if stale:
+            db.session.query(UnconfirmedVote).filter(UnconfirmedVote.hash.in_(stale)).delete(synchronize_session=False)
+        upsert_unconfirmed_votes(rows)
+        db.session.commit()
+    if stale:
+        logger.info(
+            f"Chain reorg in blocks {from_block}-{to_block}: rolled back {len(stale)} unconfirmed vote(s)",
+            extra={"event": "reorg", "from_block": from_block, "to_block": to_block, "rolled_back": len(stale)},
+        )
+    return len(rows) + len(stale)
+
+def get_unconfirmed_totals(session):
+    """待确认缓冲按战队汇总: {team_id: (投票数, wei)}; 缓冲只有最近几个区块, 直接在 Python 里累加"""
+    totals = {}
+    for team_id, amount_wei in session.query(UnconfirmedVote.team_id, UnconfirmedVote.amount_wei):
+        count, wei = totals.get(team_id, (0, 0))
+        totals[team_id] = (count + 1, wei + amount_wei)
+    return totals
+
+def load_recent_votes(watermark):
+    """从数据库加载检查点附近的投票哈希, 初始化去重窗口"""
+    with ReadSession() as session:
+        votes = session.query(UserVote.block_number, UserVote.hash).filter(
+            UserVote.block_number >= watermark - DEDUP_WINDOW_BLOCKS
+        ).all()
+    recent_votes.reset(watermark, votes)
+
+def index_block_range(from_block, to_block):
+    """索引一个已确认的区块区间: 写入新投票、移出待确认缓冲, 并在同一事务中推进检查点
+
+    返回 (新增投票数, 是否出现状态/奖池相关事件)
+    """
+    events = event_decoder.decode_many(fetch_contract_logs(from_block, to_block))
+    vote_events = [e for e in events if e.event == "NewVote"]
+    state_changed = len(vote_events) != len(events)
+
+    with app.app_context():
+        saved_count = store_vote_events(vote_events)
+        promoted = db.session.query(UnconfirmedVote).filter(
+            UnconfirmedVote.block_number <= to_block
+        ).delete(synchronize_session=False)
+        set_sync_checkpoint(LOG_INDEXER_CHECKPOINT, to_block)
+        db.session.commit()
+
+    if saved_count > 0 or promoted > 0:
+        snapshots.rebuild("stats", "teams")
+    if saved_count > 0:
+        votes_ingested_total.inc(saved_count, source="indexer")
+        logger.info(
+            f"Indexed {saved_count} new vote(s) from blocks {from_block}-{to_block}",
+            extra={"event": "indexed", "votes": saved_count, "from_block": from_block, "to_block": to_block},
+        )
+    return saved_count, state_changed
 
 def setup_event_listeners():
     """设置智能合约事件监听器，实现实时数据同步"""
-    
+
     def event_listener():
-        """使用Etherscan API监听合约事件"""
+        """基于 eth_getLogs 的增量日志索引器, 从持久化检查点继续"""
         try:
-            latest_block = web3.eth.block_number
-            last_checked_block = latest_block - 10 
-            processed_tx_hashes = set()
-            
-            print(f"👂 Event listener started")
-            
+            checkpoint = get_sync_checkpoint(LOG_INDEXER_CHECKPOINT)
+            with ReadSession() as session:
+                last_vote_block = session.scalar(select(func.max(UserVote.block_number)))
+            if checkpoint is not None:
+                next_block = checkpoint + 1
+            elif LOG_INDEXER_START_BLOCK:
+                next_block = int(LOG_INDEXER_START_BLOCK)
+            elif last_vote_block is not None:
+                # 从回填到的最后一个区块继续 (Etherscan 可能落后链头几个区块, 重复的交易按 hash 去重)
+                next_block = last_vote_block
+            else:
+                # 没有任何数据时从链头开始 (首次取链头时再定)
+                next_block = None
+
+            logger.info(f"Log indexer started from block {next_block if next_block is not None else 'head'}")
+
+            block_range = LOG_BLOCK_RANGE
+            state_stale = False
             while True:
+                round_votes = 0
                 try:
-                    # 每次循环都检查游戏状态（管理员可能调用了stopBetting/finishGame）
-                    update_game_status()
-                    
-                    transactions = get_contract_transactions_from_etherscan(start_block=last_checked_block + 1)
-                    
-                    if transactions:
-                        new_vote_found = False
-                        for tx in transactions:
-                            tx_hash = tx.get('hash')
-                            if tx_hash in processed_tx_hashes:
+                    head = web3.eth.block_number
+                    confirmed_head = max(0, head - FINALITY_DEPTH)
+                    chain_head_gauge.set(head)
+                    if next_block is None:
+                        next_block = confirmed_head
+                    if not recent_votes.covers(next_block):
+                        load_recent_votes(next_block - 1)
+                    while next_block <= confirmed_head:
+                        to_block = min(next_block + block_range - 1, confirmed_head)
+                        try:
+                            new_votes, state_changed = index_block_range(next_block, to_block)
+                        except Exception as e:
+                            # RPC 节点通常限制单次查询的区块跨度/结果数, 缩小区间重试; 被限流时交给调度器退避
+                            if block_range > 1 and not is_rate_limited(e):
+                                block_range = max(1, block_range // 2)
+                                logger.warning(f"eth_getLogs failed for {next_block}-{to_block}, retrying with range {block_range}: {e}")
                                 continue
-                            
-                            processed_tx_hashes.add(tx_hash)
-                            
-                            if tx.get('isError') == '0' and tx.get('input', '').startswith(VOTE_METHOD_ID):
-                                new_vote_found = True
-                        
-                        if new_vote_found:
-                            print("🚀 New vote detected, updating team stats...")
-                            update_team_stats()
-
-                        last_checked_block = max(int(tx.get('blockNumber')) for tx in transactions)
+                            raise
+                        next_block = to_block + 1
+                        block_range = LOG_BLOCK_RANGE
+                        recent_votes.advance(to_block)
+                        round_votes += new_votes
+
+                        state_stale = state_stale or bool(new_votes or state_changed)
+
+                    # 追上已确认的链头后才同步一次合约状态, 不会把追赶途中的历史状态写回数据库
+                    if state_stale:
+                        logger.info("New contract events, syncing contract state...")
+                        if sync_contract_state(confirmed_head) is not None:
+                            state_stale = False
+
+                    # 未确认的区块每轮都重新读取, 与待确认缓冲对账
+                    buffered = refresh_unconfirmed_votes(next_block, head)
+                    if buffered:
+                        snapshots.rebuild("stats", "teams")
+                        round_votes += buffered
+                    log_poll_scheduler.record_round(round_votes)
+                    indexed_block_gauge.set(next_block - 1)
+                    indexer_lag_gauge.set(head - (next_block - 1))
+                    # 没有新事件时也按数据库状态重试失败的结算
+                    settle_if_needed()
 
                 except Exception as e:
-                    print(f"Error in event loop: {e}")
-                
-                time.sleep(30)
-                
+                    logger.warning(f"Error in event loop: {e}")
+                    log_poll_scheduler.record_error(e)
+
+                status = last_contract_state.status if last_contract_state else None
+                time.sleep(log_poll_scheduler.next_interval(
+                    voting_open=status == 0, terminal=status in GAME_TERMINAL_STATUSES
+                ))
+
+        except Exception as e:
+            logger.exception(f"FATAL: Event listener failed: {e}")
+
+    safe_start_thread("LogIndexer", event_listener)
+
+
+def submit_pending_vote(tx_hash):
+    """把交易哈希写入待校验队列, 返回 queued / duplicate / full 之一"""
+    if db.session.query(func.count(PendingVote.hash)).scalar() >= VOTE_QUEUE_MAX_SIZE:
+        db.session.rollback()
+        return "full"
+    now = time.time()
+    stmt = sqlite_insert(PendingVote).values(hash=tx_hash, submitted_at=now, next_attempt_at=now)
+    inserted = db.session.execute(stmt.on_conflict_do_nothing(index_elements=['hash']).returning(PendingVote.hash)).first()
+    db.session.commit()
+    return "queued" if inserted else "duplicate"
+
+def ingest_submitted_votes():
+    """按回执校验到期的提交交易, 返回写入的投票数 (含待确认)
+
+    已达到确认深度的 NewVote 事件直接入库; 更新的只放进待确认缓冲, 之后由日志
+    索引器对账 (重组时撤回) 并在确认后转入 UserVote.
+    """
+    now = time.time()
+    with ReadSession() as session:
+        due = session.query(PendingVote.hash, PendingVote.submitted_at).filter(
+            PendingVote.next_attempt_at <= now
+        ).order_by(PendingVote.next_attempt_at).limit(VOTE_QUEUE_MAX_SIZE).all()
+    if not due:
+        return 0
+    confirmed_head = web3.eth.block_number - FINALITY_DEPTH
+
+    finished = []
+    deferred = []
+    vote_events = []
+    unconfirmed_events = []
+    for tx_hash, submitted_at in due:
+        try:
+            receipt = web3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            if now - submitted_at > VOTE_RECEIPT_TIMEOUT:
+                logger.warning(f"Dropping submitted tx {tx_hash}: not mined after {VOTE_RECEIPT_TIMEOUT}s")
+                finished.append(tx_hash)
+            else:
+                deferred.append(tx_hash)
+            continue
         except Exception as e:
-            print(f"FATAL: Event listener failed: {e}")
+            logger.warning(f"Error fetching receipt for {tx_hash}: {e}")
+            deferred.append(tx_hash)
+            continue
 
-    safe_start_thread("EtherscanListener", event_listener)
+        finished.append(tx_hash)
+        if receipt["status"] != 1:
+            logger.warning(f"Submitted tx {tx_hash} reverted, ignoring")
+            continue
+        contract_logs = [log for log in receipt["logs"] if log["address"] == contract.address]
+        events = [e for e in event_decoder.decode_many(contract_logs) if e.event == "NewVote"]
+        if not events:
+            logger.warning(f"Submitted tx {tx_hash} has no NewVote event from the contract, ignoring")
+        elif receipt["blockNumber"] > confirmed_head:
+            unconfirmed_events.extend(events)
+        else:
+            vote_events.extend(events)
+
+    unconfirmed_rows = unconfirmed_vote_rows(unconfirmed_events)
+    with app.app_context():
+        saved_count = store_vote_events(vote_events)
+        upsert_unconfirmed_votes(unconfirmed_rows)
+        if finished:
+            db.session.query(PendingVote).filter(PendingVote.hash.in_(finished)).delete(synchronize_session=False)
+        if deferred:
+            db.session.query(PendingVote).filter(PendingVote.hash.in_(deferred)).update(
+                {PendingVote.next_attempt_at: time.time() + VOTE_RECEIPT_RETRY}, synchronize_session=False
+            )
+        db.session.commit()
+    if saved_count:
+        votes_ingested_total.inc(saved_count, source="receipt")
+        logger.info(f"Recorded {saved_count} submitted vote(s)", extra={"event": "receipt_ingest", "votes": saved_count})
+    if unconfirmed_rows:
+        logger.info(
+            f"Buffered {len(unconfirmed_rows)} submitted vote(s) awaiting {FINALITY_DEPTH} confirmations",
+            extra={"event": "receipt_buffered", "votes": len(unconfirmed_rows)},
+        )
+    return saved_count + len(unconfirmed_rows)
+
+def run_vote_ingest_worker():
+    """后台校验 /api/record_vote 提交的交易; 一个间隔内的多笔投票只触发一次统计刷新"""
+    dirty = False
+    last_refresh = 0.0
+    while True:
+        time.sleep(VOTE_POLL_INTERVAL)
+        try:
+            if ingest_submitted_votes():
+                dirty = True
+        except Exception as e:
+            logger.error(f"Error ingesting submitted votes: {e}")
+        if dirty and time.monotonic() - last_refresh >= VOTE_REFRESH_INTERVAL:
+            sync_contract_state()
+            snapshots.rebuild("stats", "teams")
+            dirty = False
+            last_refresh = time.monotonic()
+
+def publish_snapshot_version(name, snapshot):
+    """leader 的共享快照变化后递增版本号, 通知其他 worker"""
+    if not sync_leader.is_leader or name not in SHARED_SNAPSHOTS:
+        return
+    try:
+        with app.app_context():
+            stmt = sqlite_insert(SnapshotVersion).values(name=name, version=1)
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['name'], set_={'version': SnapshotVersion.version + 1}
+            ))
+            db.session.commit()
+    except Exception as e:
+        logger.warning(f"Error publishing snapshot version for {name}: {e}")
+
+snapshots.add_listener(publish_snapshot_version)
+
+def poll_snapshot_versions():
+    """follower: 读取快照版本号, 重建发生变化的本地快照 (同时推送给本进程的 SSE 连接)"""
+    with ReadSession() as session:
+        versions = dict(session.query(SnapshotVersion.name, SnapshotVersion.version))
+    changed = [name for name, version in versions.items() if known_snapshot_versions.get(name) != version]
+    known_snapshot_versions.update(versions)
+    if changed:
+        snapshots.rebuild(*changed)
+    # 新投票一定会改变 stats 快照
+    if not (leaderboard.loaded and vote_flow.loaded) or "stats" in changed:
+        sync_vote_indexes()
+
+def write_leader_heartbeat():
+    with app.app_context():
+        stmt = sqlite_insert(SyncLeader).values(
+            id=1, pid=os.getpid(), phase=startup_state["phase"], ready=startup_state["ready"], heartbeat_at=time.time()
+        )
+        db.session.execute(stmt.on_conflict_do_update(index_elements=['id'], set_={
+            'pid': stmt.excluded.pid, 'phase': stmt.excluded.phase,
+            'ready': stmt.excluded.ready, 'heartbeat_at': stmt.excluded.heartbeat_at,
+        }))
+        db.session.commit()
+
+def run_leader_heartbeat():
+    """leader: 定期写入自己的启动阶段和心跳"""
+    while True:
+        try:
+            write_leader_heartbeat()
+        except Exception as e:
+            logger.warning(f"Error writing leader heartbeat: {e}")
+        time.sleep(LEADER_HEARTBEAT_INTERVAL)
+
+def run_leader_election():
+    """每个 worker 一个: 轮询快照版本号, 并定期尝试成为 leader; 成功后启动同步线程并退出"""
+    last_attempt = 0.0
+    while True:
+        if time.monotonic() - last_attempt >= LEADER_RETRY_INTERVAL:
+            last_attempt = time.monotonic()
+            if sync_leader.try_acquire():
+                logger.info(f"Process {os.getpid()} is the sync leader", extra={"event": "leader_elected"})
+                start_background_threads()
+                return
+        try:
+            poll_snapshot_versions()
+        except Exception as e:
+            logger.warning(f"Error polling snapshot versions: {e}")
+        time.sleep(SNAPSHOT_POLL_INTERVAL)
 
 
 # --- 4. API Endpoints ---
 
 @app.route('/api/voting_history/<user_address>', methods=['GET'])
 def get_user_voting_history(user_address):
-    """获取用户的投票历史和收益计算"""
+    """获取用户的投票历史和收益计算 (读取预计算的 UserPortfolio 和 Settlement)"""
     try:
         # 将地址转换为小写以匹配数据库格式
-        user_address = user_address.lower()
-        
-        game_state = GameState.query.first()
-        teams = Team.query.all()
-        teams_data = [{"id": t.id, "name": t.name} for t in teams]
-        
-        votes = UserVote.query.filter_by(user_address=user_address).all()
-        
-        if not votes:
-            return jsonify({
-                "total_votes": 0, "total_invested_eth": 0,
-                "total_returned_eth": 0, "total_profit_eth": 0,
-                "votes": []
-            })
+        with ReadSession() as session:
+            portfolio = session.get(UserPortfolio, user_address.lower())
+            settlements = session.query(Settlement).filter(
+                Settlement.user_address == user_address.lower()
+            ).order_by(Settlement.team_id).all()
+        return jsonify(voting_history_payload(portfolio, settlements))
+    except Exception as e:
+        logger.error(f"Error getting user voting history: {e}")
+        return jsonify({"error": str(e)}), 500
 
-        total_invested_eth = 0
-        total_returned_eth = 0
-        vote_history = []
-        win_count = 0
+def voting_history_payload(portfolio, settlements):
+    """一个地址的投票历史: 预计算的 UserPortfolio 行和该地址的 Settlement 行"""
+    if not portfolio or not portfolio.total_votes:
+        return {
+            "total_votes": 0, "total_invested_eth": 0,
+            "total_returned_eth": 0, "total_profit_eth": 0,
+            "votes": []
+        }
 
-        for vote in votes:
-            vote_amount_eth = float(web3.from_wei(int(vote.amount_wei), 'ether'))
-            total_invested_eth += vote_amount_eth
+    total_invested_eth = float(web3.from_wei(portfolio.invested_wei, 'ether'))
+    total_returned_eth = float(web3.from_wei(portfolio.returned_wei, 'ether'))
+    return {
+        "total_votes": portfolio.total_votes,
+        "total_invested_eth": total_invested_eth,
+        "total_returned_eth": total_returned_eth,
+        "total_profit_eth": total_returned_eth - total_invested_eth,
+        "win_rate": (portfolio.win_count / portfolio.total_votes) * 100,
+        "votes": json.loads(portfolio.votes_json),
+        # 结算后每个战队可提现的精确金额 (withdraw(teamId)), 未结算时为空
+        "settlement": [settlement_entry(row) for row in settlements],
+    }
 
-            team_info = next((t for t in teams_data if t["id"] == vote.team_id), None)
-            team_name = team_info["name"] if team_info else f"Team {vote.team_id}"
-            
-            status = "Pending"
-            payout = 0
-
-            if game_state and game_state.status == 2: # Finished
-                if vote.team_id == game_state.winning_team_id:
-                    status = "Won"
-                    win_count += 1
-                    try:
-                        total_pool_wei = int(game_state.total_prize_pool)
-                        charity_amount = (total_pool_wei * 10) // 100
-                        total_distributable = total_pool_wei - charity_amount
-                        
-                        winning_team = db.session.get(Team, game_state.winning_team_id)
-                        winner_total_vote = int(winning_team.total_vote_amount) if winning_team else 0
-                        
-                        if winner_total_vote > 0:
-                            payout = (int(vote.amount_wei) * total_distributable) / winner_total_vote
-                        
-                        total_returned_eth += float(web3.from_wei(payout, 'ether'))
-                    except Exception as e:
-                        print(f"Payout calculation error: {e}")
-                else:
-                    status = "Lost"
-            elif game_state and game_state.status == 3: # Refunding
-                status = "Refunded"
-                payout = int(vote.amount_wei) # 全额退款
-                total_returned_eth += vote_amount_eth
-
-            vote_history.append({
-                "team_id": vote.team_id,
-                "team_name": team_name,
-                "amount_eth": vote_amount_eth,
-                "status": status,
-                "payout_eth": float(web3.from_wei(payout, 'ether')),
-                "timestamp": vote.timestamp.isoformat() if vote.timestamp else None
-            })
+def iter_voting_histories(addresses):
+    """按请求顺序逐个产出 NDJSON 行; 每 HISTORY_BATCH_CHUNK_SIZE 个地址各用一条 IN 查询读取汇总和结算"""
+    for i in range(0, len(addresses), HISTORY_BATCH_CHUNK_SIZE):
+        chunk = addresses[i:i + HISTORY_BATCH_CHUNK_SIZE]
+        valid = {a.lower() for a in chunk if isinstance(a, str) and ADDRESS_PATTERN.fullmatch(a.lower())}
+        try:
+            # 每批一个短的读事务, 慢客户端不会让读快照一直占着 WAL
+            with ReadSession() as session:
+                portfolios = {
+                    p.user_address: p
+                    for p in session.query(UserPortfolio).filter(UserPortfolio.user_address.in_(valid))
+                }
+                settlements = {}
+                for row in session.query(Settlement).filter(
+                    Settlement.user_address.in_(valid)
+                ).order_by(Settlement.user_address, Settlement.team_id):
+                    settlements.setdefault(row.user_address, []).append(row)
+                lines = []
+                for raw in chunk:
+                    address = raw.lower() if isinstance(raw, str) else None
+                    if address not in valid:
+                        line = {"address": raw, "error": "invalid address"}
+                    else:
+                        line = {"address": address, **voting_history_payload(
+                            portfolios.get(address), settlements.get(address, [])
+                        )}
+                    lines.append(json.dumps(line, ensure_ascii=False) + "\n")
+        except Exception as e:
+            # 响应头已经发出, 只能以一行错误结束输出
+            logger.error(f"Error streaming voting histories: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+            return
+        yield "".join(lines)
 
-        total_profit_eth = total_returned_eth - total_invested_eth
-        win_rate = (win_count / len(votes)) * 100 if votes else 0
-        
-        return jsonify({
-            "total_votes": len(votes),
-            "total_invested_eth": total_invested_eth,
-            "total_returned_eth": total_returned_eth,
-            "total_profit_eth": total_profit_eth,
-            "win_rate": win_rate,
-            "votes": vote_history
-        })
-    except Exception as e:
-        print(f"Error getting user voting history: {e}")
-        return jsonify({"error": str(e)}), 500
+@app.route('/api/voting_history', methods=['POST'])
+def get_voting_histories():
+    """批量获取多个地址的投票历史, 以 NDJSON 流式返回 (每行一个地址, 顺序与请求一致)"""
+    data = request.get_json(silent=True) or {}
+    addresses = data.get("addresses")
+    if not isinstance(addresses, list) or not addresses:
+        return jsonify({"error": "addresses must be a non-empty list"}), 400
+    if len(addresses) > HISTORY_BATCH_MAX_ADDRESSES:
+        return jsonify({"error": f"at most {HISTORY_BATCH_MAX_ADDRESSES} addresses per request"}), 400
+    response = Response(iter_voting_histories(addresses), mimetype="application/x-ndjson")
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+def settlement_entry(row):
+    return {
+        "team_id": row.team_id,
+        "outcome": row.outcome,
+        "staked_wei": str(row.staked_wei),
+        "payout_wei": str(row.payout_wei),
+        "payout_eth": float(web3.from_wei(row.payout_wei, 'ether')),
+    }
+
+@app.route('/api/settlement', methods=['GET'])
+def get_settlement():
+    """结算汇总和与奖池的核对结果; 比赛尚未结束时 settled 为 false"""
+    with ReadSession() as session:
+        summary = session.get(SettlementSummary, 1)
+    if summary is None:
+        return jsonify({"settled": False})
+    return jsonify({
+        "settled": True,
+        "status": summary.status,
+        "winning_team_id": summary.winning_team_id,
+        "total_reward_pool_wei": str(summary.total_reward_pool),
+        "expected_wei": str(summary.expected_wei),
+        "paid_wei": str(summary.paid_wei),
+        "dust_wei": str(summary.expected_wei - summary.paid_wei),
+        "entry_count": summary.entry_count,
+        "checksum_ok": summary.checksum_ok,
+        "settled_at": summary.settled_at.isoformat(),
+    })
+
+def leaderboard_entry(rank, address, amount_wei, vote_count):
+    return {
+        "rank": rank,
+        "address": address,
+        "amount_eth": float(web3.from_wei(amount_wei, 'ether')),
+        "amount_wei": str(amount_wei),
+        "vote_count": vote_count,
+    }
+
+@app.route('/api/leaderboard', methods=['GET'])
+def get_leaderboard():
+    """按累计投入排序的支持者排行榜 (可按 team_id 过滤), 用上一页的 next_cursor 翻页"""
+    if not leaderboard.loaded:
+        return jsonify({"error": "Leaderboard is loading, please retry later"}), 503
+    try:
+        team_id = request.args.get("team_id")
+        team_id = int(team_id) if team_id is not None else None
+        limit = int(request.args.get("limit", LEADERBOARD_PAGE_SIZE))
+        # 游标为上一页最后一项的 "<投入 wei>:<地址>"
+        cursor = request.args.get("cursor")
+        after = None
+        if cursor:
+            amount_wei, _, address = cursor.partition(":")
+            after = (int(amount_wei), address.lower())
+    except ValueError:
+        return jsonify({"error": "team_id and limit must be integers and cursor must be a next_cursor value"}), 400
+    if not 1 <= limit <= LEADERBOARD_MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {LEADERBOARD_MAX_PAGE_SIZE}"}), 400
+
+    total, rows = leaderboard.page(team_id, limit, after)
+    next_cursor = None
+    if len(rows) == limit and rows[-1][0] < total:
+        next_cursor = f"{rows[-1][2]}:{rows[-1][1]}"
+    return jsonify({
+        "team_id": team_id,
+        "total_addresses": total,
+        "entries": [leaderboard_entry(*row) for row in rows],
+        "next_cursor": next_cursor,
+    })
+
+@app.route('/api/leaderboard/<user_address>', methods=['GET'])
+def get_leaderboard_rank(user_address):
+    """一个地址的全局名次和各战队名次"""
+    if not leaderboard.loaded:
+        return jsonify({"error": "Leaderboard is loading, please retry later"}), 503
+    address = user_address.lower()
+    overall, teams = leaderboard.ranks(address)
+    return jsonify({
+        "address": address,
+        "overall": leaderboard_entry(overall[0], address, overall[1], overall[2]) if overall else None,
+        "teams": [
+            dict(leaderboard_entry(rank, address, amount_wei, vote_count), team_id=team_id)
+            for team_id, (rank, amount_wei, vote_count) in sorted(teams.items())
+        ],
+    })
+
+@app.route('/api/vote_flow', methods=['GET'])
+def get_vote_flow():
+    """各战队按时间分桶的投票数和投入 (只含已确认投票), 服务端按 points 降采样
+
+    参数: from / to (Unix 秒, 默认第一笔到最后一笔投票), resolution (minute / hour / day,
+    默认自动选择), points (最多返回的桶数), team_id (可选)
+    """
+    if not vote_flow.loaded:
+        return jsonify({"error": "Vote flow is loading, please retry later"}), 503
+    try:
+        end = int(request.args.get("to", vote_flow.latest_timestamp or time.time()))
+        start = int(request.args.get("from", vote_flow.first_timestamp or end))
+        points = int(request.args.get("points", VOTE_FLOW_POINTS))
+        team_id = request.args.get("team_id")
+        team_ids = [int(team_id)] if team_id is not None else None
+    except ValueError:
+        return jsonify({"error": "from, to, points and team_id must be integers"}), 400
+    resolution = request.args.get("resolution")
+    if resolution not in (None, "minute", "hour", "day"):
+        return jsonify({"error": "resolution must be minute, hour or day"}), 400
+    if start > end or not 1 <= points <= VOTE_FLOW_MAX_POINTS:
+        return jsonify({"error": f"from must not be after to, points must be between 1 and {VOTE_FLOW_MAX_POINTS}"}), 400
+    # 区间限制在有数据的范围内, 超长区间不会生成大量空桶
+    if vote_flow.first_timestamp is not None:
+        start = min(max(start, vote_flow.first_timestamp), end)
+        end = max(min(end, max(vote_flow.latest_timestamp, int(time.time()))), start)
+
+    result = vote_flow.query(start, end, points, resolution, team_ids)
+    teams = [{
+        "team_id": team["team_id"],
+        "vote_counts": team["vote_counts"],
+        "amount_eth": [gwei / GWEI_PER_ETH for gwei in team["stakes_gwei"]],
+        "cumulative_amount_eth": [gwei / GWEI_PER_ETH for gwei in team["cumulative_gwei"]],
+    } for team in result["teams"]]
+    return jsonify(dict(result, teams=teams))
 
 @app.route('/api/record_vote', methods=['POST'])
 def record_vote():
-    """记录用户投票"""
-    data = request.get_json()
-    # ... (与旧版 record_bet 类似的逻辑, 但使用新变量)
+    """提交投票交易哈希; 后台按回执校验后入库, 接口立即返回"""
+    data = request.get_json(silent=True) or {}
+    tx_hash = str(data.get('txHash') or '').lower()
+    if not TX_HASH_PATTERN.fullmatch(tx_hash):
+        return jsonify({"error": "txHash must be a 0x-prefixed 32-byte hex string"}), 400
+
+    with ReadSession() as session:
+        recorded = session.query(UserVote.id).filter_by(hash=tx_hash).first() is not None
+    if recorded:
+        return jsonify({"message": "Vote already recorded", "status": "recorded", "txHash": tx_hash})
+
+    result = submit_pending_vote(tx_hash)
+    if result == "full":
+        return jsonify({"error": "Vote queue is full, please retry later"}), 503
+    return jsonify({"message": "Vote queued for verification", "status": result, "txHash": tx_hash}), 202
+
+stats_price = None  # stats 快照最后使用的 (价格, 来源)
+
+def on_eth_price_refreshed(quote):
+    """价格刷新后重建 eth_price 快照; stats 不含报价时间, 只在价格或来源变化时重建"""
+    global stats_price
     try:
-        new_vote = UserVote(
-            user_address=data.get('userAddress').lower(),  # 统一转换为小写
-            team_id=data.get('teamId'),
-            amount_wei=data.get('amount'),
-            hash=data.get('txHash'),
-            timestamp=datetime.now(timezone.utc)
-        )
-        db.session.add(new_vote)
-        db.session.commit()
-        
-        print("🚀 New vote recorded, triggering stats update...")
-        update_team_stats()
-        
-        return jsonify({"message": "Vote recorded and stats updated successfully", "vote_id": new_vote.id})
+        snapshots.rebuild("eth_price")
+        if (quote.price, quote.source) != stats_price:
+            stats_price = (quote.price, quote.source)
+            snapshots.rebuild("stats")
     except Exception as e:
-        print(f"❌ Error recording vote: {e}")
-        db.session.rollback()
-        return jsonify({"error": str(e)}), 500
+        logger.warning(f"Error rebuilding price snapshots: {e}")
 
-def get_eth_price_usd():
-    # This is a helper from the old app, simplified for stats
-    try:
-        response = requests.get("https://api.binance.com/api/v3/ticker/price?symbol=ETHUSDT", timeout=5)
-        response.raise_for_status()
-        return float(response.json()["price"])
-    except:
-        return 3000.0 # Fallback
+price_service.add_listener(on_eth_price_refreshed)
 
 def get_weapon_image(weapon_name):
     """根据武器全名映射到简化的图片文件名"""
@@ -365,155 +1733,187 @@ def get_weapon_image(weapon_name):
     }
     return weapon_img_mapping.get(weapon_name, "/skins/default.webp")
 
+# 武器hash_name列表
+WEAPON_NAMES = [
+    "AWP | Dragon Lore (Factory New)",
+    "★ Butterfly Knife | Crimson Web (Factory New)",
+    "★ Karambit | Gamma Doppler (Factory New)",
+    "★ Sport Gloves | Nocts (Field-Tested)",
+    "StatTrak™ AK-47 | Vulcan (Well-Worn)",
+    "M4A4 | Hellish (Minimal Wear)",
+    "Souvenir Galil AR | CAUTION! (Factory New)",
+    "Crasswater The Forgotten | Guerrilla Warfare",
+    "StatTrak™ Music Kit | TWERL and Ekko & Sidetrack, Under Bright Lights",
+    "MAC-10 | Tatter (Well-Worn)",
+    "Tec-9 | Groundwater (Battle-Scarred)",
+]
+
+# 平台优先级
+WEAPON_PLATFORM_PRIORITY = ["BUFF", "C5", "YOUPIN", "STEAM"]
+
+# 武器价格抓取: 共享 keep-alive 连接池 + 有界线程池 + 按主机限速 + 总时限
+WEAPON_FETCH_WORKERS = int(os.getenv("WEAPON_FETCH_WORKERS", "4"))
+WEAPON_FETCH_DEADLINE = float(os.getenv("WEAPON_FETCH_DEADLINE", "30"))  # 整次抓取的总时限 (秒)
+WEAPON_FETCH_RATE = float(os.getenv("WEAPON_FETCH_RATE", "5"))  # 每个主机每秒最多请求数
+weapon_http = requests.Session()
+weapon_http.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=WEAPON_FETCH_WORKERS))
+
+def rate_limited_get(url, timeout):
+    """经按主机的调用预算后通过共享会话发起 GET 请求"""
+    budget = upstreams.get(urllib.parse.urlsplit(url).hostname, WEAPON_FETCH_RATE)
+    with budget.call(timeout=timeout):
+        response = weapon_http.get(url, timeout=timeout)
+        response.raise_for_status()
+    return response
+
+def fetch_cny_usd_rate():
+    """获取CNY到USD汇率"""
+    exchange_response = rate_limited_get("https://api.frankfurter.app/latest?from=CNY&to=USD", timeout=5)
+    return exchange_response.json()['rates']['USD']
+
+def fetch_weapon_price_cny(weapon_name):
+    """从bufftracker API获取单个武器的人民币价格, 返回 (价格, 平台), 没有有效价格时价格为 None"""
+    # URL编码武器名称
+    encoded_name = urllib.parse.quote(weapon_name)
+    api_url = f"https://buffotte.hezhili.online/api/bufftracker/price/{encoded_name}"
+    
+    response = rate_limited_get(api_url, timeout=10)
+    result = response.json()
+    
+    # 从响应中提取价格数据
+    # API返回格式: {"data": [{"platform": "BUFF", "sellPrice": 123, "sellCount": 5}, ...]}
+    price_data_list = result.get('data', [])
+    
+    # 如果data是列表，转换为字典
+    if isinstance(price_data_list, list):
+        price_data = {}
+        for item in price_data_list:
+            platform = item.get('platform', '')
+            if platform:
+                price_data[platform] = item
+    else:
+        price_data = price_data_list
+    
+    # 按优先级选择平台价格, 优先平台没有价格时尝试任何有效价格
+    platforms = WEAPON_PLATFORM_PRIORITY + [p for p in price_data if p not in WEAPON_PLATFORM_PRIORITY]
+    for platform in platforms:
+        platform_info = price_data.get(platform)
+        if not platform_info:
+            continue
+        sell_price = platform_info.get('sellPrice', 0)
+        sell_count = platform_info.get('sellCount', 0)
+        if sell_price > 0 and sell_count > 0:
+            return sell_price, platform
+    return None, None
+
 def update_weapon_prices():
-    """从bufftracker API更新武器价格数据"""
-    print("\n🔄 Updating weapon prices from bufftracker API...")
+    """从bufftracker API并发更新武器价格数据, 结果一次性批量写入"""
+    logger.info("Updating weapon prices from bufftracker API...")
+    started = time.monotonic()
     
-    # 武器hash_name列表
-    weapon_names = [
-        "AWP | Dragon Lore (Factory New)",
-        "★ Butterfly Knife | Crimson Web (Factory New)",
-        "★ Karambit | Gamma Doppler (Factory New)",
-        "★ Sport Gloves | Nocts (Field-Tested)",
-        "StatTrak™ AK-47 | Vulcan (Well-Worn)",
-        "M4A4 | Hellish (Minimal Wear)",
-        "Souvenir Galil AR | CAUTION! (Factory New)",
-        "Crasswater The Forgotten | Guerrilla Warfare",
-        "StatTrak™ Music Kit | TWERL and Ekko & Sidetrack, Under Bright Lights",
-        "MAC-10 | Tatter (Well-Worn)",
-        "Tec-9 | Groundwater (Battle-Scarred)",
-    ]
+    executor = ThreadPoolExecutor(max_workers=WEAPON_FETCH_WORKERS, thread_name_prefix="weapon-price")
+    rate_future = executor.submit(fetch_cny_usd_rate)
+    futures = {executor.submit(fetch_weapon_price_cny, name): name for name in WEAPON_NAMES}
+    done, not_done = wait([rate_future, *futures], timeout=WEAPON_FETCH_DEADLINE)
+    executor.shutdown(wait=False, cancel_futures=True)
     
-    # 获取CNY到USD汇率
     exchange_rate = 0.14  # 默认汇率
     try:
-        exchange_response = requests.get(
-            "https://api.frankfurter.app/latest?from=CNY&to=USD",
-            timeout=5
-        )
-        if exchange_response.status_code == 200:
-            exchange_rate = exchange_response.json()['rates']['USD']
-            print(f"  ✓ Exchange rate: 1 CNY = {exchange_rate} USD")
+        if rate_future in done:
+            exchange_rate = rate_future.result()
+            logger.debug(f"Exchange rate: 1 CNY = {exchange_rate} USD")
+        else:
+            logger.warning("Exchange rate request timed out, using default")
     except Exception as e:
-        print(f"  ⚠ Failed to get exchange rate, using default: {e}")
+        logger.warning(f"Failed to get exchange rate, using default: {e}")
     
-    # 平台优先级
-    PLATFORM_PRIORITY = ["BUFF", "C5", "YOUPIN", "STEAM"]
+    now = datetime.now(timezone.utc)
+    rows = []
+    failed_count = 0
+    for future, weapon_name in futures.items():
+        if future not in done:
+            logger.warning(f"{weapon_name[:50]}... Timed out after {WEAPON_FETCH_DEADLINE:g}s")
+            failed_count += 1
+            continue
+        try:
+            price_cny, selected_platform = future.result()
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == 404:
+                logger.warning(f"{weapon_name[:50]}... Not found in API (404)")
+            else:
+                logger.error(f"{weapon_name[:50]}... HTTP Error: {e}")
+            failed_count += 1
+            continue
+        except Exception as e:
+            logger.error(f"{weapon_name[:50]}... Error: {e}")
+            failed_count += 1
+            continue
+        
+        if price_cny and price_cny > 0:
+            # 转换为USD
+            price_usd = price_cny * exchange_rate
+            rows.append({"hash_name": weapon_name, "price_usd": price_usd, "last_updated": now})
+            logger.debug(f"{weapon_name[:50]}... [{selected_platform}]: ¥{price_cny:.2f} → ${price_usd:.2f}")
+        else:
+            logger.warning(f"{weapon_name[:50]}... No valid price data")
+            failed_count += 1
     
     with app.app_context():
-        updated_count = 0
-        failed_count = 0
-        
-        for weapon_name in weapon_names:
-            try:
-                # URL编码武器名称
-                encoded_name = urllib.parse.quote(weapon_name)
-                api_url = f"https://buffotte.hezhili.online/api/bufftracker/price/{encoded_name}"
-                
-                response = requests.get(api_url, timeout=10)
-                response.raise_for_status()
-                result = response.json()
-                
-                # 从响应中提取价格数据
-                # API返回格式: {"data": [{"platform": "BUFF", "sellPrice": 123, "sellCount": 5}, ...]}
-                price_data_list = result.get('data', [])
-                price_cny = None
-                selected_platform = None
-                
-                # 如果data是列表，转换为字典
-                if isinstance(price_data_list, list):
-                    price_data = {}
-                    for item in price_data_list:
-                        platform = item.get('platform', '')
-                        if platform:
-                            price_data[platform] = item
-                else:
-                    price_data = price_data_list
-                
-                # 按优先级选择平台价格
-                for platform in PLATFORM_PRIORITY:
-                    if platform in price_data:
-                        platform_info = price_data[platform]
-                        sell_price = platform_info.get('sellPrice', 0)
-                        sell_count = platform_info.get('sellCount', 0)
-                        
-                        if sell_price > 0 and sell_count > 0:
-                            price_cny = sell_price
-                            selected_platform = platform
-                            break
-                
-                # 如果优先平台没有价格，尝试任何有效价格
-                if price_cny is None:
-                    for platform, platform_info in price_data.items():
-                        sell_price = platform_info.get('sellPrice', 0)
-                        sell_count = platform_info.get('sellCount', 0)
-                        
-                        if sell_price > 0 and sell_count > 0:
-                            price_cny = sell_price
-                            selected_platform = platform
-                            break
-                
-                if price_cny and price_cny > 0:
-                    # 转换为USD
-                    price_usd = price_cny * exchange_rate
-                    
-                    # 更新数据库
-                    weapon = Weapon.query.filter_by(hash_name=weapon_name).first()
-                    if weapon:
-                        weapon.price_usd = price_usd
-                        weapon.last_updated = datetime.now(timezone.utc)
-                    else:
-                        weapon = Weapon(
-                            hash_name=weapon_name,
-                            price_usd=price_usd,
-                            last_updated=datetime.now(timezone.utc)
-                        )
-                        db.session.add(weapon)
-                    
-                    updated_count += 1
-                    print(f"  ✓ {weapon_name[:50]}... [{selected_platform}]: ¥{price_cny:.2f} → ${price_usd:.2f}")
-                else:
-                    print(f"  ⚠ {weapon_name[:50]}... No valid price data")
-                    failed_count += 1
-                    
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 404:
-                    print(f"  ⚠ {weapon_name[:50]}... Not found in API (404)")
-                else:
-                    print(f"  ❌ {weapon_name[:50]}... HTTP Error: {e}")
-                failed_count += 1
-            except Exception as e:
-                print(f"  ❌ {weapon_name[:50]}... Error: {e}")
-                failed_count += 1
-        
-        db.session.commit()
-        print(f"\n✓ Updated {updated_count} weapon prices")
-        if failed_count > 0:
-            print(f"⚠ Failed to update {failed_count} weapons (will keep cached prices if available)")
+        try:
+            if rows:
+                current = {w.hash_name: w.price_usd for w in Weapon.query.all()}
+                changed = any(current.get(r["hash_name"]) != r["price_usd"] for r in rows)
+                # 单条多行 upsert 写入所有价格
+                stmt = sqlite_insert(Weapon).values(rows)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[Weapon.hash_name],
+                    set_={"price_usd": stmt.excluded.price_usd, "last_updated": stmt.excluded.last_updated},
+                )
+                db.session.execute(stmt)
+                db.session.commit()
+                if changed:
+                    snapshots.rebuild("stats")
+        except Exception as e:
+            logger.error(f"Error saving weapon prices: {e}")
+            db.session.rollback()
+    
+    logger.info(f"Updated {len(rows)} weapon prices in {time.monotonic() - started:.1f}s")
+    if failed_count > 0:
+        logger.warning(f"Failed to update {failed_count} weapons (will keep cached prices if available)")
 
 
 
 
-@app.route('/api/stats', methods=['GET'])
-def get_stats():
-    """获取全局统计数据"""
-    try:
-        total_unique_participants = db.session.query(UserVote.user_address).distinct().count()
-        total_votes = UserVote.query.count()
+def build_stats_snapshot():
+    """构建 /api/stats 的快照数据"""
+    with ReadSession() as session:
+        counters = {c.name: c.value for c in session.query(StatsCounter)}
+        total_unique_participants = counters.get("unique_participants", 0)
+        total_votes = counters.get("total_votes", 0)
+        # total_* 只含已确认的投票, pending_* 是最近 FINALITY_DEPTH 个区块内、可能被重组撤回的投票
+        unconfirmed = get_unconfirmed_totals(session)
+        team_totals = [{
+            "team_id": t.team_id,
+            "total_votes": t.vote_count,
+            "total_amount_eth": float(web3.from_wei(t.amount_wei, 'ether')),
+            "pending_votes": unconfirmed.get(t.team_id, (0, 0))[0],
+            "pending_amount_eth": float(web3.from_wei(unconfirmed.get(t.team_id, (0, 0))[1], 'ether')),
+        } for t in session.query(TeamVoteTotal).order_by(TeamVoteTotal.team_id)]
         
-        game_state = GameState.query.first()
+        game_state = session.query(GameState).first()
         total_prize_pool_eth = 0
         if game_state and game_state.total_prize_pool:
-            total_prize_pool_eth = float(web3.from_wei(int(game_state.total_prize_pool), 'ether'))
+            total_prize_pool_eth = float(web3.from_wei(game_state.total_prize_pool, 'ether'))
         
         # 计算武器等价物
         weapon_equivalents = []
+        eth_quote = price_service.current()
+        eth_price_usd = eth_quote.price
         try:
-            eth_price_usd = get_eth_price_usd()
             total_prize_pool_usd = total_prize_pool_eth * eth_price_usd
             
             # 获取所有武器数据
-            weapons = Weapon.query.all()
+            weapons = session.query(Weapon).all()
             
             for weapon in weapons:
                 if weapon.price_usd > 0:
@@ -534,254 +1934,490 @@ def get_stats():
             weapon_equivalents.sort(key=lambda x: x['price_usd'])
             
         except Exception as e:
-            print(f"⚠️ Error calculating weapon equivalents: {e}")
+            logger.warning(f"Error calculating weapon equivalents: {e}")
             weapon_equivalents = []
 
-        return jsonify({
+        return {
             "total_unique_participants": total_unique_participants,
             "total_votes": total_votes,
+            "pending_votes": sum(count for count, _ in unconfirmed.values()),
+            "pending_amount_eth": float(web3.from_wei(sum(wei for _, wei in unconfirmed.values()), 'ether')),
+            "finality_depth": FINALITY_DEPTH,
+            "team_totals": team_totals,
             "total_prize_pool_eth": total_prize_pool_eth,
+            "eth_price_usd": eth_price_usd,
+            "eth_price_source": eth_quote.source,
             "weapon_equivalents": weapon_equivalents
-        })
+        }
+
+def format_unix_time(ts):
+    """Unix 时间戳转 ISO 字符串, 0 (从未获取) 返回 None"""
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat() if ts else None
+
+def build_eth_price_snapshot():
+    """构建 /api/eth_price 的快照数据 (含最近的价格历史)"""
+    quote = price_service.current()
+    return {
+        "symbol": "ETHUSD",
+        "price": str(quote.price),
+        "source": quote.source,
+        "updated_at": format_unix_time(quote.fetched_at),
+        "history": [{"price": q.price, "time": format_unix_time(q.fetched_at)} for q in price_service.history()],
+    }
+
+def build_status_snapshot():
+    """构建 /api/status 的快照数据"""
+    with ReadSession() as session:
+        state = session.query(GameState).first()
+        if not state:
+            return {
+                "status": 0, "status_text": "Open",
+                "total_prize_pool_eth": 0, "winning_team_id": None
+            }
+        
+        return {
+            "status": state.status,
+            "status_text": GAME_STATUS_MAP.get(state.status, "Unknown"),
+            "total_prize_pool_eth": float(web3.from_wei(state.total_prize_pool or 0, 'ether')),
+            "winning_team_id": state.winning_team_id
+        }
+
+def build_teams_snapshot():
+    """构建 /api/teams 的快照数据"""
+    with ReadSession() as session:
+        teams = session.query(Team).order_by(Team.id).all()
+        unconfirmed = get_unconfirmed_totals(session)
+        result = []
+        
+        for t in teams:
+            pending_votes, pending_wei = unconfirmed.get(t.id, (0, 0))
+            result.append({
+                "id": t.id,
+                "name": t.name,
+                "logo_url": get_logo_url(t.name),
+                "total_vote_amount_eth": float(web3.from_wei(t.total_vote_amount or 0, 'ether')),
+                "supporter_count": t.supporter_count,
+                "pending_vote_count": pending_votes,
+                "pending_vote_amount_eth": float(web3.from_wei(pending_wei, 'ether')),
+            })
+        return result
+
+def odds_payload(status, table):
+    return {
+        "status": status,
+        "total_prize_pool_wei": str(table.pool_wei),
+        "distributable_wei": str(table.distributable_wei),
+        "teams": [{
+            "team_id": team.team_id,
+            "total_vote_amount_wei": str(team.total_wei),
+            "implied_multiplier": team.multiplier,
+            "payout_per_eth_wei": str(team.payout_per_eth_wei),
+        } for team in table.teams],
+    }
+
+def build_odds_snapshot():
+    """构建 /api/odds 的快照数据, 同时更新内存中的赔率表 (假设投入的收益由它计算)"""
+    global current_odds
+    with ReadSession() as session:
+        state = session.query(GameState).first()
+        totals = {t.id: t.total_vote_amount or 0 for t in session.query(Team)}
+    current_odds = (state.status if state else 0, OddsTable(state.total_prize_pool or 0 if state else 0, totals))
+    return odds_payload(*current_odds)
+
+snapshots.register("stats", build_stats_snapshot)
+snapshots.register("status", build_status_snapshot)
+snapshots.register("teams", build_teams_snapshot)
+snapshots.register("eth_price", build_eth_price_snapshot)
+snapshots.register("odds", build_odds_snapshot)
+# 赔率只依赖战队累计和奖池: 这两个快照变化时才重算 (follower 重建它们时同样触发)
+snapshots.add_listener(lambda name, snapshot: name in ("teams", "status") and snapshots.rebuild("odds"))
+
+def snapshot_response(name):
+    """返回预序列化的快照, 支持 If-None-Match / 304"""
+    snapshot = snapshots.peek(name)
+    result = "hit"
+    if snapshot is None:
+        snapshot = snapshots.get(name)
+        result = "miss"
+    response = Response(snapshot.body, mimetype="application/json")
+    response.set_etag(snapshot.etag)
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        result = "not_modified"
+    snapshot_requests_total.inc(snapshot=name, result=result)
+    return response
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """获取全局统计数据"""
+    try:
+        return snapshot_response("stats")
     except Exception as e:
-        # 详细记录错误，以便调试
-        import traceback
-        print(f"❌❌❌ CRITICAL ERROR in get_stats: {e}")
-        traceback.print_exc()
+        # 详细记录错误 (含堆栈)，以便调试
+        logger.exception(f"CRITICAL ERROR in get_stats: {e}")
         return jsonify({"error": "An internal error occurred while fetching stats."}), 500
 
 @app.route('/api/status', methods=['GET'])
 def get_status():
     """获取当前游戏状态和奖池"""
-    state = GameState.query.first()
-    if not state:
-        return jsonify({
-            "status": 0, "status_text": "Open",
-            "total_prize_pool_eth": 0, "winning_team_id": None
-        })
-    
-    return jsonify({
-        "status": state.status,
-        "status_text": GAME_STATUS_MAP.get(state.status, "Unknown"),
-        "total_prize_pool_eth": float(web3.from_wei(int(state.total_prize_pool), 'ether')),
-        "winning_team_id": state.winning_team_id
-    })
+    return snapshot_response("status")
+
+@app.route('/api/eth_price', methods=['GET'])
+def get_eth_price():
+    """获取缓存的 ETH/USD 价格 (age_seconds 为报价距今的秒数)"""
+    quote = price_service.current()
+    payload = build_eth_price_snapshot()
+    payload["age_seconds"] = round(quote.age, 1) if quote.fetched_at else None
+    return jsonify(payload)
 
 @app.route('/api/teams', methods=['GET'])
 def get_teams():
     """获取所有战队列表及当前支持率数据"""
-    teams = Team.query.order_by(Team.id).all()
-    result = []
-    
-    for t in teams:
-        result.append({
-            "id": t.id,
-            "name": t.name,
-            "logo_url": get_logo_url(t.name),
-            "total_vote_amount_eth": float(web3.from_wei(int(t.total_vote_amount), 'ether')),
-            "supporter_count": t.supporter_count
-        })
-    return jsonify(result)
+    return snapshot_response("teams")
+
+@app.route('/api/odds', methods=['GET'])
+def get_odds():
+    """各战队的隐含赔率; amounts=0.1,1 (ETH) 时再给出在每个战队投入这些金额且获胜时的应得金额
+
+    全部为 wei 整数计算, 赔率表缓存到战队累计或奖池变化为止.
+    """
+    raw_amounts = request.args.get("amounts")
+    if not raw_amounts:
+        return snapshot_response("odds")
+    try:
+        amounts_wei = [int(Decimal(a.strip()) * WEI_PER_ETH) for a in raw_amounts.split(",")]
+    except (InvalidOperation, ValueError, OverflowError):
+        return jsonify({"error": "amounts must be comma-separated ETH values"}), 400
+    if not 1 <= len(amounts_wei) <= ODDS_MAX_AMOUNTS or min(amounts_wei) <= 0:
+        return jsonify({"error": f"amounts must be 1 to {ODDS_MAX_AMOUNTS} positive ETH values"}), 400
+
+    if current_odds is None:
+        snapshots.get("odds")
+    status, table = current_odds
+    payouts = table.payouts(amounts_wei)
+    payload = odds_payload(status, table)
+    for team in payload["teams"]:
+        team["scenarios"] = [{
+            "amount_wei": str(amount),
+            "payout_wei": str(payout),
+            "payout_eth": float(web3.from_wei(payout, 'ether')),
+            "multiplier": payout / amount,
+        } for amount, payout in zip(amounts_wei, payouts[team["team_id"]])]
+    return jsonify(payload)
+
+@app.route('/api/stream', methods=['GET'])
+def stream():
+    """SSE 推送: 连接时先发送当前快照, 之后只在数据变化时推送"""
+    initial_messages = []
+    for name in ("teams", "status", "stats"):
+        snapshot = snapshots.get(name)
+        initial_messages.append(format_sse(name, snapshot.body, snapshot.etag))
+
+    response = Response(
+        event_broker.stream(initial_messages, heartbeat_interval=STREAM_HEARTBEAT_INTERVAL),
+        mimetype="text/event-stream",
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # 关闭反向代理缓冲
+    return response
 
 # --- 5. 工具与辅助函数 ---
 
-def get_contract_transactions_from_etherscan(start_block=0):
-    """从Etherscan API获取合约的所有交易 - 按照官方文档格式"""
-    # 根据官方文档: https://docs.etherscan.io/api-reference/endpoint/txlist
-    API_URL = f"https://api.etherscan.io/v2/api"
+def get_contract_logs_from_etherscan(from_block=0, to_block='latest', page=1, offset=1000):
+    """从 Etherscan logs API 获取合约的 NewVote 日志 (按区块升序)
+
+    只有 "No records found" 返回空列表; 出错、被限流或返回其他错误时按指数退避重试,
+    重试用完后抛出 requests.RequestException, 调用方不会把失败当成已经没有日志.
+    """
     params = {
         'chainid': '11155111',  # Sepolia chainid
-        'module': 'account',
-        'action': 'txlist',
+        'module': 'logs',
+        'action': 'getLogs',
         'address': CONTRACT_ADDRESS,
-        'startblock': str(start_block),
-        'endblock': '99999999',
-        'page': '1',
-        'offset': '100',  # 获取最近100条
-        'sort': 'desc',  # 从最新到最旧
+        'fromBlock': str(from_block),
+        'toBlock': str(to_block),
+        'topic0': NEW_VOTE_EVENT_TOPIC,
+        'page': str(page),
+        'offset': str(offset),  # 每页条数 (最多 1000)
         'apikey': ETHERSCAN_API_KEY
     }
-    try:
-        response = requests.get(API_URL, params=params, timeout=15)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data['status'] == '1':
-            transactions = data['result']
-            vote_txs = [tx for tx in transactions if tx.get('input', '').startswith(VOTE_METHOD_ID)]
-            if vote_txs:
-                print(f"🎯 Found {len(vote_txs)} vote transaction(s)")
-            return transactions
-        else:
-            if data.get('message') != 'No transactions found':
-                print(f"⚠️ Etherscan API: {data.get('message', 'Unknown error')}")
-            return []
-    except requests.RequestException as e:
-        print(f"❌ Etherscan API request failed: {e}")
-        return []
+    backoff = Backoff(1, 60)
+    for attempt in range(ETHERSCAN_MAX_RETRIES + 1):
+        time.sleep(backoff.delay())
+        try:
+            with etherscan_budget.call():
+                response = requests.get(ETHERSCAN_API_URL, params=params, timeout=15)
+                response.raise_for_status()
+                data = response.json()
+                if data['status'] != '1' and data.get('message') != 'No records found':
+                    raise requests.RequestException(
+                        f"Etherscan API error: {data.get('message', 'Unknown error')}: {data.get('result')}"
+                    )
+        except requests.RequestException as e:
+            error = e
+            logger.error(f"Etherscan API request failed (attempt {attempt + 1}): {e}")
+            backoff.failure(rate_limited=is_rate_limited(e))
+            continue
+        return data['result'] if data['status'] == '1' else []
+    raise requests.RequestException(f"Etherscan API failed after {ETHERSCAN_MAX_RETRIES + 1} attempts: {error}")
 
-def save_all_user_votes_to_database():
-    """使用Etherscan API保存所有用户的投票记录到数据库"""
-    try:
-        transactions = get_contract_transactions_from_etherscan()
-        if not transactions:
+def iter_contract_log_pages(from_block=0, to_block='latest', page_size=ETHERSCAN_PAGE_SIZE):
+    """按区块升序遍历合约在 [from_block, to_block] 内的全部 NewVote 日志, 每次产出一页"""
+    page = 1
+    while True:
+        logs = get_contract_logs_from_etherscan(from_block=from_block, to_block=to_block, page=page, offset=page_size)
+        if not logs:
+            return
+        yield logs
+        if len(logs) < page_size:
             return
 
-        with app.app_context():
-            saved_count = 0
-            for tx in transactions:
-                if tx.get('isError') == '0' and tx.get('input', '').startswith(VOTE_METHOD_ID):
-                    tx_hash = tx.get('hash')
-                    existing_vote = UserVote.query.filter_by(hash=tx_hash).first()
-                    if not existing_vote:
-                        try:
-                            # 解码 input data 来获取 teamId
-                            input_data = tx.get('input', '')
-                            team_id = int(input_data[len(VOTE_METHOD_ID):], 16)
-
-                            new_vote = UserVote(
-                                user_address=tx.get('from').lower(),  # 统一转换为小写
-                                team_id=team_id,
-                                amount_wei=tx.get('value'),
-                                block_number=tx.get('blockNumber'),
-                                timestamp=datetime.fromtimestamp(int(tx.get('timeStamp')), tz=timezone.utc),
-                                hash=tx_hash,
-                                nonce=tx.get('nonce'),
-                                block_hash=tx.get('blockHash'),
-                                transaction_index=tx.get('transactionIndex'),
-                                gas=tx.get('gas'),
-                                gas_price=tx.get('gasPrice'),
-                                is_error=tx.get('isError'),
-                                tx_receipt_status=tx.get('txreceipt_status'),
-                                input_data=input_data,
-                                contract_address=tx.get('to'),
-                                cumulative_gas_used=tx.get('cumulativeGasUsed'),
-                                gas_used=tx.get('gasUsed'),
-                                confirmations=tx.get('confirmations'),
-                                method_id=tx.get('methodId'),
-                                function_name=tx.get('functionName')
-                            )
-                            db.session.add(new_vote)
-                            db.session.commit()
-                            saved_count += 1
-                        except Exception as e:
-                            print(f"  ❌ Error saving tx {tx_hash[:10]}...: {e}")
-                            db.session.rollback()
-            if saved_count > 0:
-                print(f"✅ Saved {saved_count} new voting record(s)")
+        # Etherscan 限制 page * offset <= 10000, 所以从本页最后一个区块重新开始翻页;
+        # 边界区块会被重复拉取, 由交易哈希去重. 同一区块超过一页时才递增页码.
+        last_block = int(logs[-1]['blockNumber'], 16)
+        if last_block > from_block:
+            from_block, page = last_block, 1
+        else:
+            page += 1
+
+def bulk_insert_votes(rows):
+    """多行 INSERT ... ON CONFLICT(hash) DO NOTHING 批量写入投票, 返回实际插入的行"""
+    inserted_hashes = set()
+    for i in range(0, len(rows), BACKFILL_BATCH_SIZE):
+        stmt = sqlite_insert(UserVote).values(rows[i:i + BACKFILL_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_nothing(index_elements=['hash']).returning(UserVote.hash)
+        inserted_hashes.update(db.session.execute(stmt).scalars())
+    return [row for row in rows if row['hash'] in inserted_hashes]
+
+def save_all_user_votes_to_database(start_block=None):
+    """使用 Etherscan logs API 分页回填所有用户的投票记录到数据库
+
+    每页日志按 ABI 批量解码, 只做一次基于集合的去重查询和若干条多行 INSERT,
+    并和回填进度一起在一个事务中提交. start_block 为 None 时从上次的进度继续
+    (页尾区块可能只回填了一部分, 所以从该区块重新开始, 重复的投票由去重跳过).
+    返回新写入的投票数; 没有回填到已确认的链头 (读取链头、Etherscan 或某一页的解码/
+    写入失败) 时在失败的那一页停下并返回 None, 进度停在最后提交的一页, 下次从这里继续.
+    """
+    if start_block is None:
+        start_block = get_sync_checkpoint(BACKFILL_CHECKPOINT) or 0
+    # 只回填已达到确认深度的区块, 更新的投票由日志索引器经待确认缓冲处理
+    try:
+        confirmed_head = web3.eth.block_number - FINALITY_DEPTH
     except Exception as e:
-        print(f"❌ Error saving user votes to database: {e}")
+        logger.error(f"Cannot read chain head, skipping backfill: {e}")
+        return None
+    started = time.monotonic()
+    scanned_count = 0
+    saved_count = 0
+    complete = True
+    with app.app_context():
+        try:
+            for logs in iter_contract_log_pages(start_block, confirmed_head):
+                vote_events = [e for e in event_decoder.decode_many(logs) if e.event == "NewVote"]
+                scanned_count += len(vote_events)
+                page_saved = store_vote_events(vote_events)
+                if logs:
+                    set_sync_checkpoint(BACKFILL_CHECKPOINT, int(logs[-1]['blockNumber'], 16))
+                db.session.commit()
+                saved_count += page_saved
+        except Exception as e:
+            db.session.rollback()
+            complete = False
+            logger.error(f"Backfill stopped after {saved_count} new vote(s), will resume from the checkpoint: {e}")
+
+    elapsed = time.monotonic() - started
+    if saved_count > 0:
+        snapshots.rebuild("stats")
+        rate = saved_count / elapsed if elapsed > 0 else float(saved_count)
+        votes_ingested_total.inc(saved_count, source="backfill")
+        logger.info(
+            f"Saved {saved_count} new voting record(s) ({scanned_count} scanned) in {elapsed:.2f}s, {rate:.0f} rows/s",
+            extra={"event": "backfill", "votes": saved_count, "scanned": scanned_count, "seconds": round(elapsed, 3)},
+        )
+    return saved_count if complete else None
+
+@app.cli.command("backfill")
+@click.option("--start-block", default=None, type=int, help="从该区块开始回填 (默认从上次的进度继续)")
+def backfill_command(start_block):
+    """从 Etherscan 批量回填全部历史投票"""
+    init_database()
+    save_all_user_votes_to_database(start_block=start_block)
 
 def safe_start_thread(name, target, *args, **kwargs):
     """安全地启动后台线程"""
     acquired = bg_thread_semaphore.acquire(blocking=False)
     if not acquired:
-        print(f"Skipping starting {name}: max background threads reached")
+        logger.warning(f"Skipping starting {name}: max background threads reached")
         return None
 
     def wrapper(*a, **k):
         global bg_running_count
         with bg_count_lock:
             bg_running_count += 1
-        print(f"🧵 Thread '{name}' started.")
+        logger.info(f"Thread '{name}' started.")
         try:
             target(*a, **k)
         except Exception as e:
-            print(f"💥 Unhandled exception in thread '{name}': {e}")
+            logger.exception(f"Unhandled exception in thread '{name}': {e}")
         finally:
             with bg_count_lock:
                 bg_running_count -= 1
             bg_thread_semaphore.release()
-            print(f"🧵 Thread '{name}' finished.")
+            logger.debug(f"Thread '{name}' finished.")
 
     thread = threading.Thread(name=name, target=wrapper, args=args, kwargs=kwargs, daemon=True)
     thread.start()
     return thread
 
+def set_startup_phase(phase, **extra):
+    """更新启动阶段, 并立即写入 leader 心跳, 让其他 worker 的 /ready 不必等下一次心跳"""
+    startup_state.update(phase=phase, **extra)
+    if sync_leader.is_leader:
+        try:
+            write_leader_heartbeat()
+        except Exception as e:
+            logger.warning(f"Error writing leader heartbeat: {e}")
+
+def run_startup_sync():
+    """后台启动同步: 合约状态 → 汇总表 → 历史回填 → 日志索引器
+
+    期间接口直接使用数据库中已持久化的数据, /ready 报告当前阶段.
+    """
+    set_startup_phase("syncing_contract")
+    sync_contract_state()
+
+    set_startup_phase("rebuilding_aggregates")
+    with app.app_context():
+        ensure_user_portfolios()
+    sync_vote_indexes()
+
+    set_startup_phase("backfilling")
+    save_all_user_votes_to_database()
+
+    setup_event_listeners()
+    set_startup_phase("ready", ready=True, ready_at=time.time())
+    elapsed = startup_state['ready_at'] - startup_state['started_at']
+    logger.info(f"Startup sync finished in {elapsed:.1f}s", extra={"event": "startup_ready", "seconds": round(elapsed, 3)})
+
 def start_background_threads():
-    """启动后台线程 (只执行一次)"""
+    """启动 leader 的同步线程 (只执行一次)"""
     global threads_started
     if not threads_started:
-        print("🔄 Starting background sync...")
-        save_all_user_votes_to_database()
-        setup_event_listeners()
         threads_started = True
+        logger.info("Starting background sync...")
+        safe_start_thread("LeaderHeartbeat", run_leader_heartbeat)
+        safe_start_thread("WeaponPriceFetcher", update_weapon_prices)
+        safe_start_thread("StartupSync", run_startup_sync)
+        safe_start_thread("VoteIngestWorker", run_vote_ingest_worker)
 
 # --- 6. 启动应用 ---
 
-# 使用 before_first_request 的替代方案
-_initialized = False
+def startup():
+    """进程启动入口: 同步打开数据库 (只建表, 毫秒级), 其余同步全部放到后台
 
-@app.before_request
-def initialize_app():
-    global _initialized
-    if _initialized:
-        return
-    
-    _initialized = True
-    # 确保数据库和表已创建
+    gunicorn 在每个 worker 启动后调用 (见 gunicorn.conf.py), 开发模式由 __main__ 调用.
+    每个进程都刷新自己的 ETH 价格缓存; 合约/数据库同步只在选出的 leader 进程里运行.
+    """
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
     with app.app_context():
-        db.create_all()
-    
-    # 首次请求时启动后台线程
-    start_background_threads()
+        init_database()
+    startup_state["phase"] = "starting"
+    safe_start_thread("EthPriceRefresher", price_service.run_forever, ETH_PRICE_REFRESH_INTERVAL)
+    safe_start_thread("MetricsDumper", metrics.run_dumper, METRICS_DUMP_INTERVAL)
+    safe_start_thread("LeaderElection", run_leader_election)
+
+@app.route('/health', methods=['GET'])
+def health():
+    """存活探针: 进程能响应请求即可"""
+    return jsonify({"status": "ok"})
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.db_queries = 0
+
+@app.after_request
+def record_request_metrics(response):
+    """按路由模板 (而不是具体 URL) 记录耗时和数据库查询数, 标签数量保持有界"""
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    started = g.get("request_started")
+    if started is not None:
+        http_request_seconds.observe(
+            time.perf_counter() - started, endpoint=endpoint, method=request.method, status=response.status_code
+        )
+    http_request_db_queries.observe(g.get("db_queries", 0), endpoint=endpoint)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus 抓取入口: 合并全部 worker 的指标"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/api/upstreams', methods=['GET'])
+def upstream_stats():
+    """本进程对各上游的调用次数、错误/限流次数和预算使用, 以及日志索引器的轮询调度状态"""
+    return jsonify({
+        "role": "leader" if sync_leader.is_leader else "follower",
+        "upstreams": upstreams.stats(),
+        "log_poll": log_poll_scheduler.stats(),
+    })
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """就绪探针: leader 启动同步完成前 (或 leader 心跳超时) 返回 503 并报告当前阶段"""
+    if sync_leader.is_leader:
+        is_ready, phase, leader_pid = startup_state["ready"], startup_state["phase"], os.getpid()
+    else:
+        with ReadSession() as session:
+            leader = session.get(SyncLeader, 1)
+        alive = leader is not None and time.time() - leader.heartbeat_at < 3 * LEADER_HEARTBEAT_INTERVAL
+        is_ready = alive and leader.ready
+        phase = leader.phase if alive else "waiting_for_leader"
+        leader_pid = leader.pid if alive else None
+    body = {
+        "ready": is_ready,
+        "role": "leader" if sync_leader.is_leader else "follower",
+        "phase": phase,
+        "leader_pid": leader_pid,
+        "uptime_seconds": round(time.time() - startup_state["started_at"], 1),
+        "indexed_block": get_sync_checkpoint(LOG_INDEXER_CHECKPOINT),
+    }
+    return jsonify(body), 200 if is_ready else 503
 
 def auto_reset_database():
-    """自动重置数据库（保留武器名称）"""
+    """重置数据库（保留武器价格）, 只由 migrate_db.py reset 手动调用
+
+    运行中的 worker 在内存中按 UserVote.id 水位维护排行榜、投票流量等索引, 清空后
+    id 会从头开始, 所以要求先停止服务: 能拿到同步 leader 锁才说明没有 worker 在运行,
+    并且在重置期间一直持有, 不会有 worker 同时开始同步.
+    """
     print("=" * 60)
-    print("🔄 AUTO DATABASE RESET ON STARTUP")
+    print("🔄 DATABASE RESET")
     print("=" * 60)
-    
+
+    if not sync_leader.try_acquire():
+        print("❌ The server is running (another process holds the sync leader lock), stop it before resetting")
+        return False
+
     with app.app_context():
-        # Step 1: Backup weapon names
-        print(f"\n[1/4] Backing up weapon names...")
-        weapon_names = []
-        try:
-            weapons = Weapon.query.all()
-            weapon_names = [w.hash_name for w in weapons]
-            print(f"✓ Backed up {len(weapon_names)} weapon names")
-        except Exception as e:
-            print(f"⚠ Could not backup weapons: {e}")
-        
-        # Step 2: Clear all tables (except weapon names)
-        print(f"\n[2/4] Clearing table data...")
-        
-        # Clear UserVote table
-        try:
-            deleted = db.session.query(UserVote).delete()
-            print(f"  ✓ Cleared {deleted} user votes")
-        except Exception as e:
-            print(f"  ⚠ Error clearing user votes: {e}")
-        
-        # Clear Team table
-        try:
-            deleted = db.session.query(Team).delete()
-            print(f"  ✓ Cleared {deleted} teams")
-        except Exception as e:
-            print(f"  ⚠ Error clearing teams: {e}")
-        
-        # Clear GameState table
-        try:
-            deleted = db.session.query(GameState).delete()
-            print(f"  ✓ Cleared {deleted} game states")
-        except Exception as e:
-            print(f"  ⚠ Error clearing game states: {e}")
-        
+        # Step 1: 除武器价格缓存外, 其余表都由投票、合约状态或运行状态派生, 全部清空
+        print("\n[1/3] Clearing table data...")
+        for table in reversed(db.metadata.sorted_tables):
+            if table.name == Weapon.__tablename__:
+                continue
+            deleted = db.session.execute(table.delete()).rowcount
+            print(f"  ✓ Cleared {deleted} row(s) from {table.name}")
         db.session.commit()
         
-        # Step 2.5: Update weapon prices (instead of clearing)
-        print(f"\n[2.5/4] Updating weapon prices...")
-        update_weapon_prices()
-        
-        # Step 3: Initialize GameState
-        print("\n[3/4] Initializing game state...")
+        # Step 2: Initialize GameState
+        print("\n[2/3] Initializing game state...")
         # 检查是否已存在GameState
         game_state = GameState.query.filter_by(id=1).first()
         if not game_state:
             game_state = GameState(
                 id=1,
                 status=0,
-                total_prize_pool="0",
+                total_prize_pool=0,
                 winning_team_id=None
             )
             db.session.add(game_state)
@@ -790,13 +2426,13 @@ def auto_reset_database():
         else:
             # 如果已存在，重置为初始状态
             game_state.status = 0
-            game_state.total_prize_pool = "0"
+            game_state.total_prize_pool = 0
             game_state.winning_team_id = None
             db.session.commit()
             print("✓ Game state reset to initial state")
         
-        # Step 4: Sync teams from contract
-        print("\n[4/4] Syncing teams from contract...")
+        # Step 3: Sync teams from contract
+        print("\n[3/3] Syncing teams from contract...")
         try:
             teams_data = contract.functions.getTeams().call()
             print(f"Found {len(teams_data)} teams in contract")
@@ -806,7 +2442,7 @@ def auto_reset_database():
                 team = Team(
                     id=int(team_id),
                     name=name,
-                    total_vote_amount="0",
+                    total_vote_amount=0,
                     supporter_count=0
                 )
                 db.session.add(team)
@@ -822,31 +2458,11 @@ def auto_reset_database():
     print("\n" + "=" * 60)
     print("✅ DATABASE RESET COMPLETE!")
     print("=" * 60)
+    return True
 
 if __name__ == '__main__':
-    # 在运行 app 之前，确保 instance 文件夹存在
-    instance_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
-    if not os.path.exists(instance_path):
-        os.makedirs(instance_path)
-    
-    # 初始化数据库
-    with app.app_context():
-        db.create_all()
-        print("✅ Database tables created")
-        
-        # 🔥 每次启动时自动重置数据库
-        auto_reset_database()
-        
-        # 同步合约状态
-        print("\n🔄 Syncing contract data...")
-        update_team_stats()
-        update_game_status()
-        
-        # 启动时同步历史数据
-        print("🔄 Syncing historical data...")
-        save_all_user_votes_to_database()
-        
-        # 启动事件监听
-        setup_event_listeners()
-    
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    # 启动时不再清空数据库, 已有数据立即可用; 需要清库时运行 python migrate_db.py reset
+    startup()
+
+    # 关闭 reloader, 避免父子进程各启动一套后台线程
+    app.run(host='0.0.0.0', port=5001, debug=True, use_reloader=False)
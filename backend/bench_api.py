@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""接口与入库基准 (本地替身)
+
+在临时目录里新建数据库, RPC 节点、Etherscan 和行情接口都由本进程内的 HTTP
+替身应答 (不访问外网), 然后:
+- 入库: 替身 Etherscan 提供 --ingest-votes 条 NewVote 日志, 在空库上运行
+  save_all_user_votes_to_database, 测回填的入库吞吐
+- 读取: 其余投票直接批量写入 (总计 --votes 条, 分布在 --addresses 个地址上),
+  重建汇总表后用多个线程并发请求 /api/teams、/api/stats、/api/status 和
+  /api/voting_history/<地址>, 统计每个接口的吞吐和 p50/p99 延迟 (Flask
+  test client, 不含网络和 gunicorn 的开销)
+
+--json 时输出一个 JSON 对象, 便于保存后对比回归.
+
+用法:
+    python bench_api.py [--votes 100000] [--addresses 10000] [--ingest-votes 20000]
+                        [--duration 5] [--threads 8] [--json]
+"""
+import argparse
+import bisect
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from eth_abi import encode
+from eth_utils import function_signature_to_4byte_selector
+from sqlalchemy import insert
+
+from log_decoder import EventDecoder
+
+CONTRACT_ADDRESS = "0xb5c4bea741cea63b2151d719b2cca12e80e6c7e8"
+TEAMS = 8
+WEAPONS = 40
+VOTES_PER_BLOCK = 5
+FIRST_BLOCK = 1_000_000
+FIRST_TIMESTAMP = 1_700_000_000
+ETH_PRICE = 3000.0
+SEED_BATCH_SIZE = 10000
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "abi.json")) as f:
+    NEW_VOTE_TOPIC = EventDecoder(json.load(f), {"NewVote"}).topic_by_event["NewVote"]
+
+
+def synthetic_vote(i, addresses):
+    """第 i 笔合成投票; 地址按质数步长打散, 每个地址的投票分布在整个区块区间里"""
+    block = FIRST_BLOCK + i // VOTES_PER_BLOCK
+    return {
+        "user_address": "0x" + format((i * 7919) % addresses + 1, "040x"),
+        "team_id": i % TEAMS,
+        "amount_wei": 10 ** 15 * (i % 97 + 1),
+        "block_number": block,
+        "timestamp": FIRST_TIMESTAMP + 12 * (block - FIRST_BLOCK),
+        "hash": "0x" + format(i + 1, "064x"),
+    }
+
+
+def etherscan_log(vote, log_index):
+    """Etherscan logs API 格式的 NewVote 日志"""
+    return {
+        "address": CONTRACT_ADDRESS,
+        "topics": [NEW_VOTE_TOPIC, "0x" + "00" * 12 + vote["user_address"][2:]],
+        "data": "0x" + encode(["uint256", "uint256"], [vote["team_id"], vote["amount_wei"]]).hex(),
+        "blockNumber": hex(vote["block_number"]),
+        "blockHash": "0x" + format(vote["block_number"], "064x"),
+        "timeStamp": hex(vote["timestamp"]),
+        "transactionHash": vote["hash"],
+        "logIndex": hex(log_index),
+    }
+
+
+class FakeUpstreams:
+    """RPC 节点 (JSON-RPC POST)、Etherscan logs API (GET /etherscan) 和行情接口 (GET /price) 的替身"""
+
+    def __init__(self):
+        self.head = FIRST_BLOCK
+        self.teams = [(team_id, f"Team {team_id}", 0, 0) for team_id in range(TEAMS)]
+        self.prize_pool = 0
+        self.logs = []
+        self._log_blocks = []
+        self.requests = {"rpc": 0, "etherscan": 0, "price": 0}
+        self._server = None
+
+    def set_logs(self, logs):
+        self.logs = logs
+        self._log_blocks = [int(log["blockNumber"], 16) for log in logs]
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                fake.requests["rpc"] += 1
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if isinstance(request, list):
+                    self.send_json([fake.rpc(r) for r in request])
+                else:
+                    self.send_json(fake.rpc(request))
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/etherscan":
+                    fake.requests["etherscan"] += 1
+                    self.send_json(fake.etherscan({k: v[0] for k, v in parse_qs(url.query).items()}))
+                elif url.path == "/price":
+                    fake.requests["price"] += 1
+                    self.send_json({"price": str(ETH_PRICE)})
+                else:
+                    self.send_error(404)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self):
+        self._server.shutdown()
+
+    def rpc(self, request):
+        method, params = request["method"], request.get("params", [])
+        if method == "eth_chainId":
+            result = "0xaa36a7"
+        elif method == "eth_blockNumber":
+            result = hex(self.head)
+        elif method == "eth_call":
+            result = "0x" + self.contract_call(params[0]["data"][2:10]).hex()
+        elif method == "eth_getLogs":
+            result = []
+        elif method == "eth_getBlockByNumber":
+            number = int(params[0], 16) if params[0] not in ("latest", "safe", "finalized") else self.head
+            result = {"number": hex(number), "hash": "0x" + format(number, "064x"),
+                      "timestamp": hex(FIRST_TIMESTAMP + 12 * (number - FIRST_BLOCK))}
+        else:
+            return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32601, "message": f"{method} not supported"}}
+        return {"jsonrpc": "2.0", "id": request["id"], "result": result}
+
+    def contract_call(self, selector):
+        calls = {
+            "status()": lambda: encode(["uint8"], [0]),
+            "totalRewardPool()": lambda: encode(["uint256"], [self.prize_pool]),
+            "winningTeamId()": lambda: encode(["uint256"], [0]),
+            "getTeams()": lambda: encode(["(uint256,string,uint256,uint256)[]"], [self.teams]),
+        }
+        for signature, result in calls.items():
+            if function_signature_to_4byte_selector(signature).hex() == selector:
+                return result()
+        raise ValueError(f"unknown selector {selector}")
+
+    def etherscan(self, params):
+        """按区块区间过滤、按 page / offset 分页, 与 Etherscan 的 getLogs 一致"""
+        to_block = self.head if params["toBlock"] == "latest" else int(params["toBlock"])
+        lo = bisect.bisect_left(self._log_blocks, int(params["fromBlock"]))
+        hi = bisect.bisect_right(self._log_blocks, to_block)
+        page, offset = int(params["page"]), int(params["offset"])
+        start = lo + (page - 1) * offset
+        logs = self.logs[start:min(hi, start + offset)]
+        if not logs:
+            return {"status": "0", "message": "No records found", "result": []}
+        return {"status": "1", "message": "OK", "result": logs}
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def bench_ingest(app_module, fake, votes, addresses):
+    """在空库上从替身 Etherscan 回填 votes 笔投票"""
+    fake.set_logs([etherscan_log(synthetic_vote(i, addresses), i % VOTES_PER_BLOCK) for i in range(votes)])
+    fake.head = FIRST_BLOCK + votes // VOTES_PER_BLOCK + app_module.FINALITY_DEPTH + 1
+    started = time.perf_counter()
+    saved = app_module.save_all_user_votes_to_database(start_block=0)
+    elapsed = time.perf_counter() - started
+    return {
+        "votes": votes,
+        "saved": saved,
+        "seconds": round(elapsed, 3),
+        "rows_per_s": round(saved / elapsed, 1) if elapsed > 0 else None,
+        "etherscan_pages": fake.requests["etherscan"],
+    }
+
+
+def seed_votes(app_module, fake, start, votes, addresses):
+    """直接批量写入 [start, votes) 的合成投票, 重建汇总表并同步替身合约的战队/奖池"""
+    A = app_module
+    started = time.perf_counter()
+    with A.app.app_context():
+        for batch_start in range(start, votes, SEED_BATCH_SIZE):
+            rows = []
+            for i in range(batch_start, min(votes, batch_start + SEED_BATCH_SIZE)):
+                vote = synthetic_vote(i, addresses)
+                vote["timestamp"] = datetime.fromtimestamp(vote["timestamp"], tz=timezone.utc)
+                rows.append(vote)
+            A.db.session.execute(insert(A.UserVote), rows)
+            A.db.session.commit()
+
+        A.db.session.add_all(A.Weapon(hash_name=f"Weapon {n}", price_usd=0.5 * (n + 1) ** 2) for n in range(WEAPONS))
+        A.rebuild_user_portfolios()
+        A.rebuild_stats_counters()
+        A.db.session.commit()
+        totals = {t.team_id: t.amount_wei for t in A.TeamVoteTotal.query.all()}
+
+    fake.teams = [(team_id, f"Team {team_id}", totals.get(team_id, 0), addresses // TEAMS) for team_id in range(TEAMS)]
+    fake.prize_pool = sum(totals.values())
+    A.sync_contract_state()
+    A.snapshots.rebuild()
+    return round(time.perf_counter() - started, 3)
+
+
+def bench_endpoint(flask_app, path_for, duration, threads):
+    """threads 个线程在 duration 秒内循环请求 path_for(i), 返回吞吐和延迟分位数"""
+    latencies, errors = [], []
+
+    def worker(offset):
+        client = flask_app.test_client()
+        i = offset
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            response = client.get(path_for(i))
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+            i += threads
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "requests_per_s": round(len(latencies) / duration, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        "errors": len(errors),
+    }
+
+
+def run(votes, addresses, ingest_votes, duration, threads):
+    workdir = tempfile.mkdtemp(prefix="bench_api_")
+    fake = FakeUpstreams()
+    base_url = fake.start()
+    # app 在导入时读取配置, 所以先指向临时库和替身
+    os.environ.update({
+        "DATABASE_PATH": os.path.join(workdir, "bench.db"),
+        "METRICS_DIR": os.path.join(workdir, "metrics"),
+        "RPC_URL": base_url,
+        "ETHERSCAN_API_URL": f"{base_url}/etherscan",
+        "CONTRACT_ADDRESS": CONTRACT_ADDRESS,
+    })
+    # 不测上游预算本身, 默认放开限速 (显式设置的环境变量优先)
+    os.environ.setdefault("RPC_RATE_LIMIT", "100000")
+    os.environ.setdefault("ETHERSCAN_RATE_LIMIT", "100000")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    try:
+        import app as A
+        from price_service import PriceService
+
+        def fetch_local(session, timeout):
+            response = session.get(f"{base_url}/price", timeout=timeout)
+            response.raise_for_status()
+            return float(response.json()["price"])
+
+        with A.app.app_context():
+            A.init_database()
+        A.price_service = PriceService(sources=(("local", fetch_local),))
+        A.price_service.refresh()
+
+        ingest_votes = min(ingest_votes, votes)
+        ingest = bench_ingest(A, fake, ingest_votes, addresses)
+        seed_seconds = seed_votes(A, fake, ingest_votes, votes, addresses)
+
+        endpoints = {
+            "teams": lambda i: "/api/teams",
+            "stats": lambda i: "/api/stats",
+            "status": lambda i: "/api/status",
+            "voting_history": lambda i: f"/api/voting_history/0x{(i * 7919) % addresses + 1:040x}",
+        }
+        results = {name: bench_endpoint(A.app, path_for, duration, threads) for name, path_for in endpoints.items()}
+    finally:
+        fake.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "config": {
+            "votes": votes, "addresses": addresses, "ingest_votes": ingest_votes,
+            "duration": duration, "threads": threads, "python": sys.version.split()[0],
+        },
+        "seed_seconds": seed_seconds,
+        "ingest": ingest,
+        "endpoints": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API latency and ingest throughput against local stand-ins")
+    parser.add_argument("--votes", type=int, default=100000, help="total votes in the database (1k to 1M)")
+    parser.add_argument("--addresses", type=int, default=10000, help="distinct voter addresses")
+    parser.add_argument("--ingest-votes", type=int, default=20000, help="votes ingested through the Etherscan backfill")
+    parser.add_argument("--duration", type=float, default=5, help="seconds per endpoint")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent client threads")
+    parser.add_argument("--json", action="store_true", help="print the results as one JSON object")
+    args = parser.parse_args()
+
+    result = run(args.votes, args.addresses, args.ingest_votes, args.duration, args.threads)
+    if args.json:
+        print(json.dumps(result))
+    else:
+        ingest = result["ingest"]
+        print(f"seeded {args.votes} votes / {args.addresses} addresses in {result['seed_seconds']}s")
+        print(f"ingest: {ingest['saved']} votes in {ingest['seconds']}s, {ingest['rows_per_s']} rows/s "
+              f"({ingest['etherscan_pages']} Etherscan pages)")
+        for name, r in result["endpoints"].items():
+            print(f"{name:>15}: {r['requests_per_s']} req/s p50={r['p50_ms']}ms p99={r['p99_ms']}ms errors={r['errors']}")
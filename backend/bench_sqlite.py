@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""写负载下的并发读基准
+
+对比默认的 SQLite 连接 (回滚日志, 读写同一种连接) 和 db_config 的配置
+(WAL + 只读引擎 + 单写者): 一个独立进程持续写入投票 (模拟另一个 gunicorn
+worker 的同步线程), 本进程的多个线程做 /api/voting_history 式的点查和汇总查询.
+
+用法:
+    python bench_sqlite.py [--rows 50000] [--duration 10] [--readers 8] [--json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, func, insert, select, update
+
+import db_config
+
+metadata = MetaData()
+votes = Table(
+    "user_vote", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_address", String(42), index=True),
+    Column("team_id", Integer, index=True),
+    Column("amount_wei", String(32)),
+    Column("hash", String(66), unique=True),
+)
+counters = Table(
+    "stats_counter", metadata,
+    Column("name", String(50), primary_key=True),
+    Column("value", Integer, nullable=False),
+)
+
+ADDRESSES = 2000
+
+
+def address(i):
+    return "0x" + format(i % ADDRESSES, "040x")
+
+
+def vote_row(i):
+    return {"user_address": address(i), "team_id": i % 8, "amount_wei": format(10 ** 15 * (i % 97 + 1), "032d"),
+            "hash": "0x" + format(i, "064x")}
+
+
+def make_engines(url, tuned):
+    if not tuned:
+        engine = create_engine(url)
+        return engine, engine
+    writer = db_config.configure_write_engine(create_engine(url, **db_config.engine_options()))
+    return writer, db_config.create_read_engine(url)
+
+
+def seed(url, rows):
+    engine, _ = make_engines(url, tuned=False)
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        for start in range(0, rows, 5000):
+            conn.execute(insert(votes), [vote_row(i) for i in range(start, min(rows, start + 5000))])
+        conn.execute(insert(counters), [{"name": "total_votes", "value": rows}])
+    engine.dispose()
+
+
+def writer_process(url, tuned, start_id, duration, batch_size, result_queue):
+    """持续写入: 每个事务插入一批投票并更新计数器"""
+    engine, _ = make_engines(url, tuned)
+    commits = errors = 0
+    next_id = start_id
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(votes), [vote_row(i) for i in range(next_id, next_id + batch_size)])
+                conn.execute(update(counters).where(counters.c.name == "total_votes")
+                             .values(value=counters.c.value + batch_size))
+            next_id += batch_size
+            commits += 1
+        except Exception:
+            errors += 1
+    result_queue.put({"write_txns": commits, "write_errors": errors, "rows_written": next_id - start_id})
+
+
+def reader_thread(engine, duration, latencies, errors):
+    i = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(select(votes).where(votes.c.user_address == address(i))).fetchall()
+                conn.execute(select(votes.c.team_id, func.count()).where(votes.c.team_id == i % 8)
+                             .group_by(votes.c.team_id)).fetchall()
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            errors.append(1)
+        i += 7
+
+
+def run(mode, rows, duration, readers, batch_size):
+    tuned = mode == "tuned"
+    workdir = tempfile.mkdtemp(prefix="bench_sqlite_")
+    url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    seed(url, rows)
+
+    _, read_engine = make_engines(url, tuned)
+    result_queue = multiprocessing.Queue()
+    writer = multiprocessing.Process(target=writer_process, args=(url, tuned, rows, duration, batch_size, result_queue))
+    latencies, errors = [], []
+    threads = [threading.Thread(target=reader_thread, args=(read_engine, duration, latencies, errors))
+               for _ in range(readers)]
+
+    writer.start()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    write_result = result_queue.get()
+    writer.join()
+    read_engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "read_ops_per_s": round(len(latencies) / duration, 1),
+        "read_p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "read_p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2) if latencies else None,
+        "read_errors": len(errors),
+        "write_txns_per_s": round(write_result["write_txns"] / duration, 1),
+        "write_errors": write_result["write_errors"],
+        "rows_written": write_result["rows_written"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent SQLite reads under write load")
+    parser.add_argument("--rows", type=int, default=50000, help="votes seeded before the run")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per mode")
+    parser.add_argument("--readers", type=int, default=8, help="reader threads")
+    parser.add_argument("--batch-size", type=int, default=50, help="votes per write transaction")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per mode")
+    args = parser.parse_args()
+
+    for mode in ("default", "tuned"):
+        result = run(mode, args.rows, args.duration, args.readers, args.batch_size)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(f"{mode:>8}: reads {result['read_ops_per_s']}/s p50={result['read_p50_ms']}ms "
+                  f"p99={result['read_p99_ms']}ms errors={result['read_errors']} | "
+                  f"writes {result['write_txns_per_s']} txn/s errors={result['write_errors']}")
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""合约状态批量读取
+
+把 status / totalRewardPool / winningTeamId / getTeams 四个只读调用合并成一次
+JSON-RPC 批量请求, 全部固定在同一个区块上执行, 得到一致的状态快照.
+"""
+import logging
+import time
+from typing import NamedTuple
+
+from web3.exceptions import BadResponseFormat
+
+logger = logging.getLogger(__name__)
+
+# 每次读取的合约函数, 顺序与 ContractState 字段对应
+STATE_CALLS = ("status", "totalRewardPool", "winningTeamId", "getTeams")
+
+# 节点拒绝批量请求后改用逐个调用的时长, 之后再试一次 (换了节点或节点升级后恢复批量)
+BATCH_RETRY_INTERVAL = 3600
+
+
+def batch_unsupported(error):
+    """批量请求失败是否因为节点不支持批量 (而不是超时、限流等临时错误)
+
+    不支持批量的节点对整个批次只返回一个错误对象或无法解析的响应, 错误信息通常提到 batch.
+    """
+    if isinstance(error, (NotImplementedError, BadResponseFormat)):
+        return True
+    return "batch" in str(error).lower()
+
+
+class ContractState(NamedTuple):
+    """某个区块上的合约状态"""
+    block_number: int
+    status: int
+    total_reward_pool: int
+    winning_team_id: int
+    teams: tuple  # ((team_id, name, total_vote_amount, supporter_count), ...)
+
+    def same_as(self, other):
+        """除区块号外内容是否相同"""
+        return other is not None and self[1:] == other[1:]
+
+
+class ContractStateReader:
+    """批量读取合约状态; RPC 节点不支持批量请求时退回逐个调用, 一段时间后再尝试批量
+
+    临时错误 (超时、限流等) 只让这一次读取改用逐个调用, 不影响之后的批量请求.
+    """
+
+    def __init__(self, web3, contract, finality_depth=0):
+        self._web3 = web3
+        self._contract = contract
+        self.finality_depth = finality_depth
+        self._batch_disabled_until = 0.0
+
+    @property
+    def batching(self):
+        return time.monotonic() >= self._batch_disabled_until
+
+    def read(self, block_number=None):
+        """读取指定区块 (默认为已确认的最新区块: 链头 - finality_depth) 的合约状态"""
+        if block_number is None:
+            block_number = max(0, self._web3.eth.block_number - self.finality_depth)
+
+        results = None
+        if self.batching:
+            try:
+                results = self._read_batch(block_number)
+            except Exception as e:
+                if batch_unsupported(e):
+                    self._batch_disabled_until = time.monotonic() + BATCH_RETRY_INTERVAL
+                    logger.warning(
+                        f"RPC node does not support batch requests, using single calls for {BATCH_RETRY_INTERVAL}s: {e}"
+                    )
+                else:
+                    logger.warning(f"JSON-RPC batch failed, retrying with single calls: {e}")
+        if results is None:
+            results = self._read_single(block_number)
+
+        status, pool, winner, teams = results
+        return ContractState(
+            block_number=block_number,
+            status=int(status),
+            total_reward_pool=int(pool),
+            winning_team_id=int(winner),
+            teams=tuple((int(t[0]), t[1], int(t[2]), int(t[3])) for t in teams),
+        )
+
+    def _read_batch(self, block_number):
+        with self._web3.batch_requests() as batch:
+            for name in STATE_CALLS:
+                batch.add(getattr(self._contract.functions, name)().call(block_identifier=block_number))
+            return batch.execute()
+
+    def _read_single(self, block_number):
+        return [getattr(self._contract.functions, name)().call(block_identifier=block_number) for name in STATE_CALLS]
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""SQLite 连接配置
+
+每个新连接都会设置 WAL、synchronous=NORMAL、busy_timeout 和 mmap_size.
+读写分离:
+- 写引擎 (Flask-SQLAlchemy 的 db.session) 的事务以 BEGIN IMMEDIATE 开始, 并在进程内
+  串行化: 同一进程同一时刻只有一个写事务, 其余写线程在 Python 锁上排队 (gevent 下
+  是协作式等待), 不会在 SQLite 里忙等或因锁升级失败而报 "database is locked".
+- 读引擎只读 (query_only), 事务为普通 BEGIN; WAL 模式下读不阻塞写, 写也不阻塞读.
+"""
+import os
+import sqlite3
+import threading
+
+from sqlalchemy import create_engine, event
+
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),  # WAL 下只在检查点时 fsync, 断电最多丢最后几个事务, 不会损坏
+    ("busy_timeout", BUSY_TIMEOUT_MS),
+    ("mmap_size", MMAP_SIZE),
+    ("temp_store", "MEMORY"),
+)
+
+
+def engine_options():
+    """传给 create_engine / SQLALCHEMY_ENGINE_OPTIONS 的参数"""
+    return {
+        # 事务由下面的 begin 事件显式开始, pysqlite 自己不再隐式 BEGIN
+        "connect_args": {"timeout": BUSY_TIMEOUT_MS / 1000, "check_same_thread": False, "isolation_level": None},
+    }
+
+
+def apply_pragmas(dbapi_connection, readonly=False):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {name} = {value}")
+        if readonly:
+            cursor.execute("PRAGMA query_only = ON")
+    finally:
+        cursor.close()
+
+
+def configure_write_engine(engine):
+    """写引擎: 每个连接设置 PRAGMA, 每个事务持有进程内写锁并以 BEGIN IMMEDIATE 开始"""
+    writer_lock = threading.Lock()
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection)
+
+    @event.listens_for(engine, "begin")
+    def on_begin(conn):
+        if not writer_lock.acquire(timeout=BUSY_TIMEOUT_MS / 1000):
+            raise sqlite3.OperationalError("database is locked (timed out waiting for the writer lock)")
+        try:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        except Exception:
+            writer_lock.release()
+            raise
+        conn.info["holds_writer_lock"] = True
+
+    # commit / rollback 事件在 DBAPI 提交之前触发: 先在 DBAPI 连接上提交或回滚, SQLite
+    # 释放写锁之后再释放进程内写锁, 否则下一个写者的 BEGIN IMMEDIATE 会在 SQLite 里忙等.
+    # 之后 SQLAlchemy 自己的 commit / rollback 没有打开的事务, 是空操作.
+    @event.listens_for(engine, "commit")
+    def on_commit(conn):
+        if conn.info.get("holds_writer_lock"):
+            conn.connection.dbapi_connection.commit()  # 失败时仍持有写锁, 由随后的回滚释放
+            release(conn)
+
+    @event.listens_for(engine, "rollback")
+    def on_rollback(conn):
+        if conn.info.get("holds_writer_lock"):
+            try:
+                conn.connection.dbapi_connection.rollback()
+            finally:
+                release(conn)
+
+    def release(conn):
+        if conn.info.pop("holds_writer_lock", False):
+            writer_lock.release()
+
+    return engine
+
+
+def create_read_engine(url):
+    """只读引擎, 与写引擎指向同一个数据库文件"""
+    engine = create_engine(url, **engine_options())
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, readonly=True)
+
+    @event.listens_for(engine, "begin")
+    def on_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    return engine
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""有界的投票去重窗口
+
+只保留最近 window_blocks 个区块内已入库投票的交易哈希. 日志索引器只会向前扫描,
+低于 (已确认检查点 - window_blocks) 的区块不会再被读到, 这些哈希随检查点推进
+直接丢弃; 保留的一小段窗口用来吸收检查点附近的重复 (重启后的区间重叠、回执
+校验先入库的投票、区块重组后重新打包的交易). 内存只与窗口内的投票数有关.
+
+窗口不是正确性的唯一保证: 入库仍然使用 ON CONFLICT(hash) DO NOTHING.
+"""
+import threading
+
+
+class RecentVoteWindow:
+    """按区块号分桶的最近交易哈希集合"""
+
+    def __init__(self, window_blocks):
+        self.window_blocks = window_blocks
+        self._floor = None  # 窗口覆盖 >= floor 的区块; None 表示尚未从数据库加载, 不覆盖任何区块
+        self._blocks = {}  # block_number -> {tx_hash}
+        self._hashes = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, tx_hash):
+        return tx_hash in self._hashes
+
+    def covers(self, block_number):
+        """该区块的已入库投票是否全部在窗口里 (是则不必再查数据库)"""
+        floor = self._floor
+        return floor is not None and block_number >= floor
+
+    def reset(self, watermark, votes):
+        """以检查点 watermark 和数据库中窗口内的 (block_number, tx_hash) 重新初始化"""
+        with self._lock:
+            self._floor = max(0, watermark - self.window_blocks)
+            self._blocks = {}
+            self._hashes = set()
+            for block_number, tx_hash in votes:
+                self._add(block_number, tx_hash)
+
+    def add(self, block_number, tx_hash):
+        """记录一笔已提交的投票; 窗口之前的区块不再保留"""
+        with self._lock:
+            self._add(block_number, tx_hash)
+
+    def _add(self, block_number, tx_hash):
+        if self._floor is None or block_number < self._floor:
+            return
+        self._blocks.setdefault(block_number, set()).add(tx_hash)
+        self._hashes.add(tx_hash)
+
+    def advance(self, watermark):
+        """检查点推进到 watermark, 丢弃滑出窗口的区块"""
+        with self._lock:
+            if self._floor is None:
+                return
+            floor = max(0, watermark - self.window_blocks)
+            if floor <= self._floor:
+                return
+            self._floor = floor
+            for block_number in [b for b in self._blocks if b < floor]:
+                self._hashes.difference_update(self._blocks.pop(block_number))
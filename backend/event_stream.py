@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Server-Sent Events 推送通道
+
+后台同步逻辑在数据变化后调用 EventBroker.publish, 每个 /api/stream 连接
+持有一个有界队列. 慢客户端的队列满了之后只保留最新的事件, 不会拖慢发布方.
+"""
+import queue
+import threading
+
+
+class EventBroker:
+    """进程内的发布/订阅中心"""
+
+    def __init__(self, max_queue_size=32):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._max_queue_size = max_queue_size
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        """注册一个订阅者, 返回它的事件队列"""
+        q = queue.Queue(maxsize=self._max_queue_size)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, event, data, event_id=None):
+        """向所有订阅者广播一条事件 (data 为已序列化的字符串/字节)"""
+        message = format_sse(event, data, event_id)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # 丢弃最旧的一条, 保证客户端最终拿到最新状态
+                try:
+                    q.get_nowait()
+                    q.put_nowait(message)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def stream(self, initial_messages=(), heartbeat_interval=15):
+        """为一个连接生成 SSE 文本流, 空闲时发送心跳注释保持连接"""
+        q = self.subscribe()
+        try:
+            for message in initial_messages:
+                yield message
+            while True:
+                try:
+                    yield q.get(timeout=heartbeat_interval)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(q)
+
+
+def format_sse(event, data, event_id=None):
+    """按 SSE 协议格式化一条事件"""
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
@@ -1,5 +1,6 @@
 # Gunicorn configuration file
 import os
+import shutil
 
 # Server socket
 bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
@@ -7,8 +8,10 @@ backlog = 2048
 
 # Worker processes
 workers = 2
-worker_class = "sync"
-worker_connections = 1000
+# gevent workers hold each /api/stream connection in a greenlet, so thousands of idle
+# SSE clients fit in one worker
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "5000"))
 timeout = 30
 keepalive = 2
 
@@ -19,4 +22,21 @@ max_requests_jitter = 50
 # Logging
 loglevel = "info"
 accesslog = "-"
-errorlog = "-"
\ No newline at end of file
+errorlog = "-"
+
+def post_worker_init(worker):
+    # Open the database and hand contract sync / backfill to background threads,
+    # so the worker serves persisted data immediately instead of on first request
+    from app import startup
+    startup()
+
+def on_starting(server):
+    # Workers write their metric samples under instance/metrics; clear files left over
+    # from a previous run so counters start from zero
+    metrics_dir = os.getenv("METRICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "metrics"))
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+
+def worker_exit(server, worker):
+    # Write the final samples of a recycled worker so its counts survive in the archive
+    from app import metrics
+    metrics.dump()
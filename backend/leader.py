@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""跨进程的同步 leader 选举 (文件锁)
+
+每个 gunicorn worker 都对同一个锁文件尝试非阻塞排他锁 (flock). 拿到锁的进程
+负责全部后台同步, 其余 worker 只读. 进程退出 (max_requests 回收或崩溃) 时内核
+自动释放锁, 其他 worker 在下一次重试时接管; 同步进度都在数据库里, 接管后从
+检查点继续.
+"""
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 flock, 开发环境只有一个进程, 直接成为 leader
+    fcntl = None
+
+
+class LeaderLock:
+    """进程存活期间一直持有的文件锁"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    @property
+    def is_leader(self):
+        return self._file is not None
+
+    def try_acquire(self):
+        """尝试成为 leader, 已经是或成功获取时返回 True"""
+        if self._file is not None:
+            return True
+        f = open(self.path, "a+")
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+        # 记录持有者 pid, 便于排查
+        f.seek(0)
+        f.truncate()
+        f.write(f"{os.getpid()}\n")
+        f.flush()
+        self._file = f
+        return True
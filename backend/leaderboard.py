@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""支持者排行榜
+
+按地址累计投入 (wei) 排序的内存有序索引, 全局一份、每个战队一份. 索引是按
+(-投入, 地址) 升序排列的列表, 用 bisect 定位: 查询一个地址的名次 O(log n);
+更新一个地址时二分删除旧键、插入新键. 分页用 keyset 游标 (上一页最后一项的
+投入和地址), 翻页期间有新投票也不会重复或跳过未变动的地址.
+
+数据按 UserVote 的自增 id 同步: sync() 只读取 id 大于水位的投票, 第一次同步
+即一次遍历全部投票. SQLite 只有一个写者, id 按提交顺序递增, 所以水位之前的
+投票都已并入.
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+
+class RankedIndex:
+    """地址 -> (投入 wei, 投票数), 按投入降序、同额按地址升序排列"""
+
+    def __init__(self):
+        self._keys = []  # (-投入, 地址), 升序
+        self._entries = {}  # 地址 -> (投入, 投票数)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add_many(self, totals):
+        """合并 {地址: (新增投入, 新增投票数)}; 空索引时直接排序建立"""
+        if not self._keys:
+            self._entries = dict(totals)
+            self._keys = sorted((-amount, address) for address, (amount, _) in self._entries.items())
+            return
+        for address, (amount, votes) in totals.items():
+            current = self._entries.get(address)
+            if current is not None:
+                del self._keys[bisect_left(self._keys, (-current[0], address))]
+                amount, votes = amount + current[0], votes + current[1]
+            self._entries[address] = (amount, votes)
+            insort(self._keys, (-amount, address))
+
+    def items(self):
+        """[(地址, (投入, 投票数))], 顺序不定"""
+        return list(self._entries.items())
+
+    def rank(self, address):
+        """(名次, 投入, 投票数), 没有投票的地址返回 None"""
+        entry = self._entries.get(address)
+        if entry is None:
+            return None
+        return bisect_left(self._keys, (-entry[0], address)) + 1, entry[0], entry[1]
+
+    def page(self, limit, after=None):
+        """从游标 after = (投入, 地址) 之后开始的 limit 项: [(名次, 地址, 投入, 投票数)]"""
+        start = 0 if after is None else bisect_right(self._keys, (-after[0], after[1]))
+        return [
+            (start + i + 1, address, *self._entries[address])
+            for i, (_, address) in enumerate(self._keys[start:start + limit])
+        ]
+
+
+class Leaderboard:
+    """全局和各战队的排行榜, 以及已并入的 UserVote id 水位"""
+
+    def __init__(self):
+        self.overall = RankedIndex()
+        self.teams = {}
+        self.last_vote_id = None  # None 表示尚未从数据库加载
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.last_vote_id is not None
+
+    def sync(self, fetch_votes):
+        """fetch_votes(after_id) 按 id 升序产出 (id, 地址, 战队, 投入) 行, 全部并入后推进水位
+
+        持锁读取和合并, 并发调用不会重复计入同一批投票. 返回并入的投票数.
+        """
+        with self._lock:
+            last_id = self.last_vote_id or 0
+            overall, teams = {}, {}
+            count = 0
+            for vote_id, address, team_id, amount_wei in fetch_votes(last_id):
+                amount, votes = overall.get(address, (0, 0))
+                overall[address] = (amount + amount_wei, votes + 1)
+                team = teams.setdefault(team_id, {})
+                amount, votes = team.get(address, (0, 0))
+                team[address] = (amount + amount_wei, votes + 1)
+                last_id = vote_id
+                count += 1
+            self.overall.add_many(overall)
+            for team_id, totals in teams.items():
+                self.teams.setdefault(team_id, RankedIndex()).add_many(totals)
+            self.last_vote_id = last_id
+            return count
+
+    def index(self, team_id=None):
+        """全局索引, 或某个战队的索引 (该战队还没有投票时为空索引)"""
+        if team_id is None:
+            return self.overall
+        return self.teams.get(team_id) or RankedIndex()
+
+    def page(self, team_id=None, limit=50, after=None):
+        with self._lock:
+            index = self.index(team_id)
+            return len(index), index.page(limit, after)
+
+    def stakes(self):
+        """(水位, {(地址, 战队): 累计投入}), 即合约中的 userVotes 和它包含的最后一笔投票"""
+        with self._lock:
+            return self.last_vote_id, {
+                (address, team_id): amount
+                for team_id, index in self.teams.items()
+                for address, (amount, _) in index.items()
+            }
+
+    def ranks(self, address):
+        """一个地址的全局名次和各战队名次: (overall, {team_id: rank})"""
+        with self._lock:
+            teams = {team_id: index.rank(address) for team_id, index in self.teams.items()}
+            return self.overall.rank(address), {team_id: r for team_id, r in teams.items() if r is not None}
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""日志配置
+
+LOG_FORMAT=json (默认) 时每条日志输出一行 JSON: 时间、级别、logger、进程、线程、
+消息, 以及调用方通过 extra={...} 附带的字段 (区块号、条数、耗时等), 便于按字段
+检索; LOG_FORMAT=text 时输出便于本地阅读的单行文本. 级别由 LOG_LEVEL 控制.
+"""
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+# LogRecord 自带的属性, 其余的都是 extra 传入的字段
+RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in RESERVED_ATTRS)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(process)d %(threadName)s] %(name)s: %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        extra = {key: value for key, value in vars(record).items() if key not in RESERVED_ATTRS}
+        if extra:
+            text += " " + " ".join(f"{key}={value}" for key, value in extra.items())
+        return text
+
+
+def configure_logging():
+    """为根 logger 安装一个输出到 stderr 的处理器 (重复调用无副作用)"""
+    root = logging.getLogger()
+    if any(getattr(handler, "_app_handler", False) for handler in root.handlers):
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if os.getenv("LOG_FORMAT", "json") == "json" else TextFormatter())
+    handler._app_handler = True
+    root.addHandler(handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""基于 ABI 的合约日志解码
+
+导入时按 abi.json 为每个关注的事件编译一次 topic0 → 解码器的映射, 之后
+每条日志只需一次字典查找和一次 eth_abi 解码. 同时接受 web3 (HexBytes / int)
+和 Etherscan logs API (十六进制字符串) 两种日志格式.
+"""
+from typing import NamedTuple
+
+from eth_abi import decode
+from eth_utils import event_abi_to_log_topic
+
+# 可以直接从 topic 解码的 indexed 参数类型
+STATIC_TOPIC_TYPES = (
+    {"address", "bool"}
+    | {f"uint{n}" for n in range(8, 257, 8)}
+    | {f"int{n}" for n in range(8, 257, 8)}
+    | {f"bytes{n}" for n in range(1, 33)}
+)
+
+
+class DecodedLog(NamedTuple):
+    """解码后的日志, 只保留入库和判断需要的字段"""
+    event: str
+    args: dict
+    block_number: int
+    block_hash: str
+    transaction_hash: str
+    log_index: int
+    timestamp: int  # Etherscan 日志自带区块时间; web3 日志为 None
+
+
+def to_hex(value):
+    """HexBytes / bytes / 十六进制字符串统一为小写 0x 字符串"""
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    return value.lower()
+
+
+def to_int(value):
+    """int 或十六进制字符串 (Etherscan 用 "0x" 表示 0) 转为 int"""
+    if value is None or isinstance(value, int):
+        return value
+    return int(value, 16) if value not in ("0x", "") else 0
+
+
+def to_bytes(value):
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+
+
+class EventDecoder:
+    """按 topic0 分派的事件解码表"""
+
+    def __init__(self, abi, event_names):
+        self._decoders = {}
+        for item in abi:
+            if item.get("type") != "event" or item["name"] not in event_names:
+                continue
+            topic = "0x" + event_abi_to_log_topic(item).hex()
+            indexed = [(i["name"], i["type"]) for i in item["inputs"] if i["indexed"]]
+            data = [(i["name"], i["type"]) for i in item["inputs"] if not i["indexed"]]
+            self._decoders[topic] = (item["name"], indexed, [n for n, _ in data], [t for _, t in data])
+        self.topic_by_event = {name: topic for topic, (name, *_) in self._decoders.items()}
+
+    @property
+    def topics(self):
+        """关注的全部 topic0, 用于 eth_getLogs 过滤"""
+        return list(self._decoders)
+
+    def decode(self, log):
+        """解码一条日志, 非关注事件返回 None"""
+        topics = log["topics"]
+        if not topics:
+            return None
+        decoder = self._decoders.get(to_hex(topics[0]))
+        if decoder is None:
+            return None
+        name, indexed, data_names, data_types = decoder
+
+        args = dict(zip(data_names, decode(data_types, to_bytes(log["data"])))) if data_types else {}
+        for (arg_name, arg_type), topic in zip(indexed, topics[1:]):
+            # 动态类型的 indexed 参数在日志里只有哈希, 原样保留
+            args[arg_name] = decode([arg_type], to_bytes(topic))[0] if arg_type in STATIC_TOPIC_TYPES else to_hex(topic)
+
+        return DecodedLog(
+            event=name,
+            args=args,
+            block_number=to_int(log["blockNumber"]),
+            block_hash=to_hex(log["blockHash"]),
+            transaction_hash=to_hex(log["transactionHash"]),
+            log_index=to_int(log["logIndex"]),
+            timestamp=to_int(log.get("timeStamp")),
+        )
+
+    def decode_many(self, logs):
+        """批量解码, 跳过非关注事件"""
+        decoded = (self.decode(log) for log in logs)
+        return [e for e in decoded if e is not None]
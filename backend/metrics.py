@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""Prometheus 文本格式的指标
+
+Counter / Gauge / Histogram 都支持标签, 在进程内计数. 多个 gunicorn worker 时
+每个进程定期 (以及每次被抓取时) 把原始样本写到共享目录下的 <pid>.json, /metrics
+合并目录里的全部文件再输出, 所以无论哪个 worker 应答, 看到的都是全局数字:
+- Counter / Histogram 跨进程相加; 已退出进程 (max_requests 回收) 的文件并入
+  archive.json 继续累加, 计数不会因为 worker 重启而回退
+- Gauge 只取存活进程的值, 按 merge 相加 (sum) 或取最大值 (max)
+"""
+import glob
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境只有一个进程, 不需要跨进程加锁
+    fcntl = None
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ARCHIVE_FILE = "archive.json"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # 标签值元组 -> 值
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return {key: value for key, value in self._values.items()}
+
+    def describe(self):
+        return {"kind": self.kind, "help": self.documentation, "labelnames": list(self.labelnames)}
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), merge="sum", collect=None):
+        super().__init__(name, documentation, labelnames)
+        self.merge = merge
+        self._collect = collect  # 抓取时调用, 返回当前值 (无标签时; None 表示暂无数据)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self._collect is not None:
+            value = self._collect()
+            return {} if value is None else {(): value}
+        return super().samples()
+
+    def describe(self):
+        return dict(super().describe(), merge=self.merge)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # 每个桶 (含 +Inf) 的非累计计数, 然后是总和与次数
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            else:
+                entry[len(self.buckets)] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            return {key: list(entry) for key, entry in self._values.items()}
+
+    def describe(self):
+        return dict(super().describe(), buckets=list(self.buckets))
+
+
+def merge_values(kind, merge, current, value):
+    if current is None:
+        return list(value) if isinstance(value, list) else value
+    if kind == "histogram":
+        return [a + b for a, b in zip(current, value)]
+    if kind == "gauge" and merge == "max":
+        return max(current, value)
+    return current + value
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsRegistry:
+    """指标集合; directory 不为 None 时启用跨进程合并"""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._metrics = {}
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), merge="sum", collect=None):
+        return self._register(Gauge(name, documentation, labelnames, merge, collect))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self):
+        """本进程全部指标的原始样本, 可 JSON 序列化"""
+        metrics = {}
+        for name, metric in self._metrics.items():
+            try:
+                samples = metric.samples()
+            except Exception:
+                continue  # collect 回调失败时本次不输出该指标
+            metrics[name] = dict(metric.describe(), samples=[[list(k), v] for k, v in samples.items()])
+        return metrics
+
+    def dump(self):
+        """把本进程的样本写入 <directory>/<pid>.json (原子替换)"""
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"pid": os.getpid(), "metrics": self.snapshot()}, f)
+        os.replace(tmp_path, path)
+
+    def run_dumper(self, interval):
+        """后台定期写出样本, 让其他 worker 应答的 /metrics 也包含本进程的数字"""
+        while True:
+            time.sleep(interval)
+            try:
+                self.dump()
+            except Exception:
+                pass
+
+    def _load(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _archive_dead(self):
+        """把已退出进程的累计型样本并入 archive.json 并删除其文件 (持有目录锁)"""
+        lock_file = open(os.path.join(self.directory, ".lock"), "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+            archive = self._load(archive_path) or {"metrics": {}}
+            dead = []
+            for path in glob.glob(os.path.join(self.directory, "[0-9]*.json")):
+                data = self._load(path)
+                if data is None or process_alive(data["pid"]):
+                    continue
+                dead.append(path)
+                for name, metric in data["metrics"].items():
+                    if metric["kind"] == "gauge":
+                        continue
+                    target = archive["metrics"].setdefault(name, dict(metric, samples=[]))
+                    merged = {tuple(k): v for k, v in target["samples"]}
+                    for labels, value in metric["samples"]:
+                        merged[tuple(labels)] = merge_values(metric["kind"], None, merged.get(tuple(labels)), value)
+                    target["samples"] = [[list(k), v] for k, v in merged.items()]
+            if dead:
+                tmp_path = f"{archive_path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(archive, f)
+                os.replace(tmp_path, archive_path)
+                for path in dead:
+                    os.remove(path)
+        finally:
+            lock_file.close()
+
+    def collect(self):
+        """合并所有进程 (含已退出进程的存档) 的样本: {name: (元数据, {标签: 值})}"""
+        sources = [self.snapshot()]
+        if self.directory is not None:
+            self.dump()
+            self._archive_dead()
+            sources = []
+            for path in glob.glob(os.path.join(self.directory, "*.json")):
+                data = self._load(path)
+                if data is not None:
+                    sources.append(data["metrics"])
+
+        merged = {}
+        for metrics in sources:
+            for name, metric in metrics.items():
+                meta, values = merged.setdefault(name, (metric, {}))
+                for labels, value in metric["samples"]:
+                    key = tuple(labels)
+                    values[key] = merge_values(metric["kind"], metric.get("merge"), values.get(key), value)
+        return merged
+
+    def render(self):
+        """Prometheus 文本格式 (text/plain; version=0.0.4)"""
+        lines = []
+        for name, (meta, values) in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {meta['help']}")
+            lines.append(f"# TYPE {name} {meta['kind']}")
+            labelnames = meta["labelnames"]
+            for key, value in sorted(values.items()):
+                labels = list(zip(labelnames, key))
+                if meta["kind"] == "histogram":
+                    cumulative = 0
+                    for bound, count in zip(list(meta["buckets"]) + [math.inf], value):
+                        cumulative += count
+                        le = "+Inf" if bound == math.inf else format_value(bound)
+                        lines.append(f"{name}_bucket{format_labels(labels + [('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {format_value(value[-2])}")
+                    lines.append(f"{name}_count{format_labels(labels)} {value[-1]}")
+                else:
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels) + "}"
+
+
+def format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""数据库迁移与维护工具 (替代 fix_addresses.py / reset_db.py)
+
+用法:
+    python migrate_db.py status                  查看结构版本和各表行数
+    python migrate_db.py upgrade [--batch-size] [--vacuum]
+                                                 在线升级旧数据库到当前结构
+    python migrate_db.py fix-addresses           把地址统一转换为小写并重建汇总
+    python migrate_db.py verify-counters [--fix] 校验 /api/stats 计数器, --fix 时按全量结果重建
+    python migrate_db.py reset                   (停止服务后) 清空除武器价格外的全部数据并从合约重新同步
+
+upgrade 先把旧表按批复制到影子表 (每批一个短事务, 应用可以继续读写),
+最后在一个 BEGIN IMMEDIATE 事务里补齐增量、替换表、建索引并写入版本号.
+新结构中不存在的旧列 (例如 v2 删除的 Etherscan 交易字段) 在复制时直接丢弃,
+旧表没有的新列取列的默认值 (例如 v3 的结算水位为 0, 启动后会重新结算一次);
+--vacuum 在升级后整理数据库文件, 归还删除旧表留下的空闲页.
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+
+from sqlalchemy import Integer, MetaData
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app import (
+    app, db, db_path, SCHEMA_VERSION, WeiAmount,
+    GameState, Team, UserVote, UserPortfolio, SettlementSummary,
+    auto_reset_database, init_database, rebuild_user_portfolios,
+    rebuild_stats_counters, verify_stats_counters,
+)
+
+# 需要转换的表; 只追加不修改的表在最终事务里只补齐新增行, 其余表整体重新复制
+MIGRATED_MODELS = (UserVote, Team, GameState, UserPortfolio, SettlementSummary)
+APPEND_ONLY_TABLES = {UserVote.__tablename__}
+
+# 小于任何合法 rowid 的起点 (Team 等表的主键可能为 0)
+MIN_ROWID = -(2 ** 63)
+
+
+def connect():
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def table_exists(conn, name):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+    return row is not None
+
+
+def shadow_name(table):
+    return f"{table.name}__migrating"
+
+
+def compile_ddl(element):
+    return str(element.compile(dialect=sqlite.dialect()))
+
+
+def convert_value(column, value):
+    """把旧库中的值转换为当前列类型的存储格式"""
+    if value is None or value == "":
+        return None
+    if isinstance(column.type, WeiAmount):
+        return column.type.process_bind_param(value, None)
+    if isinstance(column.type, Integer):
+        return int(value)
+    if column.name == "user_address":
+        return value.lower()
+    return value
+
+
+def copy_rows(conn, table, after_rowid, limit):
+    """从旧表复制 rowid > after_rowid 的一批行到影子表, 返回 (复制行数, 最后一个 rowid)"""
+    rows = conn.execute(
+        f"SELECT rowid AS _rowid, * FROM {table.name} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+        (after_rowid, limit),
+    ).fetchall()
+    if not rows:
+        return 0, after_rowid
+
+    source_columns = set(rows[0].keys())
+    columns = [c for c in table.columns if c.name in source_columns]
+    placeholders = ", ".join("?" for _ in columns)
+    conn.executemany(
+        f"INSERT INTO {shadow_name(table)} ({', '.join(c.name for c in columns)}) VALUES ({placeholders})",
+        [tuple(convert_value(c, row[c.name]) for c in columns) for row in rows],
+    )
+    return len(rows), rows[-1]["_rowid"]
+
+
+def copy_table(conn, table, after_rowid=MIN_ROWID, batch_size=None):
+    """按批复制整张表; batch_size 为 None 时在调用方的事务中一次复制完"""
+    copied = 0
+    last_rowid = after_rowid
+    while True:
+        if batch_size:
+            conn.execute("BEGIN")
+        count, last_rowid = copy_rows(conn, table, last_rowid, batch_size or 5000)
+        if batch_size:
+            conn.execute("COMMIT")
+        if not count:
+            return copied, last_rowid
+        copied += count
+
+
+def create_shadow_table(conn, table):
+    shadow = table.to_metadata(MetaData(), name=shadow_name(table))
+    conn.execute(f"DROP TABLE IF EXISTS {shadow.name}")
+    conn.execute(compile_ddl(CreateTable(shadow)))
+
+
+def upgrade(batch_size, vacuum=False):
+    with app.app_context():
+        init_database(upgrading=True)
+
+    conn = connect()
+    version = get_schema_version(conn)
+    if version >= SCHEMA_VERSION:
+        print(f"✅ Schema already at v{version}, nothing to do")
+        return
+
+    print(f"🔧 Upgrading schema v{version} → v{SCHEMA_VERSION}")
+    tables = [model.__table__ for model in MIGRATED_MODELS]
+    progress = {}
+
+    # 阶段 1: 批量复制, 每批一个短事务
+    for table in tables:
+        if not table_exists(conn, table.name):
+            continue
+        create_shadow_table(conn, table)
+        started = time.monotonic()
+        copied, last_rowid = copy_table(conn, table, batch_size=batch_size)
+        progress[table.name] = last_rowid
+        elapsed = time.monotonic() - started
+        print(f"  ✓ {table.name}: copied {copied} row(s) in {elapsed:.2f}s")
+
+    # 阶段 2: 持有写锁, 补齐复制期间的变化并替换表
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table in tables:
+            if table.name not in progress:
+                conn.execute(compile_ddl(CreateTable(table)))
+            else:
+                if table.name in APPEND_ONLY_TABLES:
+                    copied, _ = copy_table(conn, table, after_rowid=progress[table.name])
+                else:
+                    conn.execute(f"DELETE FROM {shadow_name(table)}")
+                    copied, _ = copy_table(conn, table)
+                print(f"  ✓ {table.name}: synced {copied} row(s) under write lock")
+                conn.execute(f"DROP TABLE {table.name}")
+                conn.execute(f"ALTER TABLE {shadow_name(table)} RENAME TO {table.name}")
+            for index in table.indexes:
+                conn.execute(compile_ddl(CreateIndex(index)))
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    print(f"✅ Schema upgraded to v{SCHEMA_VERSION}")
+
+    if vacuum:
+        # VACUUM 会持有写锁直到完成, 只在需要回收空间时使用
+        size_before = os.path.getsize(db_path)
+        conn.execute("VACUUM")
+        print(f"🧹 Vacuumed database: {size_before / 1024:.0f} KiB → {os.path.getsize(db_path) / 1024:.0f} KiB")
+
+
+def status():
+    conn = connect()
+    print(f"📊 Database: {db_path}")
+    print(f"  Schema version: v{get_schema_version(conn)} (current v{SCHEMA_VERSION})")
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"):
+        count = conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+        print(f"  {name}: {count} row(s)")
+
+
+def fix_addresses():
+    with app.app_context():
+        print("🔧 Fixing address formats in database...")
+        fixed_count = db.session.query(UserVote).filter(
+            UserVote.user_address != db.func.lower(UserVote.user_address)
+        ).update({UserVote.user_address: db.func.lower(UserVote.user_address)}, synchronize_session=False)
+        if fixed_count:
+            rebuild_user_portfolios()
+            rebuild_stats_counters()
+        db.session.commit()
+        print(f"✨ Fixed {fixed_count} addresses to lowercase")
+
+
+def verify_counters(fix):
+    with app.app_context():
+        expected, drift = verify_stats_counters()
+        if not drift:
+            print(f"✅ Counters match: {expected['total_votes']} votes, {expected['unique_participants']} participants")
+            return
+        for name, stored, actual in drift:
+            print(f"  ⚠ {name}: counter={stored} actual={actual}")
+        if fix:
+            rebuild_stats_counters(expected)
+            db.session.commit()
+            print(f"✨ Rebuilt counters ({len(drift)} drifted)")
+
+
+def reset():
+    with app.app_context():
+        init_database()
+    if not auto_reset_database():
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Database migration and maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="show schema version and row counts")
+    upgrade_parser = subparsers.add_parser("upgrade", help="convert an older database to the current schema")
+    upgrade_parser.add_argument("--batch-size", type=int, default=5000, help="rows copied per transaction")
+    upgrade_parser.add_argument("--vacuum", action="store_true", help="reclaim free pages after the upgrade")
+    subparsers.add_parser("fix-addresses", help="lowercase all stored addresses")
+    verify_parser = subparsers.add_parser("verify-counters", help="check /api/stats counters against UserVote")
+    verify_parser.add_argument("--fix", action="store_true", help="rebuild counters when they drift")
+    subparsers.add_parser("reset", help="with the server stopped, clear all data except weapon prices and resync teams")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        status()
+    elif args.command == "upgrade":
+        upgrade(args.batch_size, args.vacuum)
+    elif args.command == "fix-addresses":
+        fix_addresses()
+    elif args.command == "verify-counters":
+        verify_counters(args.fix)
+    elif args.command == "reset":
+        reset()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""赔率与假设收益计算
+
+合约的结算规则: 奖池扣除 10% 慈善后, 按投入比例分给获胜战队的支持者. 全部用
+wei 整数计算 (与合约一致向下取整), 不经过浮点数.
+
+OddsTable 对一组战队累计和奖池预先算好可分配金额, 之后一次批量计算每个战队、
+每个假设投入的收益: 假设投入同时计入奖池和该战队的累计.
+"""
+from typing import NamedTuple
+
+CHARITY_PERCENT = 10
+WEI_PER_ETH = 10 ** 18
+
+
+def distributable(pool_wei):
+    """奖池扣除慈善部分后可分给获胜方的金额"""
+    return pool_wei - pool_wei * CHARITY_PERCENT // 100
+
+
+def payout_wei(amount_wei, pool_wei, winner_total_wei):
+    """获胜方一笔投入应得的金额"""
+    if winner_total_wei <= 0:
+        return 0
+    return amount_wei * distributable(pool_wei) // winner_total_wei
+
+
+class TeamOdds(NamedTuple):
+    team_id: int
+    total_wei: int
+    multiplier: float  # 当前奖池下每 1 wei 投入的回报 (没有投入时为 None)
+    payout_per_eth_wei: int  # 在该战队追加 1 ETH 且获胜时的应得金额
+
+
+class OddsTable:
+    """一组战队累计和奖池对应的赔率表"""
+
+    def __init__(self, pool_wei, team_totals):
+        self.pool_wei = pool_wei
+        self.team_totals = dict(sorted(team_totals.items()))
+        self.distributable_wei = distributable(pool_wei)
+        self.teams = [
+            TeamOdds(
+                team_id,
+                total_wei,
+                self.distributable_wei / total_wei if total_wei > 0 else None,
+                self._payout(WEI_PER_ETH, total_wei),
+            )
+            for team_id, total_wei in self.team_totals.items()
+        ]
+
+    def _payout(self, amount_wei, total_wei):
+        return payout_wei(amount_wei, self.pool_wei + amount_wei, total_wei + amount_wei)
+
+    def payouts(self, amounts_wei):
+        """{team_id: [在该战队投入 amount 且获胜时的应得金额, ...]}, 顺序与 amounts_wei 一致"""
+        return {
+            team_id: [self._payout(amount, total_wei) for amount in amounts_wei]
+            for team_id, total_wei in self.team_totals.items()
+        }
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""日志索引器的自适应轮询间隔
+
+- 上游出错时指数退避 (被限流时退避更快), 成功一次即复位
+- 游戏已结束 (Finished / Refunding) 时只做低频的空闲轮询
+- 投票开放期间按最近的投票速率在 active 和 quiet 间隔之间调整: 越活跃轮询越快
+"""
+import time
+from collections import deque
+
+from upstream import Backoff, is_rate_limited
+
+
+class PollScheduler:
+    """根据游戏状态、近期投票速率和上游错误计算下一次轮询前的等待时间"""
+
+    def __init__(self, active_interval, quiet_interval, idle_interval, max_backoff, activity_window=120):
+        self.active_interval = active_interval
+        self.quiet_interval = quiet_interval
+        self.idle_interval = idle_interval
+        self.activity_window = activity_window
+        self.backoff = Backoff(quiet_interval, max_backoff)
+        self.mode = "quiet"
+        self.interval = quiet_interval
+        self._votes = deque()  # (monotonic 时间, 新投票数)
+
+    def record_round(self, new_votes):
+        """一轮轮询成功完成"""
+        self.backoff.success()
+        if new_votes:
+            self._votes.append((time.monotonic(), new_votes))
+
+    def record_error(self, error):
+        self.backoff.failure(rate_limited=is_rate_limited(error))
+
+    def votes_per_minute(self):
+        cutoff = time.monotonic() - self.activity_window
+        while self._votes and self._votes[0][0] < cutoff:
+            self._votes.popleft()
+        return sum(n for _, n in self._votes) * 60 / self.activity_window
+
+    def next_interval(self, voting_open, terminal):
+        """下一次轮询前的等待秒数, 同时记录所处的模式"""
+        delay = self.backoff.delay()
+        if delay:
+            self.mode, self.interval = "backoff", delay
+        elif terminal:
+            self.mode, self.interval = "idle", self.idle_interval
+        elif voting_open and self.votes_per_minute() > 0:
+            self.mode = "active"
+            self.interval = max(self.active_interval, self.quiet_interval / (1 + self.votes_per_minute()))
+        else:
+            self.mode, self.interval = "quiet", self.quiet_interval
+        return self.interval
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "interval_seconds": round(self.interval, 2),
+            "consecutive_failures": self.backoff.failures,
+            "votes_per_minute": round(self.votes_per_minute(), 2),
+        }
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""ETH/USD 价格服务
+
+后台线程按固定间隔刷新价格, 依次尝试多个数据源; 请求路径只读取内存中
+最后一次成功的报价 (附带时间和来源), 不做任何网络 I/O.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import NamedTuple
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class PriceQuote(NamedTuple):
+    """一次成功获取的报价"""
+    price: float
+    source: str
+    fetched_at: float
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+
+def fetch_binance(session, timeout):
+    response = session.get("https://api.binance.com/api/v3/ticker/price?symbol=ETHUSDT", timeout=timeout)
+    response.raise_for_status()
+    return float(response.json()["price"])
+
+
+def fetch_coinbase(session, timeout):
+    response = session.get("https://api.coinbase.com/v2/prices/ETH-USD/spot", timeout=timeout)
+    response.raise_for_status()
+    return float(response.json()["data"]["amount"])
+
+
+def fetch_coingecko(session, timeout):
+    response = session.get(
+        "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=usd", timeout=timeout
+    )
+    response.raise_for_status()
+    return float(response.json()["ethereum"]["usd"])
+
+
+DEFAULT_SOURCES = (
+    ("binance", fetch_binance),
+    ("coinbase", fetch_coinbase),
+    ("coingecko", fetch_coingecko),
+)
+
+
+class PriceService:
+    """带历史记录的 stale-while-revalidate 价格缓存"""
+
+    def __init__(self, sources=DEFAULT_SOURCES, fallback_price=3000.0, history_size=60, timeout=5, budgets=None):
+        self._sources = sources
+        self._budgets = budgets or {}  # 数据源名 -> UpstreamBudget (可选)
+        self._fallback = PriceQuote(fallback_price, "fallback", 0.0)
+        self._history = deque(maxlen=history_size)
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._timeout = timeout
+
+    def add_listener(self, callback):
+        """注册回调, 每次成功刷新后以 callback(quote) 调用"""
+        self._listeners.append(callback)
+
+    def current(self):
+        """最后一次成功的报价; 从未成功时返回回退价格 (fetched_at 为 0)"""
+        with self._lock:
+            return self._history[-1] if self._history else self._fallback
+
+    def history(self):
+        """按时间顺序返回最近的报价"""
+        with self._lock:
+            return list(self._history)
+
+    def refresh(self):
+        """依次尝试各数据源, 成功则记录并返回报价, 全部失败返回 None (保留旧值)"""
+        for name, fetch in self._sources:
+            budget = self._budgets.get(name)
+            try:
+                with budget.call() if budget else nullcontext():
+                    price = fetch(self._session, self._timeout)
+            except Exception as e:
+                logger.warning(f"ETH price source {name} failed: {e}")
+                continue
+            if price <= 0:
+                continue
+            quote = PriceQuote(price, name, time.time())
+            with self._lock:
+                self._history.append(quote)
+            for callback in self._listeners:
+                callback(quote)
+            return quote
+        return None
+
+    def run_forever(self, interval):
+        """后台刷新循环"""
+        while True:
+            self.refresh()
+            time.sleep(interval)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""比赛结束时的一次性结算
+
+合约按 (地址, 战队) 记录投入 (userVotes), withdraw(teamId) 按这一累计支付:
+Finished 时获胜战队的支持者得到 投入 * 可分配金额 // 获胜战队累计, 其余为 0;
+Refunding 时每个 (地址, 战队) 全额退回. 这里对全部 (地址, 战队) 一次批量计算
+同样的 wei 整数结果, 并与奖池核对:
+
+- Finished: 应付 = 奖池扣除慈善后的可分配金额; 每一行向下取整最多少付 1 wei,
+  所以 0 <= 应付 - 实付 < 获胜行数, 且已入库的获胜战队投入应等于合约中的累计
+- Refunding: 退款合计应等于奖池
+
+结算后奖池和合约中的战队累计都不再变化, 一笔补录的投票只改变它自己那一行,
+可以用 settle_entry 单独重算, 再用 verify 重新核对.
+"""
+from typing import NamedTuple
+
+from odds import distributable, payout_wei
+
+FINISHED = 2
+REFUNDING = 3
+
+
+class SettlementRow(NamedTuple):
+    user_address: str
+    team_id: int
+    outcome: str  # Won / Lost / Refunded
+    staked_wei: int
+    payout_wei: int
+
+
+class SettlementResult(NamedTuple):
+    rows: list
+    expected_wei: int  # 按合约规则应付出的总额
+    paid_wei: int  # 各行应得金额合计
+    payout_stake_wei: int  # 有收益的行 (获胜或退款) 的投入合计
+    payout_entries: int  # 有收益的行数
+    checksum_ok: bool
+
+    @property
+    def dust_wei(self):
+        """向下取整留在合约中的余数 (付出超过应付时为负)"""
+        return self.expected_wei - self.paid_wei
+
+
+def expected_payout(status, pool_wei):
+    """按合约规则应付出的总额"""
+    return pool_wei if status == REFUNDING else distributable(pool_wei)
+
+
+def settle_entry(status, address, team_id, staked_wei, pool_wei, winning_team_id=None, winner_total_wei=0):
+    """一个 (地址, 战队) 的结算结果"""
+    if status == REFUNDING:
+        return SettlementRow(address, team_id, "Refunded", staked_wei, staked_wei)
+    if status != FINISHED:
+        raise ValueError(f"cannot settle game in status {status}")
+    if team_id == winning_team_id:
+        return SettlementRow(address, team_id, "Won", staked_wei, payout_wei(staked_wei, pool_wei, winner_total_wei))
+    return SettlementRow(address, team_id, "Lost", staked_wei, 0)
+
+
+def verify(status, expected_wei, paid_wei, payout_stake_wei, payout_entries, winner_total_wei=0):
+    """核对结算合计与奖池"""
+    if status == REFUNDING:
+        return paid_wei == expected_wei
+    dust = expected_wei - paid_wei
+    return payout_stake_wei == winner_total_wei and 0 <= dust < max(payout_entries, 1)
+
+
+def settle(stakes, status, pool_wei, winning_team_id=None, winner_total_wei=0):
+    """计算每个 (地址, 战队) 的结算结果
+
+    stakes 为 (地址, 战队, 累计投入) 的可迭代对象, 每个 (地址, 战队) 一项;
+    winner_total_wei 是合约记录的获胜战队累计 (合约按它计算), 与已入库投票的合计
+    不一致说明还有投票没有入库.
+    """
+    rows = [
+        settle_entry(status, address, team_id, staked, pool_wei, winning_team_id, winner_total_wei)
+        for address, team_id, staked in stakes
+    ]
+    paying = [row for row in rows if row.outcome != "Lost"]
+    expected = expected_payout(status, pool_wei)
+    paid = sum(row.payout_wei for row in paying)
+    payout_stake = sum(row.staked_wei for row in paying)
+    return SettlementResult(
+        rows, expected, paid, payout_stake, len(paying),
+        verify(status, expected, paid, payout_stake, len(paying), winner_total_wei),
+    )
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""只读接口的快照缓存
+
+每个快照是一段预先序列化好的 JSON 字节串和它的 ETag. 快照只在数据真正
+发生变化时由后台同步逻辑重建, 请求路径上只读取现成的字节, 不访问数据库.
+
+多个后台线程会同时重建同一个快照; 每个快照有自己的锁, 构建、保存和通知在
+锁内依次完成, 先开始的构建不会在后开始的之后覆盖出旧内容.
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import NamedTuple
+
+
+class Snapshot(NamedTuple):
+    """不可变的接口响应快照"""
+    body: bytes
+    etag: str
+    built_at: float
+
+
+class SnapshotCache:
+    """按名称保存快照, 由注册的构建函数生成"""
+
+    def __init__(self):
+        self._builders = {}
+        self._snapshots = {}
+        self._listeners = []
+        self._locks = {}  # 快照名 -> 构建锁
+
+    def register(self, name, builder):
+        """注册快照构建函数, builder() 返回可 JSON 序列化的对象"""
+        self._builders[name] = builder
+        self._locks[name] = threading.RLock()
+
+    def add_listener(self, callback):
+        """注册变化回调, 快照内容变化后以 callback(name, snapshot) 调用"""
+        self._listeners.append(callback)
+
+    def rebuild(self, *names):
+        """重建指定快照 (默认全部), 返回内容确实发生变化的快照名"""
+        changed = []
+        for name in names or tuple(self._builders):
+            with self._locks[name]:
+                payload = self._builders[name]()
+                body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                etag = hashlib.sha1(body).hexdigest()
+                current = self._snapshots.get(name)
+                if current is not None and current.etag == etag:
+                    continue
+                snapshot = self._snapshots[name] = Snapshot(body, etag, time.time())
+                changed.append(name)
+                # 在锁内通知, 监听者 (SSE 推送、版本号) 看到的顺序与保存顺序一致
+                for callback in self._listeners:
+                    callback(name, snapshot)
+        return changed
+
+    def peek(self, name):
+        """读取已构建的快照, 尚未构建时返回 None"""
+        return self._snapshots.get(name)
+
+    def get(self, name):
+        """读取快照, 尚未构建时先构建一次"""
+        snapshot = self._snapshots.get(name)
+        if snapshot is None:
+            self.rebuild(name)
+            snapshot = self._snapshots[name]
+        return snapshot
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""测试配置
+
+导入 app 之前把数据库、指标目录指向临时目录, RPC 指向不可达的地址:
+测试不访问网络, 也不会改动 instance/ 下的数据库. 需要 app 的测试使用 backend
+fixture (每个测试从空库开始).
+"""
+import os
+import tempfile
+from datetime import datetime, timezone
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="fan-consensus-tests-")
+os.environ["DATABASE_PATH"] = os.path.join(_tmp, "test.db")
+os.environ["METRICS_DIR"] = os.path.join(_tmp, "metrics")
+os.environ.setdefault("CONTRACT_ADDRESS", "0xb5c4bea741cea63b2151d719b2cca12e80e6c7e8")
+os.environ.setdefault("RPC_URL", "http://127.0.0.1:1")
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    """空数据库上的 app 模块; 内存中的排行榜、投票流量和去重窗口每个测试重新开始"""
+    import app
+    from dedup_window import RecentVoteWindow
+    from leaderboard import Leaderboard
+    from vote_flow import VoteFlow
+
+    with app.app.app_context():
+        app.db.drop_all()
+        app.init_database()
+    monkeypatch.setattr(app, "leaderboard", Leaderboard())
+    monkeypatch.setattr(app, "vote_flow", VoteFlow())
+    monkeypatch.setattr(app, "recent_votes", RecentVoteWindow(app.DEDUP_WINDOW_BLOCKS))
+    monkeypatch.setattr(app, "last_contract_state", None)
+    monkeypatch.setattr(app, "settlement_retry_at", 0.0)
+    return app
+
+
+@pytest.fixture
+def add_votes(backend):
+    """像索引器一样写入投票行并更新计数器和汇总: add_votes([(地址, 战队, 投入 wei), ...])"""
+    count = [0]
+
+    def add(votes, block_number=10):
+        rows = []
+        for address, team_id, amount_wei in votes:
+            count[0] += 1
+            rows.append({
+                "hash": f"0x{count[0]:064x}", "user_address": address, "team_id": team_id,
+                "amount_wei": amount_wei, "block_number": block_number,
+                "timestamp": datetime(2026, 1, 1, tzinfo=timezone.utc),
+            })
+        with backend.app.app_context():
+            backend.db.session.execute(backend.sqlite_insert(backend.UserVote), rows)
+            backend.record_ingested_votes(rows)
+            backend.db.session.commit()
+        return rows
+
+    return add
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+import requests
+from eth_abi import encode
+
+import upstream
+from log_decoder import EventDecoder
+
+with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), "abi.json")) as f:
+    NEW_VOTE_TOPIC = EventDecoder(json.load(f), {"NewVote"}).topic_by_event["NewVote"]
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+@pytest.fixture
+def etherscan(backend, monkeypatch):
+    """按顺序返回给定的 Etherscan 应答 (dict) 或抛出给定的异常, 退避不等待"""
+    replies = []
+    calls = []
+
+    def get(url, params, timeout):
+        calls.append(params)
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return Response(reply)
+
+    monkeypatch.setattr(backend.requests, "get", get)
+    monkeypatch.setattr(backend, "Backoff", lambda base, maximum: upstream.Backoff(0, 0))
+    return SimpleNamespace(replies=replies, calls=calls)
+
+
+def vote_log(block_number, n):
+    return {
+        "topics": [NEW_VOTE_TOPIC, "0x" + "00" * 12 + f"{n:040x}"],
+        "data": "0x" + encode(["uint256", "uint256"], [1, 10 ** 16]).hex(),
+        "blockNumber": hex(block_number),
+        "blockHash": "0x" + "22" * 32,
+        "transactionHash": f"0x{n:064x}",
+        "logIndex": "0x0",
+        "timeStamp": "0x6553f100",
+    }
+
+
+def test_no_records_is_empty(backend, etherscan):
+    etherscan.replies.append({"status": "0", "message": "No records found", "result": []})
+    assert backend.get_contract_logs_from_etherscan(0, 10) == []
+
+
+def test_raises_when_retries_are_exhausted(backend, etherscan):
+    etherscan.replies.append(requests.ConnectionError("connection reset"))
+    etherscan.replies.extend(
+        {"status": "0", "message": "NOTOK", "result": "Max rate limit reached"} for _ in range(backend.ETHERSCAN_MAX_RETRIES)
+    )
+    with pytest.raises(requests.RequestException, match="rate limit"):
+        backend.get_contract_logs_from_etherscan(0, 10)
+    assert len(etherscan.calls) == backend.ETHERSCAN_MAX_RETRIES + 1
+
+
+def test_retries_then_returns_logs(backend, etherscan):
+    etherscan.replies.append({"status": "0", "message": "NOTOK", "result": "Query Timeout occured"})
+    etherscan.replies.append({"status": "1", "message": "OK", "result": [vote_log(5, 1)]})
+    assert len(backend.get_contract_logs_from_etherscan(0, 10)) == 1
+
+
+def test_backfill_stops_at_failed_page(backend, etherscan, monkeypatch):
+    chain = SimpleNamespace(eth=SimpleNamespace(block_number=100 + backend.FINALITY_DEPTH), from_wei=backend.web3.from_wei)
+    monkeypatch.setattr(backend, "web3", chain)
+    monkeypatch.setattr(backend, "ETHERSCAN_MAX_RETRIES", 0)
+    page_size = backend.ETHERSCAN_PAGE_SIZE
+    etherscan.replies.append({"status": "1", "message": "OK", "result": [vote_log(5, n) for n in range(page_size)]})
+    etherscan.replies.append(requests.Timeout("read timed out"))
+
+    assert backend.save_all_user_votes_to_database() is None  # 没有回填到链头
+    assert backend.get_sync_checkpoint(backend.BACKFILL_CHECKPOINT) == 5
+    with backend.ReadSession() as session:
+        assert session.query(backend.UserVote).count() == page_size
+
+    # 下次从检查点继续, 没有更多日志时回填完成
+    etherscan.replies.append({"status": "0", "message": "No records found", "result": []})
+    assert backend.save_all_user_votes_to_database() == 0
+    assert etherscan.calls[-1]["fromBlock"] == "5"
+
+
+def test_settlement_waits_for_complete_backfill(backend, monkeypatch):
+    with backend.app.app_context():
+        backend.db.session.add(backend.GameState(id=1, status=3, total_prize_pool=0))
+        backend.db.session.commit()
+    monkeypatch.setattr(backend, "save_all_user_votes_to_database", lambda: None)
+    assert not backend.settle_if_needed()
+    assert backend.settlement_pending()
+
+    monkeypatch.setattr(backend, "save_all_user_votes_to_database", lambda: 0)
+    assert not backend.settle_if_needed()  # 失败后 SETTLEMENT_RETRY_INTERVAL 内不重试
+    monkeypatch.setattr(backend, "settlement_retry_at", 0.0)
+    assert backend.settle_if_needed()
+    assert not backend.settlement_pending()
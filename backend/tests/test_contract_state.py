@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import pytest
+from web3.exceptions import BadResponseFormat, Web3RPCError
+
+import contract_state
+from contract_state import ContractStateReader
+
+STATE = {"status": 2, "totalRewardPool": 10 ** 18, "winningTeamId": 1, "getTeams": [(1, "A", 5, 1)]}
+
+
+class Call:
+    def __init__(self, name):
+        self.name = name
+
+    def call(self, block_identifier):
+        return STATE[self.name]
+
+
+class Functions:
+    def __getattr__(self, name):
+        return lambda: Call(name)
+
+
+class Contract:
+    functions = Functions()
+
+
+class Batch:
+    def __init__(self, error):
+        self.error = error
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, result):
+        self.calls.append(result)
+
+    def execute(self):
+        if self.error:
+            raise self.error
+        return self.calls
+
+
+class Web3:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.batches = 0
+
+    def batch_requests(self):
+        self.batches += 1
+        return Batch(self.errors.pop(0) if self.errors else None)
+
+
+def read(reader):
+    state = reader.read(block_number=7)
+    assert (state.block_number, state.status, state.winning_team_id) == (7, 2, 1)
+    assert state.teams == ((1, "A", 5, 1),)
+
+
+def test_transient_batch_error_keeps_batching():
+    web3 = Web3([Web3RPCError("request timed out")])
+    reader = ContractStateReader(web3, Contract())
+    read(reader)  # 这一次退回逐个调用
+    assert reader.batching
+    read(reader)
+    assert web3.batches == 2
+
+
+@pytest.mark.parametrize("error", [
+    BadResponseFormat("Batch response must be formatted as a list of responses"),
+    Web3RPCError("{'code': -32600, 'message': 'batch requests are not supported'}"),
+])
+def test_unsupported_batch_disables_batching_until_cooldown(error, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(contract_state.time, "monotonic", lambda: now[0])
+    web3 = Web3([error])
+    reader = ContractStateReader(web3, Contract())
+    read(reader)
+    assert not reader.batching
+    read(reader)
+    assert web3.batches == 1
+
+    now[0] += contract_state.BATCH_RETRY_INTERVAL
+    assert reader.batching
+    read(reader)
+    assert web3.batches == 2
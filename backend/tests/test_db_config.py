@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import threading
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+import db_config
+
+
+@pytest.fixture
+def engines(tmp_path):
+    url = f"sqlite:///{tmp_path / 'test.db'}"
+    writer = db_config.configure_write_engine(create_engine(url, **db_config.engine_options()))
+    reader = db_config.create_read_engine(url)
+    with writer.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, v INTEGER)"))
+    yield writer, reader, str(tmp_path / "test.db")
+    writer.dispose()
+    reader.dispose()
+
+
+def test_sqlite_write_lock_is_free_when_writer_lock_is_released(engines):
+    writer, _, path = engines
+    seen = []
+
+    # 在 configure_write_engine 之后注册, 运行时进程内写锁已经释放
+    @event.listens_for(writer, "commit")
+    def after_release(conn):
+        other = sqlite3.connect(path, timeout=0, isolation_level=None)
+        try:
+            other.execute("BEGIN IMMEDIATE")
+            other.execute("ROLLBACK")
+            seen.append("free")
+        except sqlite3.OperationalError as e:
+            seen.append(str(e))
+        finally:
+            other.close()
+
+    with writer.begin() as conn:
+        conn.execute(text("INSERT INTO t (v) VALUES (1)"))
+    assert seen == ["free"]
+    with writer.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM t")).scalar() == 1
+
+
+def test_rollback_releases_writer_lock(engines):
+    writer, _, _ = engines
+    with pytest.raises(RuntimeError):
+        with writer.begin() as conn:
+            conn.execute(text("INSERT INTO t (v) VALUES (1)"))
+            raise RuntimeError("boom")
+    with writer.begin() as conn:
+        conn.execute(text("INSERT INTO t (v) VALUES (2)"))
+        assert conn.execute(text("SELECT v FROM t")).scalars().all() == [2]
+
+
+def test_concurrent_writers_never_see_busy(engines):
+    writer, reader, _ = engines
+    errors = []
+
+    def write():
+        try:
+            for i in range(200):
+                with writer.begin() as conn:
+                    conn.execute(text("INSERT INTO t (v) VALUES (:v)"), {"v": i})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with reader.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM t")).scalar() == 800
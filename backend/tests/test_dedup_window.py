@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from dedup_window import RecentVoteWindow
+
+
+def test_unloaded_window_covers_nothing():
+    window = RecentVoteWindow(10)
+    window.add(100, "0x1")
+    assert not window.covers(100)
+    assert "0x1" not in window and len(window) == 0
+
+
+def test_reset_keeps_only_blocks_inside_window():
+    window = RecentVoteWindow(10)
+    window.reset(100, [(85, "0xold"), (90, "0xa"), (95, "0xb")])
+    assert window.covers(90) and not window.covers(89)
+    assert "0xold" not in window
+    assert "0xa" in window and "0xb" in window
+
+
+def test_advance_drops_blocks_that_slide_out():
+    window = RecentVoteWindow(10)
+    window.reset(100, [(90, "0xa"), (95, "0xb")])
+    window.add(101, "0xc")
+    window.add(80, "0xlate")  # 窗口之前的区块不保留
+    window.advance(104)
+    assert "0xa" not in window
+    assert "0xb" in window and "0xc" in window and "0xlate" not in window
+    assert len(window) == 2
+    window.advance(50)  # 检查点不会后退
+    assert window.covers(94) and not window.covers(93)
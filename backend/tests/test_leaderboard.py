@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from leaderboard import Leaderboard
+
+VOTES = [
+    (1, "0xa", 1, 50),
+    (2, "0xb", 1, 30),
+    (3, "0xc", 2, 30),
+    (4, "0xd", 2, 10),
+    (5, "0xb", 2, 40),
+]
+
+
+def fetch_from(votes):
+    return lambda after_id: [vote for vote in votes if vote[0] > after_id]
+
+
+def walk(board, limit, team_id=None):
+    pages, after = [], None
+    while True:
+        _, page = board.page(team_id, limit, after)
+        if not page:
+            return pages
+        pages.append(page)
+        _, address, amount, _ = page[-1]
+        after = (amount, address)
+
+
+def test_pages_follow_amount_then_address_order():
+    board = Leaderboard()
+    assert board.sync(fetch_from(VOTES)) == 5
+    pages = walk(board, 2)
+    assert [[row[1] for row in page] for page in pages] == [["0xb", "0xa"], ["0xc", "0xd"]]
+    assert pages[0][0] == (1, "0xb", 70, 2)
+    assert [row[0] for page in pages for row in page] == [1, 2, 3, 4]
+    total, page = board.page(team_id=2, limit=10)
+    assert total == 3 and [row[1] for row in page] == ["0xb", "0xc", "0xd"]
+
+
+def test_keyset_cursor_survives_new_votes_between_pages():
+    votes = list(VOTES)
+    board = Leaderboard()
+    board.sync(fetch_from(votes))
+    _, first = board.page(limit=2)
+    cursor = (first[-1][2], first[-1][1])
+    # 翻页期间新投票让 0xd 升到第一页, 0xe 插在游标之后
+    votes += [(6, "0xd", 1, 100), (7, "0xe", 1, 20)]
+    assert board.sync(fetch_from(votes)) == 2
+    _, second = board.page(limit=10, after=cursor)
+    assert [row[1] for row in second] == ["0xc", "0xe"]
+    assert board.last_vote_id == 7
+
+
+def test_ranks_and_stakes():
+    board = Leaderboard()
+    board.sync(fetch_from(VOTES))
+    overall, teams = board.ranks("0xb")
+    assert overall == (1, 70, 2)
+    assert teams == {1: (2, 30, 1), 2: (1, 40, 1)}
+    assert board.ranks("0xz") == (None, {})
+    last_vote_id, stakes = board.stakes()
+    assert last_vote_id == 5
+    assert stakes == {("0xa", 1): 50, ("0xb", 1): 30, ("0xc", 2): 30, ("0xd", 2): 10, ("0xb", 2): 40}
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+from eth_abi import encode
+from hexbytes import HexBytes
+
+from log_decoder import EventDecoder
+
+with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), "abi.json")) as f:
+    ABI = json.load(f)
+
+DECODER = EventDecoder(ABI, {"NewVote"})
+USER = "0x" + "ab" * 20
+TX_HASH = "0x" + "11" * 32
+BLOCK_HASH = "0x" + "22" * 32
+
+
+def etherscan_log(**overrides):
+    """Etherscan logs API 格式: 全部为十六进制字符串, 自带区块时间"""
+    log = {
+        "topics": [DECODER.topic_by_event["NewVote"], "0x" + "00" * 12 + USER[2:]],
+        "data": "0x" + encode(["uint256", "uint256"], [3, 10 ** 18]).hex(),
+        "blockNumber": "0x10",
+        "blockHash": BLOCK_HASH,
+        "transactionHash": TX_HASH,
+        "logIndex": "0x",
+        "timeStamp": "0x6553f100",
+    }
+    log.update(overrides)
+    return log
+
+
+def test_decodes_etherscan_log():
+    event = DECODER.decode(etherscan_log())
+    assert event.event == "NewVote"
+    assert event.args == {"user": USER, "teamId": 3, "amount": 10 ** 18}
+    assert (event.block_number, event.log_index, event.timestamp) == (16, 0, 0x6553F100)
+    assert event.transaction_hash == TX_HASH and event.block_hash == BLOCK_HASH
+
+
+def test_decodes_web3_log():
+    log = etherscan_log()
+    web3_log = {
+        "topics": [HexBytes(topic) for topic in log["topics"]],
+        "data": HexBytes(log["data"]),
+        "blockNumber": 16,
+        "blockHash": HexBytes(BLOCK_HASH),
+        "transactionHash": HexBytes(TX_HASH.upper().replace("0X", "0x")),
+        "logIndex": 2,
+    }
+    event = DECODER.decode(web3_log)
+    assert event.args == DECODER.decode(log).args
+    assert event.transaction_hash == TX_HASH
+    assert event.log_index == 2 and event.timestamp is None
+
+
+def test_skips_other_events():
+    other = etherscan_log(topics=["0x" + "33" * 32])
+    assert DECODER.decode(other) is None
+    assert DECODER.decode(etherscan_log(topics=[])) is None
+    assert DECODER.decode_many([other, etherscan_log()])[0].event == "NewVote"
+    assert DECODER.topics == [DECODER.topic_by_event["NewVote"]]
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import pytest
+
+# v0 (迁移工具出现之前) 的表结构: 金额和区块号都是字符串列, 还带有 Etherscan 交易字段
+V0_SCHEMA = """
+CREATE TABLE game_state (
+    id INTEGER NOT NULL, status INTEGER, total_prize_pool VARCHAR(50), winning_team_id INTEGER, PRIMARY KEY (id)
+);
+CREATE TABLE team (
+    id INTEGER NOT NULL, name VARCHAR(100), total_vote_amount VARCHAR(50), supporter_count INTEGER, PRIMARY KEY (id)
+);
+CREATE TABLE user_vote (
+    id INTEGER NOT NULL, user_address VARCHAR(42), team_id INTEGER, amount_wei VARCHAR(50),
+    block_number VARCHAR(50), timestamp DATETIME, hash VARCHAR(66), nonce VARCHAR(50), gas VARCHAR(50),
+    input_data TEXT, PRIMARY KEY (id), UNIQUE (hash)
+);
+INSERT INTO game_state VALUES (1, 0, '30000000000000000000', NULL);
+INSERT INTO team VALUES (0, 'Vitality', '20000000000000000000', 1), (1, 'Tyloo', '10000000000000000000', 1);
+INSERT INTO user_vote VALUES
+    (1, '0xABCDEF0000000000000000000000000000000001', 0, '20000000000000000000', '9', '2025-12-01 00:00:00', '0x01', '1', '21000', '0x'),
+    (2, '0x00000000000000000000000000000000000000aa', 1, '10000000000000000000', '10', '2025-12-01 00:00:00', '0x02', '2', '21000', '0x');
+"""
+
+
+@pytest.fixture
+def v0_database(backend):
+    with backend.app.app_context():
+        backend.db.engine.dispose()
+    conn = sqlite3.connect(backend.db_path)
+    tables = [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    for name in tables:
+        conn.execute(f"DROP TABLE {name}")
+    conn.executescript(V0_SCHEMA)
+    conn.execute("PRAGMA user_version = 0")
+    conn.commit()
+    conn.close()
+    return backend
+
+
+def test_app_refuses_old_schema(v0_database):
+    with v0_database.app.app_context():
+        with pytest.raises(RuntimeError, match="migrate_db.py upgrade"):
+            v0_database.init_database()
+
+
+def test_upgrade_v0_to_current(v0_database):
+    import migrate_db
+
+    backend = v0_database
+    migrate_db.upgrade(batch_size=1)
+    conn = sqlite3.connect(backend.db_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == backend.SCHEMA_VERSION
+    # 字符串列 "9" > "10"; 升级后按整数比较
+    assert conn.execute("SELECT max(block_number), typeof(block_number) FROM user_vote").fetchone() == (10, "integer")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(user_vote)")}
+    assert "nonce" not in columns and "gas" not in columns
+    conn.close()
+
+    with backend.app.app_context():
+        backend.init_database()  # 升级后正常启动
+        votes = backend.UserVote.query.order_by(backend.UserVote.id).all()
+        assert [v.user_address for v in votes] == [
+            "0xabcdef0000000000000000000000000000000001", "0x00000000000000000000000000000000000000aa",
+        ]
+        assert [v.amount_wei for v in votes] == [20 * 10 ** 18, 10 * 10 ** 18]
+        assert backend.GameState.query.first().total_prize_pool == 30 * 10 ** 18
+        assert backend.db.session.get(backend.Team, 0).total_vote_amount == 20 * 10 ** 18
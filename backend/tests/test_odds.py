@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from odds import WEI_PER_ETH, OddsTable, distributable, payout_wei
+
+
+def test_distributable_rounds_charity_down():
+    assert distributable(1000) == 900
+    # 慈善部分向下取整, 余数留在可分配金额里
+    assert distributable(1009) == 1009 - 100
+    assert distributable(10 ** 18 + 7) == 10 ** 18 + 7 - (10 ** 18 + 7) // 10
+
+
+def test_payout_is_exact_integer_math():
+    pool = 3 * 10 ** 18 + 1
+    winner_total = 10 ** 18 + 3
+    amount = 10 ** 17 + 11
+    assert payout_wei(amount, pool, winner_total) == amount * distributable(pool) // winner_total
+    assert payout_wei(amount, pool, 0) == 0
+
+
+def test_payouts_of_all_winners_never_exceed_distributable():
+    pool = 10 ** 18 + 1
+    stakes = [1, 2, 3 * 10 ** 15, 10 ** 17 + 13, 333333333333333333]
+    paid = sum(payout_wei(s, pool, sum(stakes)) for s in stakes)
+    assert 0 <= distributable(pool) - paid < len(stakes)
+
+
+def test_odds_table_counts_hypothetical_stake_in_pool_and_team():
+    table = OddsTable(10 * WEI_PER_ETH, {2: 0, 1: 4 * WEI_PER_ETH})
+    assert [team.team_id for team in table.teams] == [1, 2]
+    one, two = table.teams
+    assert one.multiplier == 9 / 4
+    assert one.payout_per_eth_wei == payout_wei(WEI_PER_ETH, 11 * WEI_PER_ETH, 5 * WEI_PER_ETH)
+    assert two.multiplier is None
+    assert two.payout_per_eth_wei == distributable(11 * WEI_PER_ETH)
+    assert table.payouts([WEI_PER_ETH, 0])[1] == [one.payout_per_eth_wei, 0]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+ALICE, BOB = "0x" + "aa" * 20, "0x" + "bb" * 20
+
+
+def add_teams(backend):
+    with backend.app.app_context():
+        backend.db.session.add_all([
+            backend.Team(id=1, name="Vitality", total_vote_amount=0, supporter_count=0),
+            backend.Team(id=2, name="Tyloo", total_vote_amount=0, supporter_count=0),
+        ])
+        backend.db.session.commit()
+
+
+def portfolios(backend):
+    with backend.ReadSession() as session:
+        return {
+            p.user_address: (p.total_votes, p.win_count, p.invested_wei, p.returned_wei, p.votes_json)
+            for p in session.query(backend.UserPortfolio)
+        }
+
+
+def test_incremental_updates_match_full_rebuild(backend, add_votes):
+    add_teams(backend)
+    add_votes([(ALICE, 1, 10 ** 17), (BOB, 2, 3 * 10 ** 17)])
+    add_votes([(ALICE, 2, 2 * 10 ** 17)], block_number=11)
+    incremental = portfolios(backend)
+    assert incremental[ALICE][:4] == (2, 0, 3 * 10 ** 17, 0)
+
+    with backend.app.app_context():
+        backend.rebuild_user_portfolios()
+    assert portfolios(backend) == incremental
+
+
+def test_voting_history_reads_portfolio(backend, add_votes):
+    add_teams(backend)
+    add_votes([(ALICE, 1, 10 ** 17), (ALICE, 2, 2 * 10 ** 17)])
+    client = backend.app.test_client()
+
+    body = client.get(f"/api/voting_history/{ALICE.upper().replace('0X', '0x')}").get_json()
+    assert body["total_votes"] == 2
+    assert body["total_invested_eth"] == 0.3
+    assert [(v["team_name"], v["amount_eth"], v["status"]) for v in body["votes"]] == [
+        ("Vitality", 0.1, "Pending"), ("Tyloo", 0.2, "Pending"),
+    ]
+    assert body["settlement"] == []
+
+    assert client.get(f"/api/voting_history/{BOB}").get_json()["total_votes"] == 0
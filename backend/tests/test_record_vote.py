@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+from eth_abi import encode
+from hexbytes import HexBytes
+from web3.exceptions import TransactionNotFound
+
+HEAD = 1000
+VOTER = "0x" + "ab" * 20
+
+
+def tx(n):
+    return f"0x{n:064x}"
+
+
+class Chain:
+    """回执按交易哈希返回, 不存在的交易抛出 TransactionNotFound"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.receipts = {}
+        self.block_number = HEAD
+        self.from_wei = backend.web3.from_wei
+
+    @property
+    def eth(self):
+        return self
+
+    def get_transaction_receipt(self, tx_hash):
+        if tx_hash not in self.receipts:
+            raise TransactionNotFound(tx_hash)
+        return self.receipts[tx_hash]
+
+    def get_block(self, block_number):
+        return {"timestamp": 1_700_000_000 + block_number}
+
+    def mine(self, tx_hash, block_number, status=1, team_id=1, amount_wei=10 ** 17):
+        self.receipts[tx_hash] = {"status": status, "blockNumber": block_number, "logs": [{
+            "address": self.backend.contract.address,
+            "topics": [
+                HexBytes(self.backend.event_decoder.topic_by_event["NewVote"]),
+                HexBytes("0x" + "00" * 12 + VOTER[2:]),
+            ],
+            "data": HexBytes(encode(["uint256", "uint256"], [team_id, amount_wei])),
+            "blockNumber": block_number,
+            "blockHash": HexBytes(f"0x{block_number:064x}"),
+            "transactionHash": HexBytes(tx_hash),
+            "logIndex": 0,
+        }]}
+
+
+@pytest.fixture
+def chain(backend, monkeypatch):
+    chain = Chain(backend)
+    monkeypatch.setattr(backend, "web3", chain)
+    return chain
+
+
+def submit(backend, tx_hash):
+    response = backend.app.test_client().post("/api/record_vote", json={"txHash": tx_hash})
+    return response.status_code, response.get_json()
+
+
+def pending(backend):
+    with backend.ReadSession() as session:
+        return {row.hash for row in session.query(backend.PendingVote)}
+
+
+def test_submission_is_queued_once(backend):
+    assert submit(backend, "0x1234")[0] == 400
+    assert submit(backend, tx(1).upper().replace("0X", "0x")) == (
+        202, {"message": "Vote queued for verification", "status": "queued", "txHash": tx(1)}
+    )
+    assert submit(backend, tx(1))[1]["status"] == "duplicate"
+    assert pending(backend) == {tx(1)}
+
+
+def test_confirmed_receipt_is_recorded(backend, chain):
+    submit(backend, tx(1))
+    chain.mine(tx(1), HEAD - backend.FINALITY_DEPTH)
+    assert backend.ingest_submitted_votes() == 1
+    assert pending(backend) == set()
+    with backend.ReadSession() as session:
+        vote = session.query(backend.UserVote).one()
+        assert (vote.hash, vote.user_address, vote.team_id, vote.amount_wei) == (tx(1), VOTER, 1, 10 ** 17)
+    assert submit(backend, tx(1)) == (200, {"message": "Vote already recorded", "status": "recorded", "txHash": tx(1)})
+
+
+def test_unconfirmed_receipt_is_buffered(backend, chain):
+    submit(backend, tx(1))
+    chain.mine(tx(1), HEAD - backend.FINALITY_DEPTH + 1)
+    assert backend.ingest_submitted_votes() == 1
+    with backend.ReadSession() as session:
+        assert session.query(backend.UserVote).count() == 0
+        assert [row.hash for row in session.query(backend.UnconfirmedVote)] == [tx(1)]
+    assert pending(backend) == set()
+
+
+def test_reverted_and_unmined_transactions(backend, chain):
+    submit(backend, tx(1))
+    submit(backend, tx(2))
+    chain.mine(tx(1), HEAD - backend.FINALITY_DEPTH, status=0)
+    assert backend.ingest_submitted_votes() == 0
+    # 回滚的交易直接丢弃; 还没上链的稍后重试
+    assert pending(backend) == {tx(2)}
+    assert backend.ingest_submitted_votes() == 0  # 还没到重试时间
+    with backend.ReadSession() as session:
+        assert session.query(backend.UserVote).count() == 0
+        retry_at = session.get(backend.PendingVote, tx(2)).next_attempt_at
+    assert retry_at > time.time()
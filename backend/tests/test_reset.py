@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from leader import LeaderLock
+
+
+def fill_tables(backend, add_votes):
+    add_votes([("0x" + "ab" * 20, 1, 10 ** 17)])
+    with backend.app.app_context():
+        backend.submit_pending_vote("0x" + "cd" * 32)
+        backend.db.session.add_all([
+            backend.Weapon(hash_name="AK-47 | Redline (Field-Tested)", price_usd=30.0),
+            backend.SnapshotVersion(name="teams", version=7),
+            backend.SyncLeader(id=1, pid=1, phase="ready", ready=True, heartbeat_at=0.0),
+            backend.SyncCheckpoint(name=backend.LOG_INDEXER_CHECKPOINT, block_number=10),
+        ])
+        backend.db.session.commit()
+
+
+def row_counts(backend):
+    with backend.ReadSession() as session:
+        return {
+            table.name: len(session.execute(table.select()).fetchall())
+            for table in backend.db.metadata.sorted_tables
+        }
+
+
+def test_reset_clears_every_derived_table(backend, add_votes, monkeypatch, tmp_path):
+    monkeypatch.setattr(backend, "sync_leader", LeaderLock(str(tmp_path / "sync.lock")))
+    fill_tables(backend, add_votes)
+    assert backend.auto_reset_database()
+    counts = row_counts(backend)
+    assert counts.pop("weapon") == 1 and counts.pop("game_state") == 1
+    assert counts.pop("team") == 0  # 合约不可达, 战队留到下次同步
+    assert set(counts.values()) == {0}, counts
+
+
+def test_reset_refuses_while_server_runs(backend, add_votes, monkeypatch, tmp_path):
+    running = LeaderLock(str(tmp_path / "sync.lock"))
+    assert running.try_acquire()
+    monkeypatch.setattr(backend, "sync_leader", LeaderLock(str(tmp_path / "sync.lock")))
+    fill_tables(backend, add_votes)
+    assert not backend.auto_reset_database()
+    assert row_counts(backend)["user_vote"] == 1
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from odds import distributable
+
+POOL_EXTRA = 10 ** 18  # 合约奖池里不属于任何已入库投票的部分 (例如直接转入的资金)
+
+
+def addresses(n):
+    return [f"0x{i:040x}" for i in range(1, n + 1)]
+
+
+def finish_game(backend, votes, winner=1):
+    """按投票写入战队累计和奖池, 并把游戏状态设为 Finished"""
+    totals = {}
+    for _, team_id, amount_wei in votes:
+        totals[team_id] = totals.get(team_id, 0) + amount_wei
+    pool = sum(totals.values()) + POOL_EXTRA
+    with backend.app.app_context():
+        for team_id, total in totals.items():
+            backend.db.session.add(backend.Team(id=team_id, name=f"T{team_id}", total_vote_amount=total, supporter_count=0))
+        backend.db.session.add(backend.GameState(id=1, status=2, winning_team_id=winner, total_prize_pool=pool))
+        backend.db.session.commit()
+    return pool, totals
+
+
+def settle(backend):
+    with backend.app.app_context():
+        backend.settle_and_rebuild_portfolios()
+
+
+def stored_results(backend):
+    with backend.ReadSession() as session:
+        payouts = {(r.user_address, r.team_id): r.payout_wei for r in session.query(backend.Settlement)}
+        returned = {p.user_address: p.returned_wei for p in session.query(backend.UserPortfolio)}
+        summary = session.get(backend.SettlementSummary, 1)
+        return payouts, returned, summary
+
+
+def test_settlement_matches_brute_force(backend, add_votes):
+    votes = [(address, i % 3, (i + 1) * 10 ** 15 + i) for i, address in enumerate(addresses(40) * 2)]
+    add_votes(votes)
+    pool, totals = finish_game(backend, votes)
+    settle(backend)
+
+    stakes = {}
+    for address, team_id, amount_wei in votes:
+        stakes[(address, team_id)] = stakes.get((address, team_id), 0) + amount_wei
+    expected = {
+        key: staked * distributable(pool) // totals[1] if key[1] == 1 else 0
+        for key, staked in stakes.items()
+    }
+    payouts, returned, summary = stored_results(backend)
+    assert payouts == expected
+    assert summary.checksum_ok and summary.entry_count == len(expected)
+    for address in addresses(40):
+        assert returned[address] == sum(p for (a, _), p in expected.items() if a == address)
+
+
+def test_late_vote_updates_only_its_entry(backend, add_votes):
+    votes = [(address, 1, 10 ** 17) for address in addresses(5)]
+    add_votes(votes)
+    pool, totals = finish_game(backend, votes + [(addresses(1)[0], 1, 10 ** 17)])
+    settle(backend)
+    assert not stored_results(backend)[2].checksum_ok  # 合约累计中的一笔还没有入库
+
+    add_votes([(addresses(1)[0], 1, 10 ** 17)])
+    payouts, returned, summary = stored_results(backend)
+    assert payouts[(addresses(1)[0], 1)] == 2 * 10 ** 17 * distributable(pool) // totals[1]
+    assert returned[addresses(1)[0]] == payouts[(addresses(1)[0], 1)]
+    assert summary.checksum_ok
+
+
+def test_writes_proceed_while_settling_and_rebuilding(backend, add_votes, monkeypatch):
+    """结算和重算在只读会话里遍历和计算, 期间其他线程的写事务不必等待写锁"""
+    votes = [(address, i % 2, 10 ** 16) for i, address in enumerate(addresses(30))]
+    add_votes(votes)
+    finish_game(backend, votes)
+    scanning = backend.yield_periodically
+    writes = []
+
+    def write_meanwhile(rows, every=backend.VOTE_INDEX_CHUNK_SIZE):
+        thread = threading.Thread(target=backend.write_leader_heartbeat)
+        thread.start()
+        thread.join(timeout=2)
+        writes.append(not thread.is_alive())
+        yield from scanning(rows, every)
+
+    monkeypatch.setattr(backend, "yield_periodically", write_meanwhile)
+    settle(backend)
+    assert writes and all(writes)
+    with backend.ReadSession() as session:
+        assert session.get(backend.SyncLeader, 1) is not None
+    assert stored_results(backend)[2].checksum_ok
+
+
+def test_rebuild_repairs_votes_committed_between_batches(backend, add_votes, monkeypatch):
+    votes = [(address, 1, 10 ** 16) for address in addresses(10)]
+    add_votes(votes)
+    late = (addresses(11)[-1], 1, 10 ** 16)
+    finish_game(backend, votes + [late])
+    batches = backend.upsert_in_batches
+    pending = [late]
+
+    def ingest_between(table, rows, index_elements):
+        batches(table, rows, index_elements)
+        if pending:
+            add_votes([pending.pop()])
+
+    monkeypatch.setattr(backend, "upsert_in_batches", ingest_between)
+    settle(backend)
+    monkeypatch.setattr(backend, "upsert_in_batches", batches)
+    payouts, returned, summary = stored_results(backend)
+    assert summary.checksum_ok and summary.entry_count == 11
+    before = returned
+    with backend.app.app_context():
+        backend.rebuild_user_portfolios()
+    assert stored_results(backend)[1] == before
+
+
+def test_failed_settlement_is_retried_from_state(backend, add_votes, monkeypatch):
+    votes = [(address, 1, 10 ** 16) for address in addresses(5)]
+    add_votes(votes)
+    finish_game(backend, votes)
+    monkeypatch.setattr(backend, "save_all_user_votes_to_database", lambda: 0)
+    rebuild = backend.rebuild_user_portfolios
+
+    def fail():
+        raise RuntimeError("worker killed")
+
+    monkeypatch.setattr(backend, "rebuild_user_portfolios", fail)
+    assert not backend.settle_if_needed()
+    assert stored_results(backend)[2].last_vote_id == 0  # 已结算但持仓还没有重算
+    assert backend.settlement_pending()
+
+    monkeypatch.setattr(backend, "rebuild_user_portfolios", rebuild)
+    monkeypatch.setattr(backend, "settlement_retry_at", 0.0)  # 跳过失败后的重试间隔
+    assert backend.settle_if_needed()
+    assert not backend.settlement_pending()
+    assert not backend.settle_if_needed()
+
+    # 结算后补录的投票增量并入并推进水位, 不会触发重新结算
+    add_votes([(addresses(6)[-1], 1, 10 ** 16)])
+    assert not backend.settlement_pending()
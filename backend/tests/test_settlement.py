@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from odds import distributable
+from settlement import FINISHED, REFUNDING, settle, settle_entry, verify
+
+STAKES = [
+    ("0xa", 1, 10 ** 18 + 1),
+    ("0xb", 1, 2 * 10 ** 18 + 5),
+    ("0xb", 2, 7 * 10 ** 17),
+    ("0xc", 1, 333333333333333333),
+]
+POOL = sum(staked for _, _, staked in STAKES)
+WINNER_TOTAL = sum(staked for _, team_id, staked in STAKES if team_id == 1)
+
+
+def test_finished_pays_winners_pro_rata_and_rounds_down():
+    result = settle(STAKES, FINISHED, POOL, winning_team_id=1, winner_total_wei=WINNER_TOTAL)
+    payouts = {(row.user_address, row.team_id): row.payout_wei for row in result.rows}
+    for address, team_id, staked in STAKES:
+        expected = staked * distributable(POOL) // WINNER_TOTAL if team_id == 1 else 0
+        assert payouts[(address, team_id)] == expected
+    assert result.expected_wei == distributable(POOL)
+    assert result.payout_entries == 3
+    assert result.payout_stake_wei == WINNER_TOTAL
+    assert 0 <= result.dust_wei < result.payout_entries
+    assert result.checksum_ok
+
+
+def test_finished_checksum_fails_when_winner_votes_are_missing():
+    result = settle(STAKES[1:], FINISHED, POOL, winning_team_id=1, winner_total_wei=WINNER_TOTAL)
+    assert not result.checksum_ok
+
+
+def test_refunding_returns_every_stake():
+    result = settle(STAKES, REFUNDING, POOL)
+    assert {row.outcome for row in result.rows} == {"Refunded"}
+    assert result.paid_wei == POOL and result.dust_wei == 0
+    assert result.checksum_ok
+    assert not settle(STAKES[:-1], REFUNDING, POOL).checksum_ok
+
+
+def test_settle_entry_matches_batch_and_rejects_open_game():
+    result = settle(STAKES, FINISHED, POOL, winning_team_id=1, winner_total_wei=WINNER_TOTAL)
+    for row, (address, team_id, staked) in zip(result.rows, STAKES):
+        assert settle_entry(FINISHED, address, team_id, staked, POOL, 1, WINNER_TOTAL) == row
+    with pytest.raises(ValueError):
+        settle_entry(1, "0xa", 1, 1, POOL)
+
+
+def test_verify_bounds_dust_by_payout_entries():
+    expected = distributable(POOL)
+    assert verify(FINISHED, expected, expected - 2, WINNER_TOTAL, 3, WINNER_TOTAL)
+    assert not verify(FINISHED, expected, expected - 3, WINNER_TOTAL, 3, WINNER_TOTAL)
+    assert not verify(FINISHED, expected, expected + 1, WINNER_TOTAL, 3, WINNER_TOTAL)
+    assert not verify(FINISHED, expected, expected, WINNER_TOTAL - 1, 3, WINNER_TOTAL)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from snapshot_cache import SnapshotCache
+
+
+def test_rebuild_only_reports_real_changes():
+    data = {"value": 1}
+    changes = []
+    cache = SnapshotCache()
+    cache.register("stats", lambda: dict(data))
+    cache.add_listener(lambda name, snapshot: changes.append((name, snapshot.etag)))
+
+    assert cache.peek("stats") is None
+    first = cache.get("stats")
+    assert first.body == b'{"value":1}'
+    assert cache.rebuild("stats") == []  # 内容没变: ETag 不变, 不通知
+    data["value"] = 2
+    assert cache.rebuild() == ["stats"]
+    assert cache.peek("stats").etag != first.etag
+    assert [etag for _, etag in changes] == [first.etag, cache.peek("stats").etag]
+
+
+def test_status_endpoint_supports_conditional_requests(backend):
+    with backend.app.app_context():
+        backend.db.session.add(backend.GameState(id=1, status=0, total_prize_pool=10 ** 18))
+        backend.db.session.commit()
+    backend.snapshots.rebuild("status")
+    client = backend.app.test_client()
+
+    response = client.get("/api/status")
+    etag = response.headers["ETag"]
+    assert response.status_code == 200 and response.get_json()["status"] == 0
+    not_modified = client.get("/api/status", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304 and not_modified.data == b""
+
+    with backend.app.app_context():
+        backend.GameState.query.first().status = 1
+        backend.db.session.commit()
+    backend.snapshots.rebuild("status")
+    changed = client.get("/api/status", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert changed.get_json()["status"] == 1
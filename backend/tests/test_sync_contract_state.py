@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from contract_state import ContractState
+
+
+def state(block_number, status, pool=10 ** 18):
+    return ContractState(block_number, status, pool, 1 if status == 2 else 0, ((1, "A", 0, 0), (2, "B", 0, 0)))
+
+
+def sync(backend, monkeypatch, contract_state):
+    monkeypatch.setattr(backend.contract_reader, "read", lambda block_number=None: contract_state)
+    return backend.sync_contract_state(contract_state.block_number)
+
+
+def stored_status(backend):
+    with backend.ReadSession() as session:
+        return session.query(backend.GameState).first().status
+
+
+def test_older_state_is_not_applied(backend, monkeypatch):
+    monkeypatch.setattr(backend, "settle_if_needed", lambda: False)
+    monkeypatch.setattr(backend, "save_all_user_votes_to_database", lambda: 0)
+    sync(backend, monkeypatch, state(100, 2))
+    assert stored_status(backend) == 2
+
+    # 并发的另一次同步读到的是更早区块上的状态: 丢弃, 不让状态回到 Open
+    assert sync(backend, monkeypatch, state(90, 0)).block_number == 100
+    assert stored_status(backend) == 2
+
+    sync(backend, monkeypatch, state(110, 2, pool=2 * 10 ** 18))
+    assert backend.last_contract_state.block_number == 110
+    with backend.ReadSession() as session:
+        assert session.query(backend.GameState).first().total_prize_pool == 2 * 10 ** 18
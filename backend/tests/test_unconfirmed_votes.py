@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import pytest
+from eth_abi import encode
+
+from log_decoder import EventDecoder
+
+with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), "abi.json")) as f:
+    NEW_VOTE_TOPIC = EventDecoder(json.load(f), {"NewVote"}).topic_by_event["NewVote"]
+
+
+def vote_log(tx, block_number, block_hash, team_id, amount_wei):
+    return {
+        "topics": [NEW_VOTE_TOPIC, "0x" + "00" * 12 + "ab" * 20],
+        "data": "0x" + encode(["uint256", "uint256"], [team_id, amount_wei]).hex(),
+        "blockNumber": hex(block_number),
+        "blockHash": block_hash,
+        "transactionHash": tx,
+        "logIndex": "0x0",
+        "timeStamp": hex(1_700_000_000 + block_number),
+    }
+
+
+TX_A, TX_B = "0x" + "a1" * 32, "0x" + "b2" * 32
+
+
+@pytest.fixture
+def chain(backend, monkeypatch):
+    """fetch_contract_logs 返回 chain["logs"] 中落在请求区间内的日志"""
+    state = {"logs": []}
+    monkeypatch.setattr(backend, "fetch_contract_logs", lambda from_block, to_block: [
+        log for log in state["logs"] if from_block <= int(log["blockNumber"], 16) <= to_block
+    ])
+    return state
+
+
+def buffered(backend):
+    with backend.ReadSession() as session:
+        rows = session.query(backend.UnconfirmedVote.hash, backend.UnconfirmedVote.block_hash).all()
+        return dict(rows), backend.get_unconfirmed_totals(session)
+
+
+def test_reorg_rolls_back_dropped_votes(backend, chain):
+    chain["logs"] = [
+        vote_log(TX_A, 10, "0x" + "01" * 32, 1, 10 ** 18),
+        vote_log(TX_B, 11, "0x" + "02" * 32, 2, 5 * 10 ** 17),
+    ]
+    assert backend.refresh_unconfirmed_votes(10, 12) == 2
+    assert buffered(backend)[1] == {1: (1, 10 ** 18), 2: (1, 5 * 10 ** 17)}
+    assert backend.refresh_unconfirmed_votes(10, 12) == 0
+
+    # 区块 11 被替换, B 不再出现: 撤回 B, A 保留
+    chain["logs"] = chain["logs"][:1]
+    assert backend.refresh_unconfirmed_votes(10, 12) == 1
+    hashes, totals = buffered(backend)
+    assert list(hashes) == [TX_A]
+    assert totals == {1: (1, 10 ** 18)}
+
+
+def test_reorg_moves_vote_to_new_block_hash(backend, chain):
+    chain["logs"] = [vote_log(TX_A, 10, "0x" + "01" * 32, 1, 10 ** 18)]
+    backend.refresh_unconfirmed_votes(10, 12)
+    # 同一交易被重新打包进新的区块 11: 旧记录撤回, 按新的区块哈希重新缓冲
+    chain["logs"] = [vote_log(TX_A, 11, "0x" + "03" * 32, 1, 10 ** 18)]
+    assert backend.refresh_unconfirmed_votes(10, 12) == 2
+    hashes, totals = buffered(backend)
+    assert hashes == {TX_A: "0x" + "03" * 32}
+    assert totals == {1: (1, 10 ** 18)}
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from vote_flow import GWEI, MAX_QUERY_BUCKETS, VoteFlow
+
+T0 = 1_700_000_000 - 1_700_000_000 % 86400  # 某天 00:00
+
+
+def fetch_from(votes):
+    return lambda after_id: [vote for vote in votes if vote[0] > after_id]
+
+
+def test_votes_are_bucketed_per_minute_hour_and_day():
+    votes = [
+        (1, 1, 2 * GWEI, T0 + 5),
+        (2, 1, 3 * GWEI + 999, T0 + 59),  # 不足 1 gwei 的部分舍去
+        (3, 1, GWEI, T0 + 60),
+        (4, 2, 4 * GWEI, T0 + 3600),
+        (5, 1, GWEI, None),  # 没有时间的投票只推进水位
+    ]
+    flow = VoteFlow()
+    assert flow.sync(fetch_from(votes)) == 4
+    assert flow.last_vote_id == 5
+
+    minutes = flow.query(T0, T0 + 119, points=10, resolution="minute")
+    team1 = minutes["teams"][0]
+    assert minutes["timestamps"] == [T0, T0 + 60]
+    assert team1["vote_counts"] == [2, 1] and team1["stakes_gwei"] == [5, 1]
+    assert team1["cumulative_gwei"] == [5, 6]
+
+    hours = flow.query(T0, T0 + 7199, points=10, resolution="hour")
+    assert [team["vote_counts"] for team in hours["teams"]] == [[3, 0], [0, 1]]
+    days = flow.query(T0, T0 + 86399, points=10, resolution="day")
+    assert [team["stakes_gwei"] for team in days["teams"]] == [[6], [4]]
+
+
+def test_minute_window_trims_old_buckets_but_keeps_totals():
+    votes = [(i + 1, 1, GWEI, T0 + i * 60) for i in range(5)]
+    flow = VoteFlow(minute_buckets=3)
+    flow.sync(fetch_from(votes))
+    assert flow.minute_floor() == T0 + 120
+    minutes = flow.query(T0, T0 + 299, points=10, resolution="minute")
+    assert minutes["timestamps"][0] == T0 + 120
+    assert minutes["teams"][0]["cumulative_gwei"] == [3, 4, 5]
+    # 早于窗口的迟到投票只计入移出部分的合计
+    flow.sync(fetch_from(votes + [(6, 1, GWEI, T0)]))
+    assert flow.query(T0, T0 + 299, points=10, resolution="minute")["teams"][0]["cumulative_gwei"] == [4, 5, 6]
+
+
+def test_automatic_resolution_and_grouping():
+    votes = [(i + 1, 1, GWEI, T0 + i * 3600) for i in range(48)]
+    flow = VoteFlow()
+    flow.sync(fetch_from(votes))
+    result = flow.query(T0, T0 + 48 * 3600 - 1, points=24)
+    assert result["resolution"] == "day"
+    result = flow.query(T0, T0 + 48 * 3600 - 1, points=24, resolution="hour")
+    assert result["bucket_seconds"] == 7200
+    assert result["teams"][0]["vote_counts"] == [2] * 24
+
+
+def test_long_ranges_are_clamped_to_the_bucket_limit():
+    flow = VoteFlow(minute_buckets=3)
+    flow.sync(fetch_from([(1, 1, GWEI, T0)]))
+    # 最后一笔投票很早, end 是一年之后: 分钟粒度只展开保留窗口, 其他粒度不超过 MAX_QUERY_BUCKETS
+    end = T0 + 365 * 86400
+    minutes = flow.query(T0, end, points=2000, resolution="minute")
+    assert len(minutes["timestamps"]) == 3
+    assert minutes["teams"][0]["vote_counts"] == [1, 0, 0]
+    hours = flow.query(T0, end, points=2000, resolution="hour")
+    assert hours["timestamps"][-1] - hours["timestamps"][0] < MAX_QUERY_BUCKETS * 3600
+    assert sum(hours["teams"][0]["vote_counts"]) == 1
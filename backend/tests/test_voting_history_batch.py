@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import json
+
+ALICE, BOB, CAROL = "0x" + "aa" * 20, "0x" + "bb" * 20, "0x" + "cc" * 20
+
+
+def post(backend, payload):
+    return backend.app.test_client().post("/api/voting_history", json=payload)
+
+
+def test_streams_one_line_per_address_in_request_order(backend, add_votes, monkeypatch):
+    monkeypatch.setattr(backend, "HISTORY_BATCH_CHUNK_SIZE", 2)
+    add_votes([(ALICE, 1, 10 ** 17), (BOB, 2, 2 * 10 ** 17), (BOB, 1, 10 ** 17)])
+    response = post(backend, {"addresses": [BOB, "not-an-address", CAROL, ALICE.upper().replace("0X", "0x"), 7]})
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line["address"] for line in lines] == [BOB, "not-an-address", CAROL, ALICE, 7]
+    assert lines[1] == {"address": "not-an-address", "error": "invalid address"}
+    assert lines[4]["error"] == "invalid address"
+    assert (lines[0]["total_votes"], lines[2]["total_votes"], lines[3]["total_votes"]) == (2, 0, 1)
+    # 与单个地址接口的内容一致
+    single = backend.app.test_client().get(f"/api/voting_history/{BOB}").get_json()
+    assert {k: v for k, v in lines[0].items() if k != "address"} == single
+
+
+def test_rejects_bad_requests(backend, monkeypatch):
+    assert post(backend, {}).status_code == 400
+    assert post(backend, {"addresses": []}).status_code == 400
+    monkeypatch.setattr(backend, "HISTORY_BATCH_MAX_ADDRESSES", 2)
+    assert post(backend, {"addresses": [ALICE, BOB, CAROL]}).status_code == 400
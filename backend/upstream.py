@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""上游调用预算与统计
+
+每个上游 (RPC 节点、Etherscan、各行情接口) 一个 UpstreamBudget: 调用前从令牌桶
+取令牌 (超出预算时排队等待), 调用后记录次数、耗时、错误和限流 (HTTP 429 /
+"rate limit") 次数, 供 /api/upstreams 报告; on_call / on_error 回调把同样的信息
+送进 /metrics. RPC 调用通过 web3 中间件统一计入.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from web3.middleware.base import Web3Middleware
+
+from rate_limit import TokenBucket
+
+# JSON-RPC 节点常用的限流错误码
+RATE_LIMIT_ERROR_CODES = {429, -32005, -32029}
+
+
+def is_rate_limited(error):
+    """异常或 JSON-RPC 错误对象是否表示被上游限流"""
+    if isinstance(error, dict):
+        return error.get("code") in RATE_LIMIT_ERROR_CODES or "rate limit" in str(error.get("message", "")).lower()
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 429
+    text = str(error).lower()
+    return "429" in text or "rate limit" in text
+
+
+class UpstreamBudget:
+    """一个上游的令牌桶预算和调用统计"""
+
+    def __init__(self, name, rate, capacity=None, wait_timeout=60, on_call=None, on_error=None):
+        self.name = name
+        self.on_call = on_call  # on_call(name, 调用耗时, 等待预算的时间)
+        self.on_error = on_error  # on_error(name, 是否被限流)
+        self.bucket = TokenBucket(rate, capacity)
+        self.wait_timeout = wait_timeout
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.throttled = 0  # 因预算不足而等待的调用数
+        self.throttled_seconds = 0.0
+        self.call_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1, timeout=None):
+        """取令牌, 预算不足时等待并返回等待的秒数; 超过 timeout (默认 wait_timeout) 秒仍未取得时抛出异常"""
+        if self.bucket.try_acquire(tokens):
+            return 0.0
+        started = time.monotonic()
+        acquired = self.bucket.acquire(tokens, timeout=self.wait_timeout if timeout is None else timeout)
+        waited = time.monotonic() - started
+        with self._lock:
+            self.throttled += 1
+            self.throttled_seconds += waited
+        if not acquired:
+            raise TimeoutError(f"{self.name} call budget exhausted")
+        return waited
+
+    def record_error(self, error):
+        rate_limited = is_rate_limited(error)
+        with self._lock:
+            self.errors += 1
+            if rate_limited:
+                self.rate_limited += 1
+        if self.on_error is not None:
+            self.on_error(self.name, rate_limited)
+
+    @contextmanager
+    def call(self, tokens=1, timeout=None):
+        """with budget.call(): ... —— 计入预算并统计一次调用"""
+        waited = self.acquire(tokens, timeout)
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.record_error(e)
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self.calls += tokens
+                self.call_seconds += elapsed
+            if self.on_call is not None:
+                self.on_call(self.name, elapsed, waited)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate_per_second": self.bucket.rate,
+                "calls": self.calls,
+                "errors": self.errors,
+                "rate_limited": self.rate_limited,
+                "throttled": self.throttled,
+                "throttled_seconds": round(self.throttled_seconds, 3),
+                "call_seconds": round(self.call_seconds, 3),
+            }
+
+
+class UpstreamRegistry:
+    """按名称懒创建的上游预算集合, 回调传给其中每个预算"""
+
+    def __init__(self, on_call=None, on_error=None):
+        self._budgets = {}
+        self._lock = threading.Lock()
+        self._on_call = on_call
+        self._on_error = on_error
+
+    def get(self, name, rate, capacity=None):
+        """返回名为 name 的预算, 第一次使用时按 rate 创建"""
+        with self._lock:
+            budget = self._budgets.get(name)
+            if budget is None:
+                budget = self._budgets[name] = UpstreamBudget(
+                    name, rate, capacity, on_call=self._on_call, on_error=self._on_error
+                )
+            return budget
+
+    def stats(self):
+        with self._lock:
+            budgets = list(self._budgets.values())
+        return {budget.name: budget.stats() for budget in budgets}
+
+
+def budget_middleware(budget):
+    """把每个 JSON-RPC 请求 (批量请求按调用数) 计入 budget 的 web3 中间件"""
+
+    class UpstreamBudgetMiddleware(Web3Middleware):
+        def wrap_make_request(self, make_request):
+            def middleware(method, params):
+                with budget.call():
+                    response = make_request(method, params)
+                if "error" in response:
+                    budget.record_error(response["error"])
+                return response
+            return middleware
+
+        def wrap_make_batch_request(self, make_batch_request):
+            def middleware(requests_info):
+                with budget.call(tokens=len(requests_info)):
+                    response = make_batch_request(requests_info)
+                if isinstance(response, dict) and "error" in response:
+                    budget.record_error(response["error"])
+                return response
+            return middleware
+
+    return UpstreamBudgetMiddleware
+
+
+class Backoff:
+    """指数退避: 每次失败间隔翻倍 (限流时翻两倍), 成功后复位; 实际等待为 0.5~1 倍的随机抖动"""
+
+    def __init__(self, base, maximum):
+        self.base = base
+        self.maximum = maximum
+        self.failures = 0
+
+    def success(self):
+        self.failures = 0
+
+    def failure(self, rate_limited=False):
+        self.failures += 2 if rate_limited else 1
+
+    def delay(self):
+        if not self.failures:
+            return 0.0
+        delay = min(self.maximum, self.base * 2 ** min(self.failures, 16))
+        return delay * random.uniform(0.5, 1.0)
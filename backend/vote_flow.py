@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""按时间分桶的投票流量
+
+每个战队在分钟、小时、天三种粒度上各有一条序列: 每个桶的投票数和投入, 存在
+两个紧凑的 array 里 (投票数 uint32, 投入按 gwei 取整为 int64), 下标即
+"时间戳 // 桶宽" 相对于序列起点的偏移. 小时和天序列保留全部历史 (两周的比赛
+每个战队约 4 KB); 分钟序列只保留最近 minute_buckets 个桶, 更早的桶移出时把
+它们的合计记进 trimmed_*, 累计值仍然精确.
+
+与排行榜一样按 UserVote 的自增 id 同步: sync() 只读取 id 大于水位的投票,
+第一次同步即一次遍历全部投票. 一批投票先按 (战队, 分钟) 合并, 每个分钟桶只写
+一次三种粒度的序列.
+"""
+import math
+import threading
+from array import array
+
+GWEI = 10 ** 9
+RESOLUTIONS = (("minute", 60), ("hour", 3600), ("day", 86400))
+MAX_QUERY_BUCKETS = 10000  # 小时/天粒度一次查询最多展开的桶数 (分钟粒度以保留窗口为限)
+
+
+def zeros(typecode, n):
+    return array(typecode, bytes(array(typecode).itemsize * n))
+
+
+class BucketSeries:
+    """一种粒度的连续桶序列"""
+
+    def __init__(self, width, max_buckets=None):
+        self.width = width
+        self.max_buckets = max_buckets
+        self.start = None  # 第一个桶的下标 (时间戳 // width)
+        self.counts = array("I")
+        self.stakes = array("q")  # gwei
+        self.trimmed_count = 0  # 已移出窗口的桶的合计
+        self.trimmed_gwei = 0
+
+    @property
+    def end(self):
+        """最后一个桶之后的下标"""
+        return self.start + len(self.counts)
+
+    def add(self, timestamp, count, gwei):
+        index = timestamp // self.width
+        if self.start is None:
+            self.start = index
+        if index < self.start:
+            if self.max_buckets is not None and self.end - index > self.max_buckets:
+                # 早于分钟窗口的迟到投票只计入移出部分的合计
+                self.trimmed_count += count
+                self.trimmed_gwei += gwei
+                return
+            self.counts[0:0] = zeros("I", self.start - index)
+            self.stakes[0:0] = zeros("q", self.start - index)
+            self.start = index
+        offset = index - self.start
+        if offset >= len(self.counts):
+            self.counts.extend(zeros("I", offset - len(self.counts) + 1))
+            self.stakes.extend(zeros("q", offset - len(self.stakes) + 1))
+        self.counts[offset] += count
+        self.stakes[offset] += gwei
+        if self.max_buckets is not None and len(self.counts) > self.max_buckets:
+            drop = len(self.counts) - self.max_buckets
+            self.trimmed_count += sum(self.counts[:drop])
+            self.trimmed_gwei += sum(self.stakes[:drop])
+            del self.counts[:drop]
+            del self.stakes[:drop]
+            self.start += drop
+
+    def window(self, first, last):
+        """下标 [first, last] 的 (投票数, gwei) 列表 (无数据的桶为 0), 以及 first 之前的累计投入"""
+        if self.start is None:
+            return [0] * (last - first + 1), [0] * (last - first + 1), 0
+        lo = max(first, self.start) - self.start
+        hi = min(last + 1, self.end) - self.start
+        counts, stakes = [0] * (last - first + 1), [0] * (last - first + 1)
+        if lo < hi:
+            pad = max(first, self.start) - first
+            counts[pad:pad + hi - lo] = self.counts[lo:hi]
+            stakes[pad:pad + hi - lo] = self.stakes[lo:hi]
+        before = self.trimmed_gwei + sum(self.stakes[:max(0, min(first, self.end) - self.start)])
+        return counts, stakes, before
+
+
+class VoteFlow:
+    """各战队的分钟/小时/天序列, 以及已并入的 UserVote id 水位"""
+
+    def __init__(self, minute_buckets=1440):
+        self.minute_buckets = minute_buckets
+        self.teams = {}  # team_id -> {粒度名: BucketSeries}
+        self.first_timestamp = None
+        self.latest_timestamp = None
+        self.last_vote_id = None  # None 表示尚未从数据库加载
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.last_vote_id is not None
+
+    def _series(self, team_id):
+        series = self.teams.get(team_id)
+        if series is None:
+            series = self.teams[team_id] = {
+                name: BucketSeries(width, self.minute_buckets if name == "minute" else None)
+                for name, width in RESOLUTIONS
+            }
+        return series
+
+    def sync(self, fetch_votes):
+        """fetch_votes(after_id) 按 id 升序产出 (id, 战队, 投入 wei, Unix 时间戳) 行, 全部并入后推进水位
+
+        返回并入的投票数.
+        """
+        with self._lock:
+            last_id = self.last_vote_id or 0
+            minutes = {}  # (战队, 分钟起点) -> [投票数, gwei]
+            first, latest = self.first_timestamp, self.latest_timestamp
+            for vote_id, team_id, amount_wei, timestamp in fetch_votes(last_id):
+                last_id = vote_id
+                if timestamp is None:
+                    continue
+                key = (team_id, timestamp - timestamp % 60)
+                bucket = minutes.get(key)
+                if bucket is None:
+                    bucket = minutes[key] = [0, 0]
+                bucket[0] += 1
+                bucket[1] += amount_wei // GWEI
+                if first is None or timestamp < first:
+                    first = timestamp
+                if latest is None or timestamp > latest:
+                    latest = timestamp
+            # 按首次出现的顺序写入, 与逐条写入时分钟窗口的移出结果相同
+            for (team_id, minute), (count, gwei) in minutes.items():
+                for series in self._series(team_id).values():
+                    series.add(minute, count, gwei)
+            self.first_timestamp, self.latest_timestamp = first, latest
+            self.last_vote_id = last_id
+            return sum(count for count, _ in minutes.values())
+
+    def minute_floor(self):
+        """分钟序列仍保留的最早时间"""
+        if self.latest_timestamp is None:
+            return None
+        return (self.latest_timestamp // 60 - self.minute_buckets + 1) * 60
+
+    def query(self, start, end, points, resolution=None, team_ids=None):
+        """[start, end] 区间的序列, 桶数不超过 points
+
+        resolution 为 None 时选择能在 points 个桶内覆盖区间的最细粒度 (分钟粒度只在
+        区间落在保留窗口内时可选); 桶仍然过多时把相邻的桶合并.
+        """
+        with self._lock:
+            if resolution is None:
+                candidates = [
+                    (name, width) for name, width in RESOLUTIONS
+                    if name != "minute" or (self.minute_floor() is not None and start >= self.minute_floor())
+                ]
+                name, width = next(
+                    ((n, w) for n, w in candidates if end // w - start // w + 1 <= points), candidates[-1]
+                )
+            else:
+                name, width = resolution, dict(RESOLUTIONS)[resolution]
+                if name == "minute" and self.minute_floor() is not None:
+                    start = max(start, self.minute_floor())
+            first, last = start // width, end // width
+            # 合并前要按桶展开, 过长的区间从起点开始截断 (例如最后一笔投票很早而 end 是现在)
+            last = min(last, first + (self.minute_buckets if name == "minute" else MAX_QUERY_BUCKETS) - 1)
+            group = max(1, math.ceil((last - first + 1) / points))
+
+            teams = []
+            for team_id in sorted(self.teams if team_ids is None else team_ids):
+                series = self.teams.get(team_id)
+                if series is None:
+                    counts, stakes, before = [0] * (last - first + 1), [0] * (last - first + 1), 0
+                else:
+                    counts, stakes, before = series[name].window(first, last)
+                counts = [sum(counts[i:i + group]) for i in range(0, len(counts), group)]
+                stakes = [sum(stakes[i:i + group]) for i in range(0, len(stakes), group)]
+                cumulative, total = [], before
+                for gwei in stakes:
+                    total += gwei
+                    cumulative.append(total)
+                teams.append({"team_id": team_id, "vote_counts": counts, "stakes_gwei": stakes,
+                              "cumulative_gwei": cumulative})
+            return {
+                "resolution": name,
+                "bucket_seconds": width * group,
+                "timestamps": [(first + i) * width for i in range(0, last - first + 1, group)],
+                "teams": teams,
+            }
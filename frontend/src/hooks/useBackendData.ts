@@ -1,4 +1,5 @@
-import { useQuery } from "@tanstack/react-query";
+import { useEffect, useSyncExternalStore } from "react";
+import { useQuery, useQueryClient } from "@tanstack/react-query";
 import { useReadContract } from "wagmi";
 import axios from "axios";
 
@@ -46,6 +47,13 @@ export interface TeamData {
 export interface StatsData {
   total_unique_participants: number;
   total_votes: number;
+  team_totals: {
+    team_id: number;
+    total_votes: number;
+    total_amount_eth: number;
+  }[];
+  eth_price_usd: number;
+  eth_price_source: string;
   total_prize_pool_eth: number;
   weapon_equivalents: {
     name: string;
@@ -57,21 +65,83 @@ export interface StatsData {
   }[];
 }
 
+// 后端 SSE 推送 (/api/stream): 连接正常时由推送直接写入 React Query 缓存,
+// 断开时各查询回退到定时轮询
+// SSE 事件名 -> React Query 的 queryKey
+const STREAM_EVENTS = {
+  teams: "teams",
+  status: "status",
+  stats: "stats",
+  eth_price: "ethPrice",
+} as const;
+const POLL_INTERVAL = 5000;
+
+let streamConnected = false;
+const streamListeners = new Set<() => void>();
+
+function setStreamConnected(connected: boolean) {
+  if (streamConnected === connected) return;
+  streamConnected = connected;
+  streamListeners.forEach((listener) => listener());
+}
+
+function subscribeStreamStatus(listener: () => void) {
+  streamListeners.add(listener);
+  return () => streamListeners.delete(listener);
+}
+
+function usePollInterval() {
+  const connected = useSyncExternalStore(
+    subscribeStreamStatus,
+    () => streamConnected,
+    () => false
+  );
+  return connected ? false : POLL_INTERVAL;
+}
+
+// 在 QueryClientProvider 内挂载一次
+export function BackendStream() {
+  const queryClient = useQueryClient();
+
+  useEffect(() => {
+    const source = new EventSource(`${API_BASE_URL}/stream`);
+    for (const [event, queryKey] of Object.entries(STREAM_EVENTS)) {
+      source.addEventListener(event, (e) => {
+        queryClient.setQueryData(
+          [queryKey],
+          JSON.parse((e as MessageEvent).data)
+        );
+      });
+    }
+    source.onopen = () => setStreamConnected(true);
+    source.onerror = () => setStreamConnected(false); // EventSource 会自动重连
+    return () => {
+      source.close();
+      setStreamConnected(false);
+    };
+  }, [queryClient]);
+
+  return null;
+}
+
 // The LeaderboardData interface and useLeaderboard hook have been removed
 // as they are not used in the new backend version.
 
 export function useStats() {
+  const refetchInterval = usePollInterval();
   return useQuery<StatsData>({
     queryKey: ["stats"],
     queryFn: async () => {
       const response = await axios.get(`${API_BASE_URL}/stats`);
       return response.data;
     },
-    refetchInterval: 5000,
+    refetchInterval,
   });
 }
 
 export function useStatus() {
+  const refetchInterval = usePollInterval();
+
   // 从合约获取状态
   const { data: contractStatus, isLoading: contractLoading } = useReadContract({
     address: CONTRACT_ADDRESS,
@@ -94,7 +164,7 @@ export function useStatus() {
       const response = await axios.get(`${API_BASE_URL}/status`);
       return response.data;
     },
-    refetchInterval: 5000, // Refresh every 5 seconds
+    refetchInterval, // 推送断开时每 5 秒轮询
   });
 
   // 合并数据：优先使用合约状态
@@ -136,13 +206,14 @@ export function useStatus() {
 }
 
 export function useTeams() {
+  const refetchInterval = usePollInterval();
   return useQuery<TeamData[]>({
     queryKey: ["teams"],
     queryFn: async () => {
       const response = await axios.get(`${API_BASE_URL}/teams`);
       return response.data;
     },
-    refetchInterval: 5000,
+    refetchInterval,
   });
 }
 
@@ -151,54 +222,32 @@ export function useTeams() {
 export interface EthPriceData {
   symbol: string;
   price: string;
+  source?: string;
+  updated_at?: string | null;
+  history?: { price: number; time: string | null }[];
 }
 
 export function useEthPrice() {
+  const refetchInterval = usePollInterval();
   return useQuery<EthPriceData>({
     queryKey: ["ethPrice"],
     queryFn: async () => {
       try {
-        // 尝试从币安API获取ETH/USDT汇率
-        const response = await axios.get(
-          "https://api.binance.com/api/v3/ticker/price?symbol=ETHUSDT",
-          {
-            timeout: 5000, // 5秒超时
-          }
-        );
-        console.log("✅ ETH价格获取成功（币安API）:", response.data);
+        // 后端缓存的报价 (后台多数据源刷新, 附带来源和时间)
+        const response = await axios.get(`${API_BASE_URL}/eth_price`, {
+          timeout: 5000,
+        });
         return response.data;
-      } catch (binanceError) {
-        console.warn("币安API不可用，尝试CoinGecko API:", binanceError);
-        try {
-          // 备用：使用CoinGecko API
-          const coingeckoResponse = await axios.get(
-            "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=usd",
-            {
-              timeout: 5000, // 5秒超时
-            }
-          );
-          const price = coingeckoResponse.data.ethereum.usd;
-          console.log("ETH价格获取成功（CoinGecko API）:", price);
-          return {
-            symbol: "ETHUSD",
-            price: price.toString(),
-          };
-        } catch (coingeckoError) {
-          console.warn(
-            "CoinGecko API也不可用，使用备用汇率3000:",
-            coingeckoError
-          );
-          // 最后备用：固定汇率
-          return {
-            symbol: "ETHUSD",
-            price: "3000",
-          };
-        }
+      } catch (error) {
+        console.warn("ETH价格获取失败，使用备用汇率3000:", error);
+        return {
+          symbol: "ETHUSD",
+          price: "3000",
+        };
       }
     },
-    refetchInterval: 10000, // Refresh every 10 seconds for price data
-    retry: 1, // 减少重试次数，因为我们有备用API
-    retryDelay: (attemptIndex) => Math.min(1000 * 2 ** attemptIndex, 30000), // 指数退避
+    refetchInterval: refetchInterval === false ? false : 60000, // 推送断开时每分钟轮询, 与后端刷新间隔一致
+    retry: 1,
   });
 }
 